@@ -1,17 +1,33 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uvicorn
+import httpx
 import os
 import asyncio
-from datetime import datetime
-import sqlparse
+import functools
+import hashlib
+import orjson
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from cachetools import LRUCache, TTLCache
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, generate_latest, multiprocess
 
 from src.providers.llm_provider import OpenAIProvider, NotConfiguredLLMProvider
-from src.providers.vector_store import QdrantProvider, NotConfiguredVectorStore
-from src.providers.embeddings_provider import OpenAIEmbeddingsProvider, NotConfiguredEmbeddingsProvider
+from src.providers.vector_store import QdrantProvider, NotConfiguredVectorStore, TieredVectorStore
+from src.providers.embeddings_provider import EmbeddingBatcher, OpenAIEmbeddingsProvider, NotConfiguredEmbeddingsProvider
 from src.pipelines.sql_generation import SQLGenerationPipeline
+from src.cache.semantic_cache import SemanticCache
+from src.cache.single_flight import SingleFlight
 from src.web.v1.services.ask import AskService
 from src.web.v1.services.chart import ChartService
 from src.web.v1.services.schema import SchemaService
@@ -24,17 +40,57 @@ from src.web.v1.routers.relationship_recommendation import router as relationshi
 
 # Import Dagster components
 try:
-    from dagster import DagsterInstance, execute_job, materialize
+    from dagster import DagsterInstance, RunsFilter, execute_job, materialize
     from dagster_project.definitions import defs
     DAGSTER_AVAILABLE = True
 except ImportError:
     DAGSTER_AVAILABLE = False
     print("Warning: Dagster not available, running in compatibility mode")
 
+# With PROMETHEUS_MULTIPROC_DIR set, every uvicorn worker writes its samples to
+# that directory and /metrics aggregates them, so scrapes see one consistent series
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "hugdata_semantic_cache_lookups_total",
+    "Semantic LLM response cache lookups",
+    ["endpoint", "result"]
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize providers and services once per worker before serving requests"""
+    # Client construction can block (DNS, sockets); warm the cached providers in
+    # worker threads so startup does not stall the event loop
+    await asyncio.gather(
+        asyncio.to_thread(get_llm_provider),
+        asyncio.to_thread(get_vector_store),  # also builds the embeddings provider
+    )
+    initialize_services()
+    # Bound concurrent CPU-bound analyses so they cannot exhaust the thread pool
+    app.state.cpu_semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+    # Workflow triggers accepted but not yet materialized: provisional run id -> "queued"/"running"
+    app.state.pending_runs = {}
+    # Provisional run id -> Dagster run id once materialize returns (this worker only;
+    # other workers resolve provisional ids through the run tag instead)
+    app.state.completed_runs = TTLCache(maxsize=10000, ttl=86400)
+    # One pooled client for Laravel webhooks, reused across notifications
+    app.state.laravel_client = httpx.AsyncClient(
+        base_url=os.getenv("LARAVEL_API_URL", "http://localhost:8000/api"),
+        http2=True,
+        timeout=10,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        headers={"Authorization": f"Bearer {os.getenv('LARAVEL_API_TOKEN', '')}"}
+    )
+    yield
+    await app.state.laravel_client.aclose()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
 app = FastAPI(
     title="HugData AI Service",
     description="AI-powered SQL generation and analytics service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -44,11 +100,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compress multi-KB JSON (chart configs, SQL with reasoning, run lists)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 import logging
 logger = logging.getLogger("hugdata-ai")
 
-# Initialize providers
+# Providers are built lazily and cached, so importing this module stays cheap and
+# each uvicorn worker constructs its own clients on first use
+@functools.lru_cache(maxsize=1)
 def get_llm_provider():
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if openai_api_key:
@@ -57,46 +117,87 @@ def get_llm_provider():
         logger.error("OPENAI_API_KEY not set; LLM completions disabled.")
         return NotConfiguredLLMProvider("OPENAI_API_KEY is missing")
 
-def get_vector_store(embeddings_provider):
+@functools.lru_cache(maxsize=1)
+def get_vector_store():
     qdrant_url = os.getenv("QDRANT_URL")
     qdrant_api_key = os.getenv("QDRANT_API_KEY")
     if not qdrant_url:
         logger.error("QDRANT_URL not set; vector search/indexing disabled.")
         return NotConfiguredVectorStore("QDRANT_URL is missing")
     try:
-        return QdrantProvider(url=qdrant_url, api_key=qdrant_api_key, embeddings_provider=embeddings_provider)
+        qdrant = QdrantProvider(
+            url=qdrant_url,
+            api_key=qdrant_api_key,
+            embeddings_provider=get_embeddings_provider(),
+            # Opt-in: search collections up to this many points in memory
+            flat_index_max_points=int(os.getenv("VECTOR_FLAT_INDEX_MAX_POINTS", "0")),
+            flat_index_ttl=float(os.getenv("VECTOR_FLAT_INDEX_TTL", "300")),
+            # "int8" creates new collections with scalar-quantized vectors
+            quantization=os.getenv("VECTOR_QUANTIZATION") or None
+        )
+        # Serve repeated searches from a local tier before going over the network
+        return TieredVectorStore(
+            qdrant,
+            # Opt-in: cached searches only see writes made by this process, so with
+            # several workers or Dagster writing they can be up to the TTL stale
+            max_entries=int(os.getenv("VECTOR_SEARCH_CACHE_SIZE", "50000")),
+            ttl=float(os.getenv("VECTOR_SEARCH_CACHE_TTL", "0")),
+            # Opt-in: coalesce concurrent cache misses into batched searches
+            coalesce_wait_ms=float(os.getenv("VECTOR_SEARCH_COALESCE_WAIT_MS", "0")),
+            coalesce_max_batch=int(os.getenv("VECTOR_SEARCH_COALESCE_MAX_BATCH", "64"))
+        )
     except Exception as e:
         logger.error(f"Qdrant connection failed: {e}")
         return NotConfiguredVectorStore(str(e))
 
+@functools.lru_cache(maxsize=1)
 def get_embeddings_provider():
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if openai_api_key:
-        return OpenAIEmbeddingsProvider(openai_api_key)
+        provider = OpenAIEmbeddingsProvider(
+            openai_api_key,
+            chunk_size=int(os.getenv("EMBEDDINGS_CHUNK_SIZE", "100")),
+            max_concurrent_batches=int(os.getenv("EMBEDDINGS_MAX_CONCURRENT_BATCHES", "16")),
+            max_retries=int(os.getenv("EMBEDDINGS_MAX_RETRIES", "2"))
+        )
+        # Opt-in: coalesce concurrent document embedding requests into shared calls
+        coalesce_wait_ms = float(os.getenv("EMBEDDINGS_COALESCE_WAIT_MS", "0"))
+        if coalesce_wait_ms > 0:
+            return EmbeddingBatcher(
+                provider,
+                max_batch=int(os.getenv("EMBEDDINGS_COALESCE_MAX_BATCH", "256")),
+                max_wait_ms=coalesce_wait_ms
+            )
+        return provider
     else:
         logger.error("OPENAI_API_KEY not set; embeddings disabled.")
         return NotConfiguredEmbeddingsProvider("OPENAI_API_KEY is missing")
 
-# Global instances
-llm_provider = get_llm_provider()
-embeddings_provider = get_embeddings_provider()
-vector_store = get_vector_store(embeddings_provider)
-sql_pipeline = SQLGenerationPipeline(llm_provider, vector_store)
-
-# Initialize service container for new services
-service_container = initialize_service_container(
-    llm_provider=llm_provider,
-    vector_store=vector_store,
-    embeddings_provider=embeddings_provider
-)
-
-# Initialize WrenAI-style services
-ask_service = AskService(llm_provider, vector_store, sql_pipeline)
-chart_service = ChartService(llm_provider)
-schema_service = SchemaService(vector_store)
-set_ask_service(ask_service)
-set_chart_service(chart_service)
-set_schema_service(schema_service)
+@functools.lru_cache(maxsize=1)
+def get_sql_pipeline() -> SQLGenerationPipeline:
+    return SQLGenerationPipeline(get_llm_provider(), get_vector_store())
+
+@functools.lru_cache(maxsize=1)
+def get_schema_service() -> SchemaService:
+    return SchemaService(
+        get_vector_store(),
+        upload_batch_size=int(os.getenv("VECTOR_UPLOAD_BATCH_SIZE", "64")),
+        upload_concurrency=int(os.getenv("VECTOR_UPLOAD_CONCURRENCY", "2"))
+    )
+
+def initialize_services():
+    """Build the service container and WrenAI-style services and register them with the routers"""
+    llm_provider = get_llm_provider()
+    vector_store = get_vector_store()
+
+    initialize_service_container(
+        llm_provider=llm_provider,
+        vector_store=vector_store,
+        embeddings_provider=get_embeddings_provider()
+    )
+    set_ask_service(AskService(llm_provider, vector_store, get_sql_pipeline()))
+    set_chart_service(ChartService(llm_provider))
+    set_schema_service(get_schema_service())
 
 # Include WrenAI-style routers
 app.include_router(ask_router)
@@ -111,8 +212,13 @@ app.include_router(relationship_recommendation_router, prefix="/v1", tags=["Rela
 class NaturalLanguageQuery(BaseModel):
     query: str
     context: Dict[str, Any]
-    database_schema: Dict[str, Any]
+    # Required; optional only so a missing schema gets a 400 explaining the contract
+    database_schema: Optional[Dict[str, Any]] = None
     project_id: str
+    # Returned by /index-schema; sent alongside database_schema to skip rehashing it
+    schema_fingerprint: Optional[str] = None
+    # Bypass the response caches, e.g. for sensitive queries
+    no_cache: bool = False
     
 class SQLGenerationResponse(BaseModel):
     sql: str
@@ -145,104 +251,227 @@ class WorkflowStatusResponse(BaseModel):
     completed_at: Optional[datetime] = None
     error_message: Optional[str] = None
 
+# Identical in-flight generation requests share one pipeline call
+_sql_generation_flight = SingleFlight()
+
+# Exact replays of a generation request, checked before any embedding call
+_exact_responses: TTLCache = TTLCache(maxsize=2048, ttl=600)
+
+# Semantic cache of LLM-backed responses, namespaced by project and schema
+_response_cache = SemanticCache(
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "300"))
+)
+
+def _schema_fingerprint(schema: Optional[Dict[str, Any]]) -> str:
+    """Stable digest of a schema, used to key response caches"""
+    payload = orjson.dumps(schema or {}, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+def _resolve_schema(request: "NaturalLanguageQuery") -> Tuple[str, Dict[str, Any]]:
+    """Fingerprint and schema for a request, preferring a precomputed fingerprint.
+
+    Schemas are not stored server-side (any worker may serve the request), so
+    database_schema is always required; the fingerprint only skips rehashing it.
+    """
+    if request.database_schema is None:
+        raise HTTPException(
+            status_code=400,
+            detail="database_schema is required; schema_fingerprint only skips rehashing it"
+        )
+    fingerprint = request.schema_fingerprint or _schema_fingerprint(request.database_schema)
+    return fingerprint, request.database_schema
+
+async def _embed_for_cache(text: str) -> Optional[List[float]]:
+    """Embed text for a semantic cache lookup; None disables caching for the request"""
+    try:
+        return await get_embeddings_provider().embed_query(" ".join(text.lower().split()))
+    except Exception as e:
+        logger.debug(f"Semantic cache disabled for request: {e}")
+        return None
+
+def _record_cache_lookup(endpoint: str, hit: bool) -> None:
+    SEMANTIC_CACHE_LOOKUPS.labels(endpoint=endpoint, result="hit" if hit else "miss").inc()
+
+def _generation_key(query: str, schema_fingerprint: str, project_id: str) -> str:
+    payload = orjson.dumps([query, schema_fingerprint, project_id])
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
 # Core Endpoints
 @app.post("/generate-sql", response_model=SQLGenerationResponse)
 async def generate_sql(request: NaturalLanguageQuery):
     """Generate SQL from natural language query"""
+    fingerprint, schema = _resolve_schema(request)
+    generation_key = _generation_key(request.query, fingerprint, request.project_id)
+    if not request.no_cache:
+        cached = _exact_responses.get(generation_key)
+        if cached is not None:
+            _record_cache_lookup("generate_sql", True)
+            return cached
     try:
-        result = await sql_pipeline.generate_sql(
-            query=request.query,
-            schema=request.database_schema,
-            context=request.context,
-            project_id=request.project_id
+        cache_namespace = f"{request.project_id}:{fingerprint}"
+        embedding = None if request.no_cache else await _embed_for_cache(request.query)
+        if embedding is not None:
+            cached = _response_cache.get(cache_namespace, embedding)
+            _record_cache_lookup("generate_sql", cached is not None)
+            if cached is not None:
+                return cached
+
+        result = await _sql_generation_flight.do(
+            generation_key,
+            lambda: get_sql_pipeline().generate_sql(
+                query=request.query,
+                schema=schema,
+                context=request.context,
+                project_id=request.project_id
+            )
         )
         
-        return SQLGenerationResponse(
+        response = SQLGenerationResponse(
             sql=result["sql"],
             confidence=result["confidence"],
             explanation=result["explanation"],
             reasoning_steps=result["reasoning_steps"]
         )
+        if not request.no_cache:
+            _exact_responses[generation_key] = response
+        if embedding is not None:
+            _response_cache.put(cache_namespace, embedding, response)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-sql/stream")
+async def generate_sql_stream(request: NaturalLanguageQuery):
+    """Stream SQL generation as server-sent events; the last event carries the full result"""
+    _, schema = _resolve_schema(request)
+
+    async def event_stream():
+        try:
+            async for chunk in get_sql_pipeline().generate_sql_stream(
+                query=request.query,
+                schema=schema,
+                context=request.context,
+                project_id=request.project_id
+            ):
+                yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+        except Exception as e:
+            yield b"data: " + orjson.dumps({"type": "error", "detail": str(e)}) + b"\n\n"
+
+    # An explicit encoding keeps GZipMiddleware from buffering events inside the gzip stream
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Content-Encoding": "identity"}
+    )
+
+# Clause descriptions for /explain-query
+CLAUSE_DESCRIPTIONS = {
+    "SELECT": "Retrieves specified columns",
+    "FROM": "Reads from one or more tables",
+    "JOIN": "Combines rows from related tables",
+    "WHERE": "Filters rows based on conditions",
+    "GROUP BY": "Aggregates rows into groups",
+    "HAVING": "Filters groups after aggregation",
+    "ORDER BY": "Sorts the result set",
+    "LIMIT": "Limits number of rows returned",
+}
+# Single-pass scanners for clause keywords and the FROM target list
+CLAUSE_RE = re.compile(r"\b(SELECT|FROM|JOIN|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b", re.IGNORECASE)
+FROM_TARGETS_RE = re.compile(
+    r"\bFROM\s+(.*?)(?=\b(?:WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|UNION|ON|"
+    r"(?:NATURAL\s+|INNER\s+|CROSS\s+|(?:LEFT|RIGHT|FULL)(?:\s+OUTER)?\s+)?JOIN)\b|[;)]|$)",
+    re.IGNORECASE | re.DOTALL
+)
+_TABLE_NAME_RE = re.compile(r"[A-Za-z_][\w.]*")
+
+def _from_tables(sql: str) -> List[str]:
+    """Table names listed directly after the first FROM, without aliases"""
+    match = FROM_TARGETS_RE.search(sql)
+    if not match:
+        return []
+    # dict keys give ordered de-duplication with hash lookups
+    tables: Dict[str, None] = {}
+    for target in match.group(1).split(','):
+        name = _TABLE_NAME_RE.match(target.strip().replace('"', '').replace('`', ''))
+        if name:
+            tables[name.group(0)] = None
+    return list(tables)
+
+# Memoized analyses per SQL string; checked on the event loop so hits skip the thread hop
+_explain_cache: LRUCache = LRUCache(maxsize=4096)
+
+def _explain_sql(sql: str) -> Optional[Tuple[str, Tuple[Tuple[str, str], ...]]]:
+    """Rule-based explanation and clause breakdown of a SQL string; None if it is empty"""
+    if not sql.strip():
+        return None
+
+    explanation_parts = []
+
+    # Basic clause detection
+    present_clauses = {" ".join(m.group(1).upper().split()) for m in CLAUSE_RE.finditer(sql)}
+    breakdown = tuple(
+        (clause, description)
+        for clause, description in CLAUSE_DESCRIPTIONS.items()
+        if clause in present_clauses
+    )
+
+    # Infer tables mentioned after FROM
+    tables = _from_tables(sql)
+    if tables:
+        explanation_parts.append(f"It reads from table(s): {', '.join(tables)}")
+
+    # High-level explanation
+    if 'WHERE' in present_clauses:
+        explanation_parts.append("with filtering conditions applied")
+    if 'GROUP BY' in present_clauses:
+        explanation_parts.append("aggregating results into groups")
+    if 'ORDER BY' in present_clauses:
+        explanation_parts.append("and sorts the output")
+    if 'LIMIT' in present_clauses:
+        explanation_parts.append("with a row limit for safety")
+
+    explanation = "This query retrieves data. " + (" ".join(explanation_parts) if explanation_parts else "")
+    return explanation.strip(), breakdown
+
 @app.post("/explain-query")
 async def explain_query(sql: str, schema: Optional[Dict[str, Any]] = None):
     """Explain SQL query in natural language"""
     try:
-        # Parse SQL and build a structured explanation
-        parsed_statements = sqlparse.parse(sql)
-        if not parsed_statements:
-            raise HTTPException(status_code=400, detail="Invalid SQL provided")
-
-        stmt = parsed_statements[0]
-        tokens = list(stmt.flatten())
-
-        explanation_parts = []
-        breakdown: Dict[str, str] = {}
-
-        # Basic clause detection
-        sql_upper = sql.upper()
-        if "SELECT" in sql_upper:
-            breakdown["SELECT"] = "Retrieves specified columns"
-        if "FROM" in sql_upper:
-            breakdown["FROM"] = "Reads from one or more tables"
-        if "JOIN" in sql_upper:
-            breakdown["JOIN"] = "Combines rows from related tables"
-        if "WHERE" in sql_upper:
-            breakdown["WHERE"] = "Filters rows based on conditions"
-        if "GROUP BY" in sql_upper:
-            breakdown["GROUP BY"] = "Aggregates rows into groups"
-        if "HAVING" in sql_upper:
-            breakdown["HAVING"] = "Filters groups after aggregation"
-        if "ORDER BY" in sql_upper:
-            breakdown["ORDER BY"] = "Sorts the result set"
-        if "LIMIT" in sql_upper:
-            breakdown["LIMIT"] = "Limits number of rows returned"
-
-        # Infer tables mentioned after FROM
-        tables = []
-        in_from = False
-        for token in tokens:
-            if token.ttype is sqlparse.tokens.Keyword and token.value.upper() == 'FROM':
-                in_from = True
-                continue
-            if token.ttype is sqlparse.tokens.Keyword and token.value.upper() in ['WHERE', 'GROUP', 'ORDER', 'LIMIT', 'JOIN', 'HAVING']:
-                in_from = False
-            if in_from and token.ttype is None and token.value.strip():
-                cleaned = token.value.strip().strip(',')
-                if cleaned and cleaned not in tables:
-                    tables.append(cleaned)
-
-        if tables:
-            explanation_parts.append(f"It reads from table(s): {', '.join(tables)}")
-
-        # High-level explanation
-        if 'WHERE' in sql_upper:
-            explanation_parts.append("with filtering conditions applied")
-        if 'GROUP BY' in sql_upper:
-            explanation_parts.append("aggregating results into groups")
-        if 'ORDER BY' in sql_upper:
-            explanation_parts.append("and sorts the output")
-        if 'LIMIT' in sql_upper:
-            explanation_parts.append("with a row limit for safety")
-
-        explanation = "This query retrieves data. " + (" ".join(explanation_parts) if explanation_parts else "")
-
+        # Parse SQL and build a structured explanation (memoized per SQL string)
+        analysis = _explain_cache.get(sql)
+        if analysis is None:
+            async with app.state.cpu_semaphore:
+                analysis = await asyncio.to_thread(_explain_sql, sql)
+            if analysis is None:
+                raise HTTPException(status_code=400, detail="Invalid SQL provided")
+            _explain_cache[sql] = analysis
+
+        explanation, breakdown = analysis
         return {
-            "explanation": explanation.strip(),
-            "breakdown": breakdown
+            "explanation": explanation,
+            "breakdown": dict(breakdown)
         }
     except HTTPException:
         raise
     except Exception as e:
         # As a fallback, attempt an LLM-based explanation when available
         try:
+            embedding = await _embed_for_cache(sql)
+            if embedding is not None:
+                cached = _response_cache.get("explain-query", embedding)
+                _record_cache_lookup("explain_query", cached is not None)
+                if cached is not None:
+                    return cached
+
             prompt = f"Explain the following SQL query in simple terms and provide a short breakdown by clause as JSON with keys explanation and breakdown: \n\n{sql}"
-            response_text = await llm_provider.generate(prompt=prompt, max_tokens=300, temperature=0.1)
+            response_text = await get_llm_provider().generate(prompt=prompt, max_tokens=300, temperature=0.1)
             # Attempt to parse JSON directly
-            import json
-            return json.loads(response_text)
+            explanation = orjson.loads(response_text)
+            if embedding is not None:
+                _response_cache.put("explain-query", embedding, explanation)
+            return explanation
         except Exception:
             raise HTTPException(status_code=500, detail=str(e))
 
@@ -250,100 +479,100 @@ async def explain_query(sql: str, schema: Optional[Dict[str, Any]] = None):
 async def suggest_charts(request: ChartSuggestionRequest):
     """Suggest appropriate chart types for query results"""
     try:
-        data_sample = request.data_sample
-        query_intent = request.query_intent.lower()
-        
-        # Analyze the data structure
-        if not data_sample or len(data_sample) == 0:
-            return []
-            
-        # Get column information
-        columns = list(data_sample.keys()) if isinstance(data_sample, dict) else []
-        if len(columns) == 0:
-            return []
-        
-        suggestions = []
-        
-        # Analyze columns to determine appropriate chart types
-        numeric_columns = []
-        text_columns = []
-        date_columns = []
-        
-        for col, value in data_sample.items():
-            if isinstance(value, (int, float)) or (isinstance(value, str) and value.replace('.', '').replace('-', '').isdigit()):
-                numeric_columns.append(col)
-            elif any(date_word in col.lower() for date_word in ['date', 'time', 'created', 'updated', 'year', 'month']):
-                date_columns.append(col)
-            else:
-                text_columns.append(col)
-        
-        # Rule-based chart suggestions
-        
-        # Bar chart - good for categorical comparisons
-        if len(text_columns) >= 1 and len(numeric_columns) >= 1:
-            suggestions.append(ChartSuggestion(
-                chart_type="bar",
-                configuration={
-                    "xAxis": text_columns[0],
-                    "yAxis": numeric_columns[0],
-                    "title": f"{numeric_columns[0].replace('_', ' ').title()} by {text_columns[0].replace('_', ' ').title()}"
-                },
-                confidence=0.9 if "compare" in query_intent or "by" in query_intent else 0.7
-            ))
-        
-        # Line chart - good for trends over time or continuous data
-        if len(date_columns) >= 1 and len(numeric_columns) >= 1:
-            suggestions.append(ChartSuggestion(
-                chart_type="line",
-                configuration={
-                    "xAxis": date_columns[0],
-                    "yAxis": numeric_columns[0],
-                    "title": f"{numeric_columns[0].replace('_', ' ').title()} Over Time"
-                },
-                confidence=0.9 if any(word in query_intent for word in ["trend", "over time", "growth", "change"]) else 0.8
-            ))
-        elif len(numeric_columns) >= 2:
-            suggestions.append(ChartSuggestion(
-                chart_type="line",
-                configuration={
-                    "xAxis": numeric_columns[0],
-                    "yAxis": numeric_columns[1],
-                    "title": f"{numeric_columns[1].replace('_', ' ').title()} vs {numeric_columns[0].replace('_', ' ').title()}"
-                },
-                confidence=0.7
-            ))
-        
-        # Pie chart - good for parts of a whole
-        if len(text_columns) >= 1 and len(numeric_columns) >= 1:
-            suggestions.append(ChartSuggestion(
-                chart_type="pie",
-                configuration={
-                    "xAxis": text_columns[0],
-                    "yAxis": numeric_columns[0],
-                    "title": f"{numeric_columns[0].replace('_', ' ').title()} Distribution"
-                },
-                confidence=0.8 if any(word in query_intent for word in ["distribution", "share", "percentage", "proportion"]) else 0.6
-            ))
-        
-        # Doughnut chart - alternative to pie chart
-        if len(text_columns) >= 1 and len(numeric_columns) >= 1:
-            suggestions.append(ChartSuggestion(
-                chart_type="doughnut",
-                configuration={
-                    "xAxis": text_columns[0],
-                    "yAxis": numeric_columns[0],
-                    "title": f"{numeric_columns[0].replace('_', ' ').title()} Breakdown"
-                },
-                confidence=0.7 if "breakdown" in query_intent else 0.5
-            ))
-        
-        # Sort by confidence and return top suggestions
-        suggestions.sort(key=lambda x: x.confidence, reverse=True)
-        return suggestions[:3]  # Return top 3 suggestions
-        
+        # Column analysis is CPU-bound; keep it off the event loop
+        return await asyncio.to_thread(
+            _compute_chart_suggestions,
+            request.data_sample,
+            request.query_intent.lower()
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Query-intent vocabulary, matched against the tokenized intent by set membership
+_INTENT_TOKEN_RE = re.compile(r"[a-z]+")
+_OVER_TIME_RE = re.compile(r"\bover\s+time\b")
+_COMPARE_WORDS = frozenset({"compare", "compared", "comparing", "comparison", "by"})
+_TREND_WORDS = frozenset({"trend", "trends", "growth", "change", "changes"})
+_DISTRIBUTION_WORDS = frozenset({
+    "distribution", "share", "shares", "percentage", "percentages", "proportion", "proportions"
+})
+# Matched as a phrase and added to the intent tokens
+_OVER_TIME_TOKEN = "over time"
+
+# (chart type, x axis (column kind, index), y axis (column kind, index), title format,
+#  boost words, confidence when an intent word matches, base confidence)
+CHART_RULES = (
+    # Bar chart - good for categorical comparisons
+    ("bar", ("text", 0), ("numeric", 0), "{y} by {x}", _COMPARE_WORDS, 0.9, 0.7),
+    # Line chart - good for trends over time, else one measure against another
+    ("line", ("date", 0), ("numeric", 0), "{y} Over Time", _TREND_WORDS | {_OVER_TIME_TOKEN}, 0.9, 0.8),
+    ("line", ("numeric", 0), ("numeric", 1), "{y} vs {x}", frozenset(), 0.7, 0.7),
+    # Pie chart - good for parts of a whole
+    ("pie", ("text", 0), ("numeric", 0), "{y} Distribution", _DISTRIBUTION_WORDS, 0.8, 0.6),
+    # Doughnut chart - alternative to pie chart
+    ("doughnut", ("text", 0), ("numeric", 0), "{y} Breakdown", frozenset({"breakdown"}), 0.7, 0.5),
+)
+
+_DATE_COLUMN_RE = re.compile(r"date|time|created|updated|year|month", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def _title(column: str) -> str:
+    """Human-readable title for a column name, e.g. total_sales -> Total Sales"""
+    return column.replace('_', ' ').title()
+
+def _compute_chart_suggestions(data_sample: Dict[str, Any], query_intent: str) -> List[ChartSuggestion]:
+    """Rule-based chart suggestions for a data sample and lower-cased query intent"""
+    # Analyze the data structure
+    if not data_sample or len(data_sample) == 0:
+        return []
+    
+    intent_tokens = frozenset(_INTENT_TOKEN_RE.findall(query_intent))
+    if _OVER_TIME_RE.search(query_intent):
+        intent_tokens |= {_OVER_TIME_TOKEN}
+    
+    # Get column information
+    columns = list(data_sample.keys()) if isinstance(data_sample, dict) else []
+    if len(columns) == 0:
+        return []
+    
+    suggestions = []
+    
+    # Analyze columns to determine appropriate chart types: values that coerce
+    # to numbers (including numeric strings) are numeric, then date-like names
+    import pandas as pd  # imported on first use; it is the heaviest import in the service
+    frame = pd.DataFrame([data_sample])
+    numeric_mask = frame.apply(pd.to_numeric, errors="coerce").notna().iloc[0]
+    numeric_columns = frame.columns[numeric_mask.to_numpy()].tolist()
+    date_columns = []
+    text_columns = []
+    for col in frame.columns[~numeric_mask.to_numpy()]:
+        (date_columns if _DATE_COLUMN_RE.search(col) else text_columns).append(col)
+    
+    # Rule-based chart suggestions; the first applicable rule per chart type wins
+    columns_by_kind = {"text": text_columns, "numeric": numeric_columns, "date": date_columns}
+    emitted = set()
+    for chart_type, (x_kind, x_index), (y_kind, y_index), title_fmt, boost_words, boosted, base in CHART_RULES:
+        if chart_type in emitted:
+            continue
+        x_columns, y_columns = columns_by_kind[x_kind], columns_by_kind[y_kind]
+        if len(x_columns) <= x_index or len(y_columns) <= y_index:
+            continue
+        x, y = x_columns[x_index], y_columns[y_index]
+        suggestions.append(ChartSuggestion(
+            chart_type=chart_type,
+            configuration={
+                "xAxis": x,
+                "yAxis": y,
+                "title": title_fmt.format(x=_title(x), y=_title(y))
+            },
+            confidence=base if boost_words.isdisjoint(intent_tokens) else boosted
+        ))
+        emitted.add(chart_type)
+    
+    # Sort by confidence and return top suggestions
+    suggestions.sort(key=lambda x: x.confidence, reverse=True)
+    return suggestions[:3]  # Return top 3 suggestions
+
 @app.post("/index-schema")
 async def index_schema(schema: Optional[Dict[str, Any]] = None, project_id: Optional[str] = None):
     """Index database schema for semantic search"""
@@ -352,104 +581,116 @@ async def index_schema(schema: Optional[Dict[str, Any]] = None, project_id: Opti
         if not project_id or not schema:
             raise HTTPException(status_code=500, detail="Missing project_id or schema")
 
-        result = await schema_service.index_schema(
+        result = await get_schema_service().index_schema(
             project_id=project_id,
             data_source_config={},
             schema_data=schema
         )
+        result["schema_fingerprint"] = _schema_fingerprint(schema)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Dagster workflow endpoints
-@app.post("/dagster/trigger")
-async def trigger_dagster_workflow(request: WorkflowTriggerRequest):
-    """Trigger Dagster workflow execution"""
+@functools.lru_cache(maxsize=1)
+def get_workflow_assets() -> Dict[str, List[Any]]:
+    """Assets materialized per workflow type, resolved from the asset graph once"""
+    asset_graph = defs.get_asset_graph()
+    return {
+        "schema_ingestion": [asset_graph.get("database_schema")],
+        "query_generation": [asset_graph.get("sql_query_asset")],
+        "full_pipeline": list(asset_graph.assets),
+    }
+
+@app.post("/dagster/trigger", status_code=202)
+async def trigger_dagster_workflow(request: WorkflowTriggerRequest, bg: BackgroundTasks):
+    """Queue Dagster workflow execution; Laravel is notified when the run finishes"""
     if not DAGSTER_AVAILABLE:
         raise HTTPException(status_code=503, detail="Dagster not available")
-    
+    assets = get_workflow_assets().get(request.workflow_type)
+    if assets is None:
+        raise HTTPException(status_code=400, detail=f"Unknown workflow type: {request.workflow_type}")
+
+    run_id = uuid.uuid4().hex
+    app.state.pending_runs[run_id] = "queued"
+    bg.add_task(_run_materialize, request, assets, run_id)
+
+    return {
+        "run_id": run_id,
+        "status": "queued",
+        "workflow_type": request.workflow_type
+    }
+
+# Dagster run tag carrying the provisional id returned by /dagster/trigger
+PROVISIONAL_RUN_ID_TAG = "hugdata/provisional_run_id"
+
+def _materialize_workflow(request: WorkflowTriggerRequest, assets: List[Any], run_id: str):
+    """Run the workflow's assets synchronously (Dagster's materialize blocks)"""
+    return materialize(
+        assets,
+        instance=DagsterInstance.get(),
+        tags={**(request.tags or {}), PROVISIONAL_RUN_ID_TAG: run_id},
+        run_config=_build_dagster_run_config(request)
+    )
+
+async def _run_materialize(request: WorkflowTriggerRequest, assets: List[Any], run_id: str):
+    """Background task: materialize off the event loop, then report to Laravel"""
+    app.state.pending_runs[run_id] = "running"
     try:
-        # Get Dagster instance
-        instance = DagsterInstance.get()
-        
-        # Build run configuration
-        run_config = _build_dagster_run_config(request)
-        
-        # Execute based on workflow type
-        if request.workflow_type == "schema_ingestion":
-            result = materialize(
-                [defs.get_asset_graph().get("database_schema")],
-                instance=instance,
-                tags=request.tags or {},
-                run_config=run_config
-            )
-        elif request.workflow_type == "query_generation":
-            result = materialize(
-                [defs.get_asset_graph().get("sql_query_asset")],
-                instance=instance,
-                tags=request.tags or {},
-                run_config=run_config
-            )
-        elif request.workflow_type == "full_pipeline":
-            result = materialize(
-                list(defs.get_asset_graph().assets),
-                instance=instance,
-                tags=request.tags or {},
-                run_config=run_config
-            )
-        else:
-            raise HTTPException(status_code=400, detail=f"Unknown workflow type: {request.workflow_type}")
-        
-        # Update Laravel via webhook
+        result = await asyncio.to_thread(_materialize_workflow, request, assets, run_id)
+        app.state.completed_runs[run_id] = result.run_id
         await _notify_laravel_workflow_started(request.workflow_run_id, result.run_id)
-        
-        return {
-            "run_id": result.run_id,
-            "status": "started",
-            "workflow_type": request.workflow_type
-        }
-        
     except Exception as e:
         await _notify_laravel_workflow_failed(request.workflow_run_id, str(e))
-        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        app.state.pending_runs.pop(run_id, None)
 
 @app.get("/dagster/status/{run_id}")
 async def get_workflow_status(run_id: str):
     """Get Dagster workflow execution status"""
     if not DAGSTER_AVAILABLE:
         raise HTTPException(status_code=503, detail="Dagster not available")
+    pending_status = app.state.pending_runs.get(run_id)
+    if pending_status is not None:
+        return WorkflowStatusResponse(run_id=run_id, status=pending_status)
     
     try:
-        instance = DagsterInstance.get()
-        run = instance.get_run_by_id(run_id)
-        
-        if not run:
-            raise HTTPException(status_code=404, detail="Run not found")
-        
-        return WorkflowStatusResponse(
-            run_id=run_id,
-            status=run.status.value,
-            started_at=run.start_time,
-            completed_at=run.end_time,
-            error_message=None  # TODO: Extract from run if available
+        run = await asyncio.to_thread(
+            _find_dagster_run, DagsterInstance.get(), app.state.completed_runs.get(run_id, run_id), run_id
         )
-        
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    
+    return WorkflowStatusResponse(
+        run_id=run_id,
+        status=run.status.value,
+        started_at=run.start_time,
+        completed_at=run.end_time,
+        error_message=None  # TODO: Extract from run if available
+    )
+
+def _find_dagster_run(instance: Any, dagster_run_id: str, provisional_run_id: str):
+    """Look a run up by Dagster id, falling back to the provisional id tag (works across workers)"""
+    run = instance.get_run_by_id(dagster_run_id)
+    if run is None:
+        runs = instance.get_runs(filters=RunsFilter(tags={PROVISIONAL_RUN_ID_TAG: provisional_run_id}), limit=1)
+        run = runs[0] if runs else None
+    return run
 
 @app.get("/dagster/runs")
-async def list_workflow_runs(project_id: Optional[str] = None, limit: int = 10):
+async def list_workflow_runs(project_id: Optional[str] = None, limit: int = Query(10, ge=1, le=100)):
     """List recent workflow runs"""
     if not DAGSTER_AVAILABLE:
         raise HTTPException(status_code=503, detail="Dagster not available")
     
     try:
         instance = DagsterInstance.get()
-        runs = instance.get_runs(limit=limit)
-        
-        # Filter by project if specified
-        if project_id:
-            runs = [run for run in runs if run.tags.get("project_id") == project_id]
+        # Filter by project inside the Dagster run storage so `limit` applies to matching runs
+        runs_filter = RunsFilter(tags={"project_id": project_id}) if project_id else None
+        runs = await asyncio.to_thread(instance.get_runs, filters=runs_filter, limit=limit)
         
         return [
             WorkflowStatusResponse(
@@ -496,59 +737,95 @@ def _build_dagster_run_config(request: WorkflowTriggerRequest) -> Dict[str, Any]
 
 async def _notify_laravel_workflow_started(workflow_run_id: int, dagster_run_id: str):
     """Notify Laravel that workflow started"""
-    import httpx
-    
     try:
-        laravel_url = os.getenv("LARAVEL_API_URL", "http://localhost:8000/api")
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"{laravel_url}/workflows/{workflow_run_id}/started",
-                json={"dagster_run_id": dagster_run_id},
-                headers={"Authorization": f"Bearer {os.getenv('LARAVEL_API_TOKEN', '')}"},
-                timeout=10
-            )
+        await app.state.laravel_client.post(
+            f"/workflows/{workflow_run_id}/started",
+            json={"dagster_run_id": dagster_run_id}
+        )
     except Exception as e:
         print(f"Failed to notify Laravel of workflow start: {e}")
 
 async def _notify_laravel_workflow_failed(workflow_run_id: int, error_message: str):
     """Notify Laravel that workflow failed"""
-    import httpx
-    
     try:
-        laravel_url = os.getenv("LARAVEL_API_URL", "http://localhost:8000/api")
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"{laravel_url}/workflows/{workflow_run_id}/failed",
-                json={"error_message": error_message},
-                headers={"Authorization": f"Bearer {os.getenv('LARAVEL_API_TOKEN', '')}"},
-                timeout=10
-            )
+        await app.state.laravel_client.post(
+            f"/workflows/{workflow_run_id}/failed",
+            json={"error_message": error_message}
+        )
     except Exception as e:
         print(f"Failed to notify Laravel of workflow failure: {e}")
 
+def _metrics_payload() -> bytes:
+    """Exposition for all workers in multiprocess mode, else for this process"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    # Multiprocess collection reads every worker's sample files
+    return Response(await asyncio.to_thread(_metrics_payload), media_type=CONTENT_TYPE_LATEST)
+
+@dataclass
+class HealthCache:
+    """Last result of the network-bound health checks"""
+    checked_at: float = float("-inf")
+    vector_store_ok: bool = False
+    vector_store_error: Optional[str] = None
+
+# Liveness probes reuse the vector store check result for a few seconds
+HEALTH_CACHE_TTL = 5.0
+_health_cache = HealthCache()
+
+async def _check_vector_store(vector_store) -> Tuple[bool, Optional[str]]:
+    try:
+        # Try a lightweight call; collection existence will return False or raise on connectivity issues
+        await asyncio.wait_for(vector_store.collection_exists("health_check"), timeout=1.0)
+        return True, None
+    except asyncio.TimeoutError:
+        return False, "Vector store health check timed out"
+    except Exception as e:
+        return False, str(e)
+
+# ISO-8601 UTC timestamp of the current second, reformatted at most once per second
+_TS_CACHE = {"sec": 0, "val": ""}
+
+def _utc_timestamp() -> str:
+    sec = int(time.time())
+    if sec != _TS_CACHE["sec"]:
+        _TS_CACHE["val"] = datetime.fromtimestamp(sec, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+        _TS_CACHE["sec"] = sec
+    return _TS_CACHE["val"]
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     # Configuration/Dependency diagnostics
-    llm_configured = llm_provider.__class__.__name__ != "NotConfiguredLLMProvider"
-    embeddings_configured = embeddings_provider.__class__.__name__ != "NotConfiguredEmbeddingsProvider"
+    vector_store = get_vector_store()
+    llm_configured = get_llm_provider().__class__.__name__ != "NotConfiguredLLMProvider"
+    embeddings_configured = get_embeddings_provider().__class__.__name__ != "NotConfiguredEmbeddingsProvider"
     vector_store_configured = vector_store.__class__.__name__ not in ("NotConfiguredVectorStore",)
 
     vector_store_ok = False
     vector_store_error = None
     if vector_store_configured:
-        try:
-            # Try a lightweight call; collection existence will return False or raise on connectivity issues
-            _ = await vector_store.collection_exists("health_check")
-            vector_store_ok = True
-        except Exception as e:
-            vector_store_error = str(e)
+        now = time.monotonic()
+        if now - _health_cache.checked_at >= HEALTH_CACHE_TTL:
+            ok, error = await _check_vector_store(vector_store)
+            _health_cache.checked_at = now
+            _health_cache.vector_store_ok = ok
+            _health_cache.vector_store_error = error
+        vector_store_ok = _health_cache.vector_store_ok
+        vector_store_error = _health_cache.vector_store_error
 
     return {
         "status": "healthy",
         "service": "hugdata-ai",
         "dagster_available": DAGSTER_AVAILABLE,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "timestamp": _utc_timestamp(),
         "version": app.version,
         "checks": {
             "llm_configured": llm_configured,
@@ -560,4 +837,18 @@ async def health_check():
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    # Workers inherit the metrics directory; clear samples left by a previous run
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "hugdata_prometheus")
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    # Providers are built per worker in the lifespan, so forking workers is safe
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8001,
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="uvloop",
+        http="httptools"
+    )
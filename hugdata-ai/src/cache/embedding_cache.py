@@ -0,0 +1,36 @@
+import hashlib
+from typing import Optional, Sequence
+
+from cachetools import LRUCache
+
+
+class EmbeddingCache:
+    """
+    In-memory LRU of document embeddings keyed by content
+
+    Keys hash the embedding model name together with the text, so switching
+    models never serves a vector from another embedding space.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self._entries: LRUCache = LRUCache(maxsize=max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, content: str) -> str:
+        return hashlib.sha256(f"{model}\0{content}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Sequence[float]]:
+        vector = self._entries.get(key)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def set(self, key: str, vector: Sequence[float]) -> None:
+        self._entries[key] = vector
+
+    def __len__(self) -> int:
+        return len(self._entries)
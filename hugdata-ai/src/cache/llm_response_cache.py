@@ -0,0 +1,43 @@
+import hashlib
+from typing import Optional
+
+from cachetools import TTLCache
+
+from src.providers.llm_provider import LLMProvider
+
+
+class LLMResponseCache:
+    """
+    TTL cache of LLM completions for near-deterministic prompts
+
+    Keys hash the model, sampling parameters and prompt. Calls sampled above
+    `max_temperature` bypass the cache, since their outputs are meant to vary.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, max_temperature: float = 0.3):
+        self._entries: TTLCache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        return hashlib.sha256(f"{model}\0{max_tokens}\0{temperature}\0{prompt}".encode()).hexdigest()
+
+    async def generate(self, llm: LLMProvider, prompt: str, max_tokens: int = 1000, temperature: float = 0.1) -> str:
+        if temperature > self.max_temperature:
+            return await llm.generate(prompt=prompt, max_tokens=max_tokens, temperature=temperature)
+
+        key = self.key(getattr(llm, "model", type(llm).__name__), prompt, max_tokens, temperature)
+        cached: Optional[str] = self._entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        response = await llm.generate(prompt=prompt, max_tokens=max_tokens, temperature=temperature)
+        self._entries[key] = response
+        return response
+
+    def __len__(self) -> int:
+        return len(self._entries)
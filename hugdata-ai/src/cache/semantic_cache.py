@@ -0,0 +1,134 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("hugdata-ai")
+
+
+def quantize_int8(vector: Sequence[float]) -> Tuple[np.ndarray, float]:
+    """
+    Quantize a vector to int8 with a symmetric per-vector scale
+
+    Returns:
+        (codes, scale) such that vector ≈ codes * scale
+    """
+    v = np.asarray(vector, dtype=np.float32)
+    max_abs = float(np.max(np.abs(v))) if v.size else 0.0
+    if max_abs == 0.0:
+        return np.zeros(v.shape, dtype=np.int8), 1.0
+    scale = max_abs / 127.0
+    codes = np.clip(np.rint(v / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+def dequantize_int8(codes: np.ndarray, scale: float) -> np.ndarray:
+    """Reconstruct an approximate float32 vector from int8 codes"""
+    return codes.astype(np.float32) * np.float32(scale)
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
+
+
+@dataclass
+class _Namespace:
+    """Quantized embeddings and values cached for a single namespace"""
+    codes: np.ndarray
+    scales: np.ndarray
+    last_used: np.ndarray
+    expires_at: np.ndarray
+    values: List[Any] = field(default_factory=list)
+
+
+class SemanticCache:
+    """
+    In-memory semantic cache keyed by embedding similarity
+
+    Embeddings are L2-normalized and stored as int8 codes with a per-vector
+    scale, so a lookup is a single int8 matrix-vector product rescaled to
+    cosine similarity. Entries are partitioned by namespace (e.g. project_id),
+    may carry a TTL, and the least recently used entry is evicted once a
+    namespace is full.
+    """
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.92, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, namespace: str, embedding: Sequence[float], threshold: Optional[float] = None) -> Optional[Any]:
+        """Return the value of the most similar cached entry if it meets the threshold"""
+        ns = self._namespaces.get(namespace)
+        if ns is None or not ns.values:
+            self.misses += 1
+            return None
+
+        codes, scale = quantize_int8(_normalize(embedding))
+        # int8 x int8 accumulated in int32, then rescaled to a cosine similarity
+        scores = (ns.codes @ codes.astype(np.int32)) * (ns.scales * scale)
+        scores[ns.expires_at <= time.monotonic()] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < (self.threshold if threshold is None else threshold):
+            self.misses += 1
+            return None
+
+        ns.last_used[best] = self._next_tick()
+        self.hits += 1
+        return ns.values[best]
+
+    def put(self, namespace: str, embedding: Sequence[float], value: Any, ttl: Optional[float] = None) -> None:
+        """Cache a value under the given embedding, evicting the LRU entry when full"""
+        codes, scale = quantize_int8(_normalize(embedding))
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else np.inf
+        ns = self._namespaces.get(namespace)
+
+        if ns is None:
+            self._namespaces[namespace] = _Namespace(
+                codes=codes[np.newaxis, :],
+                scales=np.array([scale], dtype=np.float32),
+                last_used=np.array([self._next_tick()], dtype=np.int64),
+                expires_at=np.array([expires_at], dtype=np.float64),
+                values=[value],
+            )
+            return
+
+        if len(ns.values) < self.max_entries:
+            ns.codes = np.vstack([ns.codes, codes])
+            ns.scales = np.append(ns.scales, np.float32(scale))
+            ns.last_used = np.append(ns.last_used, self._next_tick())
+            ns.expires_at = np.append(ns.expires_at, expires_at)
+            ns.values.append(value)
+            return
+
+        # Reuse an expired slot before evicting the least recently used entry
+        expired = np.flatnonzero(ns.expires_at <= time.monotonic())
+        slot = int(expired[0]) if expired.size else int(np.argmin(ns.last_used))
+        ns.codes[slot] = codes
+        ns.scales[slot] = scale
+        ns.last_used[slot] = self._next_tick()
+        ns.expires_at[slot] = expires_at
+        ns.values[slot] = value
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Drop all entries, or only those of one namespace"""
+        if namespace is None:
+            self._namespaces.clear()
+        else:
+            self._namespaces.pop(namespace, None)
+
+    def __len__(self) -> int:
+        return sum(len(ns.values) for ns in self._namespaces.values())
+
+    def _next_tick(self) -> int:
+        self._tick += 1
+        return self._tick
@@ -1,10 +1,19 @@
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import asyncio
-from src.providers.vector_store import VectorStore
+import uuid
+from itertools import chain
+from src.providers.vector_store import VectorStore, add_documents_in_batches, schema_collection, sync_documents
 
 logger = logging.getLogger("hugdata-ai")
 
+_DOCUMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "hugdata-ai/schema")
+
+
+def _document_id(*key: Any) -> str:
+    """Stable point id for a schema element, so re-indexing updates it in place"""
+    return str(uuid.uuid5(_DOCUMENT_ID_NAMESPACE, "\x1f".join(str(part) for part in key)))
+
 
 class SchemaIndexingPipeline:
     """
@@ -12,8 +21,15 @@ class SchemaIndexingPipeline:
     Similar to WrenAI's table_description_indexing and sql_tables_extraction
     """
 
-    def __init__(self, vector_store: VectorStore):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        upload_batch_size: int = 64,
+        upload_concurrency: int = 2
+    ):
         self.vector_store = vector_store
+        self.upload_batch_size = upload_batch_size
+        self.upload_concurrency = upload_concurrency
 
     async def index_database_schema(
         self,
@@ -24,36 +40,40 @@ class SchemaIndexingPipeline:
         """Index database schema information for semantic search"""
 
         try:
-            # Extract and index table descriptions
-            table_docs = await self._process_table_descriptions(
-                project_id, schema_data
-            )
-
-            # Extract and index column information
-            column_docs = await self._process_table_columns(
-                project_id, schema_data
-            )
-
-            # Index relationships if available
-            relationship_docs = await self._process_relationships(
-                project_id, schema_data
+            # Build table, column and relationship documents in one pass over the
+            # schema, in a worker thread so large schemas do not stall the event loop
+            table_docs, column_docs, relationship_docs = await asyncio.to_thread(
+                self._build_all_schema_docs, project_id, schema_data
             )
 
             # Store in vector store
-            all_docs = table_docs + column_docs + relationship_docs
+            all_docs = list(chain(table_docs, column_docs, relationship_docs))
 
+            # Only new or changed descriptions are (re-)embedded; removed elements are deleted
+            sync_counts = {"written": 0, "unchanged": 0}
             if all_docs:
-                await self.vector_store.add_documents(
-                    collection_name=f"schema_{project_id}",
-                    documents=all_docs,
-                )
+                collection_name = schema_collection(project_id)
+
+                async def store(changed: List[Dict[str, Any]]) -> None:
+                    await add_documents_in_batches(
+                        self.vector_store,
+                        collection_name,
+                        changed,
+                        batch_size=self.upload_batch_size,
+                        concurrency=self.upload_concurrency,
+                        create_if_missing=True
+                    )
+
+                sync_counts = await sync_documents(self.vector_store, collection_name, all_docs, store)
 
             return {
                 "status": "success",
                 "indexed_tables": len(table_docs),
                 "indexed_columns": len(column_docs),
                 "indexed_relationships": len(relationship_docs),
-                "total_documents": len(all_docs)
+                "total_documents": len(all_docs),
+                "embedded_documents": sync_counts["written"],
+                "unchanged_documents": sync_counts["unchanged"]
             }
 
         except Exception as e:
@@ -66,101 +86,72 @@ class SchemaIndexingPipeline:
                 "indexed_relationships": 0
             }
 
-    async def _process_table_descriptions(
+    def _build_all_schema_docs(
         self,
         project_id: str,
         schema_data: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        """Process table descriptions for indexing"""
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Build table description, column and relationship documents for indexing"""
 
         table_docs = []
-        tables = schema_data.get("tables", {})
+        column_docs = []
 
-        for table_name, table_info in tables.items():
-            # Generate table description document
-            description = self._generate_table_description(table_name, table_info)
+        for table_name, table_info in schema_data.get("tables", {}).items():
+            columns = table_info.get("columns", [])
 
-            doc = {
-                "content": description,
+            table_docs.append({
+                "id": _document_id(project_id, "table", table_name),
+                "content": self._generate_table_description(table_name, table_info),
                 "metadata": {
                     "type": "table_description",
                     "project_id": project_id,
                     "table_name": table_name,
-                    "column_count": len(table_info.get("columns", [])),
+                    "column_count": len(columns),
                     "table_type": table_info.get("type", "table")
                 }
-            }
-            table_docs.append(doc)
-
-        return table_docs
-
-    async def _process_table_columns(
-        self,
-        project_id: str,
-        schema_data: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        """Process individual column information for indexing"""
-
-        column_docs = []
-        tables = schema_data.get("tables", {})
-
-        for table_name, table_info in tables.items():
-            columns = table_info.get("columns", [])
-
-            for column in columns:
-                if isinstance(column, dict):
-                    col_name = column.get("name", "")
-                    col_type = column.get("type", "")
-                    col_description = column.get("description", "")
-
-                    # Generate column description
-                    description = self._generate_column_description(
-                        table_name, col_name, col_type, col_description
-                    )
-
-                    doc = {
-                        "content": description,
-                        "metadata": {
-                            "type": "table_columns",
-                            "project_id": project_id,
-                            "table_name": table_name,
-                            "column_name": col_name,
-                            "column_type": col_type,
-                            "nullable": column.get("nullable", True),
-                            "is_primary_key": column.get("is_primary_key", False)
-                        }
-                    }
-                    column_docs.append(doc)
-
-        return column_docs
-
-    async def _process_relationships(
-        self,
-        project_id: str,
-        schema_data: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        """Process table relationships for indexing"""
-
-        relationship_docs = []
-        relationships = schema_data.get("relationships", [])
-
-        for rel in relationships:
-            if isinstance(rel, dict):
-                description = self._generate_relationship_description(rel)
-
-                doc = {
-                    "content": description,
+            })
+
+            # Comprehensions instead of per-item append calls; the one-tuple
+            # loop binds name and type once per column
+            column_docs += [
+                {
+                    "id": _document_id(project_id, "column", table_name, col_name),
+                    "content": self._generate_column_description(
+                        table_name, col_name, col_type, column.get("description", "")
+                    ),
                     "metadata": {
-                        "type": "relationship",
+                        "type": "table_columns",
                         "project_id": project_id,
-                        "from_table": rel.get("from_table"),
-                        "to_table": rel.get("to_table"),
-                        "relationship_type": rel.get("type", "foreign_key")
+                        "table_name": table_name,
+                        "column_name": col_name,
+                        "column_type": col_type,
+                        "nullable": column.get("nullable", True),
+                        "is_primary_key": column.get("is_primary_key", False)
                     }
                 }
-                relationship_docs.append(doc)
+                for column in columns if isinstance(column, dict)
+                for col_name, col_type in ((column.get("name", ""), column.get("type", "")),)
+            ]
+
+        relationship_docs = [
+            {
+                "id": _document_id(
+                    project_id, "relationship", rel.get("from_table"), rel.get("from_column"),
+                    rel.get("to_table"), rel.get("to_column"), rel.get("type", "foreign_key")
+                ),
+                "content": self._generate_relationship_description(rel),
+                "metadata": {
+                    "type": "relationship",
+                    "project_id": project_id,
+                    "from_table": rel.get("from_table"),
+                    "to_table": rel.get("to_table"),
+                    "relationship_type": rel.get("type", "foreign_key")
+                }
+            }
+            for rel in schema_data.get("relationships", []) if isinstance(rel, dict)
+        ]
 
-        return relationship_docs
+        return table_docs, column_docs, relationship_docs
 
     def _generate_table_description(
         self,
@@ -169,31 +160,21 @@ class SchemaIndexingPipeline:
     ) -> str:
         """Generate a comprehensive description of a database table"""
 
-        description_parts = [f"Table: {table_name}"]
-
-        # Add table comment/description if available
-        if table_info.get("description"):
-            description_parts.append(f"Description: {table_info['description']}")
-
-        # Add column information
+        description = table_info.get("description")
         columns = table_info.get("columns", [])
-        if columns:
-            col_names = []
-            for col in columns:
-                if isinstance(col, dict):
-                    col_name = col.get("name", "")
-                    col_type = col.get("type", "")
-                    col_names.append(f"{col_name} ({col_type})")
-                else:
-                    col_names.append(str(col))
+        row_count = table_info.get("row_count")
 
-            description_parts.append(f"Columns: {', '.join(col_names)}")
+        col_names = [
+            f"{col.get('name', '')} ({col.get('type', '')})" if isinstance(col, dict) else str(col)
+            for col in columns
+        ]
 
-        # Add table statistics if available
-        if table_info.get("row_count"):
-            description_parts.append(f"Approximate rows: {table_info['row_count']}")
+        # Optional sections are empty strings so the sentence is built in one pass
+        description_part = f". Description: {description}" if description else ""
+        columns_part = f". Columns: {', '.join(col_names)}" if col_names else ""
+        rows_part = f". Approximate rows: {row_count}" if row_count else ""
 
-        return ". ".join(description_parts)
+        return f"Table: {table_name}{description_part}{columns_part}{rows_part}"
 
     def _generate_column_description(
         self,
@@ -204,15 +185,8 @@ class SchemaIndexingPipeline:
     ) -> str:
         """Generate description for a database column"""
 
-        parts = [
-            f"Column {col_name} in table {table_name}",
-            f"Type: {col_type}"
-        ]
-
-        if col_description:
-            parts.append(f"Description: {col_description}")
-
-        return ". ".join(parts)
+        description_part = f". Description: {col_description}" if col_description else ""
+        return f"Column {col_name} in table {table_name}. Type: {col_type}{description_part}"
 
     def _generate_relationship_description(self, rel: Dict[str, Any]) -> str:
         """Generate description for a table relationship"""
@@ -236,14 +210,8 @@ class SchemaIndexingPipeline:
         """Update existing schema index with changes"""
 
         try:
-            # For now, we'll do a full re-index
-            # In a production system, this would be more granular
-            collection_name = f"schema_{project_id}"
-
-            # Clear existing documents
-            await self.vector_store.delete_collection(collection_name)
-
-            # Re-index with new schema
+            # Re-indexing diffs against stored content hashes, so only changed
+            # tables, columns and relationships are re-embedded
             return await self.index_database_schema(
                 project_id, {}, schema_changes
             )
@@ -256,20 +224,15 @@ class SchemaIndexingPipeline:
         """Get a summary of indexed schema information"""
 
         try:
-            collection_name = f"schema_{project_id}"
-
-            # Get document counts by type
-            table_count = await self.vector_store.count_documents(
-                collection_name, {"type": "table_description"}
-            )
-
-            column_count = await self.vector_store.count_documents(
-                collection_name, {"type": "table_columns"}
-            )
+            collection_name = schema_collection(project_id)
 
-            relationship_count = await self.vector_store.count_documents(
-                collection_name, {"type": "relationship"}
+            # Get document counts by type in one concurrent round
+            counts = await self.vector_store.count_by_type(
+                collection_name, ("table_description", "table_columns", "relationship")
             )
+            table_count = counts["table_description"]
+            column_count = counts["table_columns"]
+            relationship_count = counts["relationship"]
 
             return {
                 "status": "success",
@@ -1,16 +1,34 @@
+import asyncio
 import logging
 import uuid
-import json
+import mmap
 import os
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union
 from dataclasses import dataclass
 from pathlib import Path
-from src.providers.vector_store import VectorStore
+
+import numpy as np
+import orjson
+from src.providers.vector_store import (
+    CollectionNotFoundError,
+    VectorStore,
+    add_document_columns_in_batches,
+    sql_pairs_collection,
+    sync_documents,
+)
 from src.providers.embeddings_provider import EmbeddingsProvider
 
 logger = logging.getLogger("hugdata-ai")
 
-@dataclass
+_DOCUMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "hugdata-ai/sql_pairs")
+_PAIR_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "hugdata-ai/sql_pairs/pair")
+
+# Below this many pairs, building documents inline is cheaper than a thread hop
+_OFFLOAD_MIN_PAIRS = 1000
+
+EmbeddingDtype = Literal["fp32", "fp16", "int8"]
+
+@dataclass(slots=True, frozen=True)
 class SqlPair:
     """Represents a SQL question-answer pair"""
     id: str
@@ -21,16 +39,32 @@ class SqlPair:
 class SqlPairsIndexingPipeline:
     """Pipeline for indexing SQL question-answer pairs into vector store"""
 
+    # Parsed pairs files shared across instances: path -> (mtime, data)
+    _pairs_file_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
     def __init__(
         self,
         embeddings_provider: EmbeddingsProvider,
         vector_store: VectorStore,
-        sql_pairs_path: Optional[str] = None
+        sql_pairs_path: Optional[str] = None,
+        embed_chunk_size: int = 256,
+        max_concurrency: int = 16,
+        upload_batch_size: int = 64,
+        upload_concurrency: int = 2,
+        embedding_dtype: EmbeddingDtype = "fp16"
     ):
+        if embedding_dtype not in ("fp32", "fp16", "int8"):
+            raise ValueError(f"Unsupported embedding_dtype: {embedding_dtype}")
         self.embeddings_provider = embeddings_provider
         self.vector_store = vector_store
+        self.embed_chunk_size = embed_chunk_size
+        self.max_concurrency = max_concurrency
+        self.upload_batch_size = upload_batch_size
+        self.upload_concurrency = upload_concurrency
+        self.embedding_dtype = embedding_dtype
         self.sql_pairs_path = sql_pairs_path or "sql_pairs.json"
         self.external_pairs = self._load_external_sql_pairs()
+        self._prepared = self._prepare_sql_pairs(self.external_pairs)
 
     def _load_external_sql_pairs(self) -> Dict[str, Any]:
         """Load external SQL pairs from file if available"""
@@ -39,10 +73,21 @@ class SqlPairsIndexingPipeline:
             return {}
 
         try:
-            with open(self.sql_pairs_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                logger.info(f"Loaded external SQL pairs from {self.sql_pairs_path}")
-                return data
+            mtime = os.path.getmtime(self.sql_pairs_path)
+            cached = self._pairs_file_cache.get(self.sql_pairs_path)
+            if cached is not None and cached[0] == mtime:
+                # Copy so add_external_pairs does not mutate the shared entry
+                return dict(cached[1])
+
+            # Parse straight from the mapped file instead of reading it into a str first
+            with open(self.sql_pairs_path, 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                with memoryview(buffer) as view:
+                    data = orjson.loads(view)
+
+            self._pairs_file_cache[self.sql_pairs_path] = (mtime, data)
+            logger.info(f"Loaded external SQL pairs from {self.sql_pairs_path}")
+            return dict(data)
         except Exception as e:
             logger.error(f"Error loading SQL pairs file: {e}")
             return {}
@@ -51,7 +96,8 @@ class SqlPairsIndexingPipeline:
         self,
         mdl_str: str,
         project_id: str = "",
-        external_pairs: Optional[Dict[str, Any]] = None
+        external_pairs: Optional[Dict[str, Any]] = None,
+        include_pairs: bool = False
     ) -> Dict[str, Any]:
         """
         Index SQL pairs based on MDL boilerplates
@@ -60,13 +106,15 @@ class SqlPairsIndexingPipeline:
             mdl_str: JSON string containing the model definition
             project_id: Project identifier for scoping
             external_pairs: Additional external SQL pairs
+            include_pairs: Also return the boilerplates and the indexed pairs
+                (the latter as a pre-serialized JSON array string)
 
         Returns:
             Dict containing indexing results
         """
         try:
-            # 1. Parse MDL and extract boilerplates
-            boilerplates = self._extract_boilerplates(mdl_str)
+            # 1. Parse MDL and extract boilerplates (off the event loop; MDLs can be large)
+            boilerplates = await asyncio.to_thread(self._extract_boilerplates, mdl_str)
 
             if not boilerplates:
                 logger.info(f"No boilerplates found in MDL for project {project_id}")
@@ -77,109 +125,121 @@ class SqlPairsIndexingPipeline:
                     "message": "No boilerplates found to match SQL pairs"
                 }
 
-            # 2. Combine external pairs
-            combined_pairs = {
-                **self.external_pairs,
-                **(external_pairs or {})
-            }
+            # 2. Combine external pairs; only per-call pairs still need building
+            prepared_pairs = self._prepared
+            if external_pairs:
+                prepared_pairs = {**prepared_pairs, **self._prepare_sql_pairs(external_pairs)}
 
             # 3. Extract SQL pairs for matching boilerplates
-            sql_pairs = self._extract_sql_pairs(boilerplates, combined_pairs)
+            sql_pairs = self._extract_sql_pairs(boilerplates, prepared_pairs)
 
             if not sql_pairs:
                 logger.info(f"No matching SQL pairs found for project {project_id}")
-                return {
+                result = {
                     "indexed_count": 0,
                     "project_id": project_id,
                     "status": "success",
-                    "message": "No matching SQL pairs found for boilerplates",
-                    "boilerplates": list(boilerplates)
+                    "message": "No matching SQL pairs found for boilerplates"
                 }
-
-            # 4. Clean existing pairs for this project
-            await self._clean_existing_pairs(project_id)
-
-            # 5. Convert to documents for embedding
-            documents = self._create_documents_from_pairs(sql_pairs, project_id)
-
-            # 6. Generate embeddings
-            embedded_documents = await self._generate_embeddings(documents)
-
-            # 7. Store in vector store
-            collection_name = f"sql_pairs_{project_id}" if project_id else "sql_pairs"
-            await self._store_documents(embedded_documents, collection_name)
+                if include_pairs:
+                    result["boilerplates"] = list(boilerplates)
+                return result
+
+            # 4. Convert to documents for embedding
+            if len(sql_pairs) >= _OFFLOAD_MIN_PAIRS:
+                documents = await asyncio.to_thread(self._create_documents_from_pairs, sql_pairs, project_id)
+            else:
+                documents = self._create_documents_from_pairs(sql_pairs, project_id)
+
+            # 5. Sync the collection: drop pairs no longer present and embed
+            #    and store only pairs whose question changed
+            collection_name = sql_pairs_collection(project_id)
+
+            async def embed_and_store(changed: List[Dict[str, Any]]) -> None:
+                # Split into columns once; embeddings and upload work on the columns directly
+                ids = [doc["id"] for doc in changed]
+                contents = [doc["content"] for doc in changed]
+                metadatas = [doc["metadata"] for doc in changed]
+                embeddings = await self._generate_embeddings(contents)
+                await self._store_documents(collection_name, ids, contents, metadatas, embeddings)
+
+            sync_counts = await sync_documents(self.vector_store, collection_name, documents, embed_and_store)
 
             logger.info(f"Successfully indexed {len(sql_pairs)} SQL pairs for project {project_id}")
 
-            return {
+            result = {
                 "indexed_count": len(sql_pairs),
                 "project_id": project_id,
                 "status": "success",
                 "collection": collection_name,
-                "boilerplates": list(boilerplates),
-                "pairs": [pair.__dict__ for pair in sql_pairs]
+                "embedded_count": sync_counts["written"],
+                "unchanged_count": sync_counts["unchanged"]
             }
+            if include_pairs:
+                result["boilerplates"] = list(boilerplates)
+                result["pairs"] = self._serialize_pairs(sql_pairs)
+            return result
 
         except Exception as e:
             logger.error(f"SQL pairs indexing failed: {str(e)}")
             raise Exception(f"SQL pairs indexing failed: {str(e)}")
 
-    def _extract_boilerplates(self, mdl_str: str) -> Set[str]:
+    @staticmethod
+    def _serialize_pairs(sql_pairs: List[SqlPair]) -> str:
+        """Serialize pairs once here so callers can forward the JSON without re-encoding"""
+        pairs = [
+            {"id": pair.id, "sql": pair.sql, "question": pair.question, "metadata": pair.metadata}
+            for pair in sql_pairs
+        ]
+        return orjson.dumps(pairs).decode()
+
+    def _extract_boilerplates(self, mdl_str: Union[str, bytes]) -> Set[str]:
         """Extract boilerplates from MDL models"""
         try:
-            mdl = json.loads(mdl_str)
-            boilerplates = set()
+            mdl = orjson.loads(mdl_str)
+            return {
+                boilerplate.lower()
+                for model in mdl.get("models", ())
+                if (boilerplate := model.get("properties", {}).get("boilerplate"))
+            }
 
-            for model in mdl.get("models", []):
-                properties = model.get("properties", {})
-                boilerplate = properties.get("boilerplate")
-                if boilerplate:
-                    boilerplates.add(boilerplate.lower())
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in MDL string: {str(e)}")
 
-            return boilerplates
+    def _prepare_sql_pairs(self, external_pairs: Dict[str, Any]) -> Dict[str, List[SqlPair]]:
+        """Build SqlPair objects per boilerplate once, ahead of indexing requests"""
+        prepared = {}
+
+        for boilerplate, pairs_data in external_pairs.items():
+            if isinstance(pairs_data, list):
+                prepared[boilerplate] = [
+                    SqlPair(
+                        # Id-less pairs get an id derived from their content, so
+                        # re-indexing the same pairs leaves their documents unchanged
+                        id=pair_data.get("id") or str(uuid.uuid5(
+                            _PAIR_ID_NAMESPACE,
+                            f"{boilerplate}\0{pair_data.get('question', '')}\0{pair_data.get('sql', '')}"
+                        )),
+                        question=pair_data.get("question", ""),
+                        sql=pair_data.get("sql", ""),
+                        metadata={
+                            "boilerplate": boilerplate,
+                            "source": "external_pairs"
+                        }
+                    )
+                    for pair_data in pairs_data
+                    if isinstance(pair_data, dict)
+                ]
 
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON in MDL string: {str(e)}")
+        return prepared
 
     def _extract_sql_pairs(
         self,
         boilerplates: Set[str],
-        external_pairs: Dict[str, Any]
+        prepared_pairs: Dict[str, List[SqlPair]]
     ) -> List[SqlPair]:
         """Extract SQL pairs for matching boilerplates"""
-        sql_pairs = []
-
-        for boilerplate in boilerplates:
-            if boilerplate in external_pairs:
-                pairs_data = external_pairs[boilerplate]
-
-                if isinstance(pairs_data, list):
-                    for pair_data in pairs_data:
-                        if isinstance(pair_data, dict):
-                            sql_pair = SqlPair(
-                                id=pair_data.get("id", str(uuid.uuid4())),
-                                question=pair_data.get("question", ""),
-                                sql=pair_data.get("sql", ""),
-                                metadata={
-                                    "boilerplate": boilerplate,
-                                    "source": "external_pairs"
-                                }
-                            )
-                            sql_pairs.append(sql_pair)
-
-        return sql_pairs
-
-    async def _clean_existing_pairs(self, project_id: str) -> None:
-        """Clean existing SQL pairs for the project"""
-        try:
-            collection_name = f"sql_pairs_{project_id}" if project_id else "sql_pairs"
-
-            # Check if collection exists and delete it
-            if await self.vector_store.collection_exists(collection_name):
-                await self.vector_store.delete_collection(collection_name)
-                logger.info(f"Cleaned existing SQL pairs for project {project_id}")
-        except Exception as e:
-            logger.warning(f"Failed to clean existing SQL pairs: {str(e)}")
+        return [pair for boilerplate in boilerplates for pair in prepared_pairs.get(boilerplate, ())]
 
     def _create_documents_from_pairs(
         self,
@@ -187,73 +247,89 @@ class SqlPairsIndexingPipeline:
         project_id: str = ""
     ) -> List[Dict[str, Any]]:
         """Create documents from SQL pairs for embedding"""
-        documents = []
-
-        for pair in sql_pairs:
-            # Create content for embedding - focus on the question
-            content = pair.question
-
-            # Create metadata
-            metadata = {
-                "sql_pair_id": pair.id,
-                "sql": pair.sql,
-                "question": pair.question,
-                "type": "SQL_PAIR"
-            }
-
-            if project_id:
-                metadata["project_id"] = project_id
-
-            if pair.metadata:
-                metadata.update(pair.metadata)
-
-            document = {
-                "id": str(uuid.uuid4()),
-                "content": content,
-                "metadata": metadata
+        project_metadata = {"project_id": project_id} if project_id else {}
+
+        # Content focuses on the question. Point ids are derived from the pair id
+        # (Qdrant needs UUIDs), so re-indexing a pair overwrites its point.
+        return [
+            {
+                "id": str(uuid.uuid5(_DOCUMENT_ID_NAMESPACE, f"{project_id}:{pair.id}")),
+                "content": pair.question,
+                "metadata": {
+                    "sql_pair_id": pair.id,
+                    "sql": pair.sql,
+                    "question": pair.question,
+                    "type": "SQL_PAIR",
+                    **project_metadata,
+                    **(pair.metadata or {})
+                }
             }
+            for pair in sql_pairs
+        ]
 
-            documents.append(document)
-
-        return documents
-
-    async def _generate_embeddings(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Generate embeddings for documents"""
+    async def _generate_embeddings(self, contents: List[str]) -> np.ndarray:
+        """Generate embeddings for document contents as one (N, D) array of `embedding_dtype`, in input order"""
         try:
-            # Extract content for embedding
-            contents = [doc["content"] for doc in documents]
+            # Embed length-sorted sub-batches concurrently, then restore input order
+            order = sorted(range(len(contents)), key=lambda i: len(contents[i]), reverse=True)
+            chunks = [order[i:i + self.embed_chunk_size] for i in range(0, len(order), self.embed_chunk_size)]
+            semaphore = asyncio.Semaphore(self.max_concurrency)
 
-            # Generate embeddings
-            embeddings = await self.embeddings_provider.embed_documents(contents)
+            async def embed_chunk(indices: List[int]) -> List[List[float]]:
+                async with semaphore:
+                    return await self.embeddings_provider.embed_documents([contents[i] for i in indices])
 
-            # Add embeddings to documents
-            embedded_documents = []
-            for i, doc in enumerate(documents):
-                embedded_doc = doc.copy()
-                embedded_doc["embedding"] = embeddings[i]
-                embedded_documents.append(embedded_doc)
+            chunk_results = await asyncio.gather(*(embed_chunk(chunk) for chunk in chunks))
+            if not chunk_results:
+                return np.empty((0, 0), dtype=np.float32)
 
-            return embedded_documents
+            # One contiguous buffer instead of N lists of boxed floats
+            embeddings = np.empty((len(contents), len(chunk_results[0][0])), dtype=np.float32)
+            for indices, chunk_embeddings in zip(chunks, chunk_results):
+                embeddings[indices] = chunk_embeddings
+
+            return self._quantize(embeddings)
 
         except Exception as e:
             logger.error(f"Failed to generate embeddings: {str(e)}")
             raise
 
+    def _quantize(self, embeddings: np.ndarray) -> np.ndarray:
+        """Narrow embeddings to the configured dtype before upload"""
+        if self.embedding_dtype == "fp16":
+            return embeddings.astype(np.float16)
+        if self.embedding_dtype == "int8":
+            # Symmetric per-vector scale; cosine similarity is scale-invariant, so
+            # the codes are stored as-is and the scale is not needed at query time
+            scales = np.abs(embeddings).max(axis=1, keepdims=True) / 127.0
+            scales[scales == 0] = 1.0
+            return np.clip(np.rint(embeddings / scales), -127, 127).astype(np.int8)
+        return embeddings
+
     async def _store_documents(
         self,
-        documents: List[Dict[str, Any]],
-        collection_name: str
+        collection_name: str,
+        ids: List[str],
+        contents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: np.ndarray
     ) -> None:
-        """Store documents in vector store"""
+        """Store documents, given as parallel columns, in vector store"""
         try:
-            # Create collection if it doesn't exist
-            if not await self.vector_store.collection_exists(collection_name):
-                await self.vector_store.create_collection(collection_name)
-
-            # Store documents
-            await self.vector_store.add_documents(collection_name, documents)
+            # Store documents, creating the collection on first write if needed
+            await add_document_columns_in_batches(
+                self.vector_store,
+                collection_name,
+                ids,
+                contents,
+                metadatas,
+                embeddings,
+                batch_size=self.upload_batch_size,
+                concurrency=self.upload_concurrency,
+                create_if_missing=True
+            )
 
-            logger.info(f"Stored {len(documents)} SQL pair documents in collection {collection_name}")
+            logger.info(f"Stored {len(ids)} SQL pair documents in collection {collection_name}")
 
         except Exception as e:
             logger.error(f"Failed to store documents: {str(e)}")
@@ -277,18 +353,16 @@ class SqlPairsIndexingPipeline:
             Dict containing cleanup results
         """
         try:
-            collection_name = f"sql_pairs_{project_id}" if project_id else "sql_pairs"
-
-            if not await self.vector_store.collection_exists(collection_name):
-                return {
-                    "deleted_count": 0,
-                    "status": "success",
-                    "message": "Collection does not exist"
-                }
+            collection_name = sql_pairs_collection(project_id)
 
             if delete_all:
                 # Delete entire collection
-                await self.vector_store.delete_collection(collection_name)
+                if not await self.vector_store.delete_collection(collection_name):
+                    return {
+                        "deleted_count": 0,
+                        "status": "success",
+                        "message": "Collection does not exist"
+                    }
                 return {
                     "deleted_count": "all",
                     "status": "success",
@@ -296,18 +370,15 @@ class SqlPairsIndexingPipeline:
                 }
 
             if sql_pair_ids:
-                # Delete specific pairs
-                deleted_count = 0
-                for pair_id in sql_pair_ids:
-                    filter_criteria = {"sql_pair_id": pair_id}
-                    if project_id:
-                        filter_criteria["project_id"] = project_id
-
-                    count = await self.vector_store.delete_documents(
-                        collection_name,
-                        filter_criteria
-                    )
-                    deleted_count += count
+                # Delete specific pairs in one call; a list value matches any id
+                filter_criteria = {"sql_pair_id": list(sql_pair_ids)}
+                if project_id:
+                    filter_criteria["project_id"] = project_id
+
+                deleted_count = await self.vector_store.delete_documents(
+                    collection_name,
+                    filter_criteria
+                )
 
                 return {
                     "deleted_count": deleted_count,
@@ -347,22 +418,20 @@ class SqlPairsIndexingPipeline:
             List of relevant SQL pairs
         """
         try:
-            collection_name = f"sql_pairs_{project_id}" if project_id else "sql_pairs"
-
-            # Check if collection exists
-            if not await self.vector_store.collection_exists(collection_name):
-                logger.warning(f"Collection {collection_name} does not exist")
-                return []
+            collection_name = sql_pairs_collection(project_id)
 
             # Perform similarity search
             results = await self.vector_store.similarity_search(
                 query=query,
-                collection=collection_name,
+                collection_name=collection_name,
                 limit=limit
             )
 
             return results
 
+        except CollectionNotFoundError:
+            logger.warning(f"Collection {collection_name} does not exist")
+            return []
         except Exception as e:
             logger.error(f"SQL pairs search failed: {str(e)}")
             return []
@@ -378,19 +447,18 @@ class SqlPairsIndexingPipeline:
             Dict containing statistics
         """
         try:
-            collection_name = f"sql_pairs_{project_id}" if project_id else "sql_pairs"
+            collection_name = sql_pairs_collection(project_id)
 
-            # Check if collection exists
-            if not await self.vector_store.collection_exists(collection_name):
+            # Get collection statistics
+            try:
+                stats = await self.vector_store.get_collection_stats(collection_name)
+            except CollectionNotFoundError:
                 return {
                     "total_pairs": 0,
                     "collection_exists": False,
                     "project_id": project_id
                 }
 
-            # Get collection statistics
-            stats = await self.vector_store.get_collection_stats(collection_name)
-
             return {
                 "total_pairs": stats.get("document_count", 0),
                 "collection_exists": True,
@@ -411,8 +479,10 @@ class SqlPairsIndexingPipeline:
     def add_external_pairs(self, pairs_data: Dict[str, Any]) -> None:
         """Add external pairs to the pipeline"""
         self.external_pairs.update(pairs_data)
+        self._prepared.update(self._prepare_sql_pairs(pairs_data))
 
     def set_sql_pairs_path(self, path: str) -> None:
         """Set the SQL pairs file path and reload"""
         self.sql_pairs_path = path
         self.external_pairs = self._load_external_sql_pairs()
+        self._prepared = self._prepare_sql_pairs(self.external_pairs)
@@ -1,13 +1,21 @@
+import asyncio
 import logging
 import uuid
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass
-from src.providers.vector_store import VectorStore
-from src.providers.embeddings_provider import EmbeddingsProvider
+from itertools import chain, repeat
+from typing import Any, Dict, List, Optional, Union
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import orjson
+from src.cache.embedding_cache import EmbeddingCache
+from src.providers.vector_store import VectorStore, sync_documents, table_descriptions_collection
+from src.providers.embeddings_provider import EmbeddingsProvider, embedding_model_name
 
 logger = logging.getLogger("hugdata-ai")
 
-@dataclass
+_DOCUMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "hugdata-ai/table_descriptions")
+
+@dataclass(slots=True)
 class TableDescription:
     """Represents a table description for indexing"""
     name: str
@@ -18,9 +26,19 @@ class TableDescription:
 class TableDescriptionIndexingPipeline:
     """Pipeline for indexing table descriptions into vector store"""
 
-    def __init__(self, embeddings_provider: EmbeddingsProvider, vector_store: VectorStore):
+    def __init__(
+        self,
+        embeddings_provider: EmbeddingsProvider,
+        vector_store: VectorStore,
+        embed_chunk_size: int = 256,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        max_concurrency: int = 16
+    ):
         self.embeddings_provider = embeddings_provider
         self.vector_store = vector_store
+        self.embed_chunk_size = embed_chunk_size
+        self.max_concurrency = max_concurrency
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
 
     async def index_table_descriptions(
         self,
@@ -38,11 +56,8 @@ class TableDescriptionIndexingPipeline:
             Dict containing indexing results
         """
         try:
-            # 1. Validate and parse MDL
-            mdl = self._validate_and_parse_mdl(mdl_str)
-
-            # 2. Extract table descriptions
-            table_descriptions = self._extract_table_descriptions(mdl)
+            # 1-2. Parse MDL and extract table descriptions (off the event loop; MDLs can be large)
+            table_descriptions = await asyncio.to_thread(self._parse_table_descriptions, mdl_str)
 
             if not table_descriptions:
                 logger.info(f"No table descriptions found for project {project_id}")
@@ -53,19 +68,17 @@ class TableDescriptionIndexingPipeline:
                     "message": "No table descriptions to index"
                 }
 
-            # 3. Clean existing descriptions for this project
-            if project_id:
-                await self._clean_existing_descriptions(project_id)
-
-            # 4. Convert to documents for embedding
+            # 3. Convert to documents for embedding
             documents = self._create_documents(table_descriptions, project_id)
 
-            # 5. Generate embeddings
-            embedded_documents = await self._generate_embeddings(documents)
+            # 4. Sync the collection: delete removed tables and embed and
+            #    store only descriptions whose content changed
+            collection_name = table_descriptions_collection(project_id)
+
+            async def embed_and_store(changed: List[Dict[str, Any]]) -> None:
+                await self._store_documents(changed, await self._generate_embeddings(changed), collection_name)
 
-            # 6. Store in vector store
-            collection_name = f"table_descriptions_{project_id}" if project_id else "table_descriptions"
-            await self._store_documents(embedded_documents, collection_name)
+            sync_counts = await sync_documents(self.vector_store, collection_name, documents, embed_and_store)
 
             logger.info(f"Successfully indexed {len(table_descriptions)} table descriptions for project {project_id}")
 
@@ -74,48 +87,40 @@ class TableDescriptionIndexingPipeline:
                 "project_id": project_id,
                 "status": "success",
                 "collection": collection_name,
-                "descriptions": [desc.__dict__ for desc in table_descriptions]
+                "embedded_count": sync_counts["written"],
+                "unchanged_count": sync_counts["unchanged"],
+                "descriptions": [asdict(desc) for desc in table_descriptions]
             }
 
         except Exception as e:
             logger.error(f"Table description indexing failed: {str(e)}")
             raise Exception(f"Table description indexing failed: {str(e)}")
 
-    def _validate_and_parse_mdl(self, mdl_str: str) -> Dict[str, Any]:
-        """Validate and parse the MDL string"""
-        import json
+    def _parse_table_descriptions(self, mdl_str: Union[str, bytes]) -> List[TableDescription]:
+        return self._extract_table_descriptions(self._validate_and_parse_mdl(mdl_str))
 
+    def _validate_and_parse_mdl(self, mdl_str: Union[str, bytes]) -> Dict[str, Any]:
+        """Validate and parse the MDL string"""
         try:
-            mdl = json.loads(mdl_str)
+            mdl = orjson.loads(mdl_str)
             if not isinstance(mdl, dict):
                 raise ValueError("MDL must be a valid JSON object")
             return mdl
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in MDL string: {str(e)}")
 
     def _extract_table_descriptions(self, mdl: Dict[str, Any]) -> List[TableDescription]:
         """Extract table descriptions from MDL structure"""
-        descriptions = []
-
-        # Process models
-        for model in mdl.get("models", []):
-            description = self._extract_description_from_resource(model, "MODEL")
-            if description:
-                descriptions.append(description)
-
-        # Process metrics
-        for metric in mdl.get("metrics", []):
-            description = self._extract_description_from_resource(metric, "METRIC")
-            if description:
-                descriptions.append(description)
-
-        # Process views
-        for view in mdl.get("views", []):
-            description = self._extract_description_from_resource(view, "VIEW")
-            if description:
-                descriptions.append(description)
-
-        return descriptions
+        resources = chain(
+            zip(mdl.get("models", ()), repeat("MODEL")),
+            zip(mdl.get("metrics", ()), repeat("METRIC")),
+            zip(mdl.get("views", ()), repeat("VIEW"))
+        )
+        return [
+            description
+            for resource, mdl_type in resources
+            if (description := self._extract_description_from_resource(resource, mdl_type))
+        ]
 
     def _extract_description_from_resource(
         self,
@@ -127,13 +132,12 @@ class TableDescriptionIndexingPipeline:
         if not name:
             return None
 
-        # Extract columns
-        columns = []
-        for column in resource.get("columns", []):
-            if isinstance(column, dict):
-                columns.append(column.get("name", ""))
-            elif isinstance(column, str):
-                columns.append(column)
+        # Extract column names, skipping blanks
+        columns = ", ".join(
+            column_name
+            for column in resource.get("columns", ())
+            if (column_name := self._column_name(column))
+        )
 
         # Extract description from properties
         properties = resource.get("properties", {})
@@ -142,21 +146,15 @@ class TableDescriptionIndexingPipeline:
         return TableDescription(
             name=name,
             description=description,
-            columns=", ".join(filter(None, columns)),
+            columns=columns,
             mdl_type=mdl_type
         )
 
-    async def _clean_existing_descriptions(self, project_id: str) -> None:
-        """Clean existing table descriptions for the project"""
-        try:
-            collection_name = f"table_descriptions_{project_id}"
-
-            # Check if collection exists and delete it
-            if await self.vector_store.collection_exists(collection_name):
-                await self.vector_store.delete_collection(collection_name)
-                logger.info(f"Cleaned existing table descriptions for project {project_id}")
-        except Exception as e:
-            logger.warning(f"Failed to clean existing descriptions: {str(e)}")
+    @staticmethod
+    def _column_name(column: Any) -> str:
+        if isinstance(column, dict):
+            return column.get("name", "")
+        return column if isinstance(column, str) else ""
 
     def _create_documents(
         self,
@@ -166,6 +164,11 @@ class TableDescriptionIndexingPipeline:
         """Create documents from table descriptions for embedding"""
         documents = []
 
+        # Fields shared by every document, built once per call
+        base_metadata = {"type": "TABLE_DESCRIPTION"}
+        if project_id:
+            base_metadata["project_id"] = project_id
+
         for desc in table_descriptions:
             # Create content for embedding
             content_parts = [
@@ -183,17 +186,15 @@ class TableDescriptionIndexingPipeline:
 
             # Create metadata
             metadata = {
-                "type": "TABLE_DESCRIPTION",
+                **base_metadata,
                 "name": desc.name,
                 "mdl_type": desc.mdl_type,
                 "table_name": desc.name
             }
 
-            if project_id:
-                metadata["project_id"] = project_id
-
             document = {
-                "id": str(uuid.uuid4()),
+                # Stable per table so re-indexing updates points in place
+                "id": str(uuid.uuid5(_DOCUMENT_ID_NAMESPACE, f"{project_id}|{desc.name}|{desc.mdl_type}")),
                 "content": content,
                 "metadata": metadata
             }
@@ -202,23 +203,38 @@ class TableDescriptionIndexingPipeline:
 
         return documents
 
-    async def _generate_embeddings(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Generate embeddings for documents"""
+    async def _generate_embeddings(self, documents: List[Dict[str, Any]]) -> np.ndarray:
+        """Generate embeddings for documents as one (N, D) float16 array, in document order"""
         try:
-            # Extract content for embedding
-            contents = [doc["content"] for doc in documents]
+            # Reuse cached vectors for unchanged content; only misses go to the provider
+            model = embedding_model_name(self.embeddings_provider)
+            keys = [EmbeddingCache.key(model, doc["content"]) for doc in documents]
+            embeddings = [self.embedding_cache.get(key) for key in keys]
+            misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
 
-            # Generate embeddings
-            embeddings = await self.embeddings_provider.embed_documents(contents)
+            if misses:
+                contents = [documents[i]["content"] for i in misses]
 
-            # Add embeddings to documents
-            embedded_documents = []
-            for i, doc in enumerate(documents):
-                embedded_doc = doc.copy()
-                embedded_doc["embedding"] = embeddings[i]
-                embedded_documents.append(embedded_doc)
+                # Embed fixed-size sub-batches concurrently to stay under provider batch
+                # limits, with at most max_concurrency requests in flight
+                chunks = [contents[i:i + self.embed_chunk_size] for i in range(0, len(contents), self.embed_chunk_size)]
+                semaphore = asyncio.Semaphore(self.max_concurrency)
 
-            return embedded_documents
+                async def embed_chunk(chunk: List[str]) -> List[List[float]]:
+                    async with semaphore:
+                        return await self.embeddings_provider.embed_documents(chunk)
+
+                results = await asyncio.gather(*(embed_chunk(chunk) for chunk in chunks))
+                for i, embedding in zip(misses, chain.from_iterable(results)):
+                    embeddings[i] = embedding = np.asarray(embedding, dtype=np.float16)
+                    self.embedding_cache.set(keys[i], embedding)
+
+            if not embeddings:
+                return np.empty((0, 0), dtype=np.float16)
+
+            # float16 halves the buffer relative to float32 (and is a fraction of
+            # boxed Python floats); it is widened only at the store boundary
+            return np.asarray(embeddings, dtype=np.float16)
 
         except Exception as e:
             logger.error(f"Failed to generate embeddings: {str(e)}")
@@ -227,16 +243,22 @@ class TableDescriptionIndexingPipeline:
     async def _store_documents(
         self,
         documents: List[Dict[str, Any]],
+        embeddings: np.ndarray,
         collection_name: str
     ) -> None:
-        """Store documents in vector store"""
+        """Store documents, with their embeddings row-aligned in `embeddings`, in vector store"""
         try:
-            # Create collection if it doesn't exist
-            if not await self.vector_store.collection_exists(collection_name):
-                await self.vector_store.create_collection(collection_name)
-
-            # Store documents
-            await self.vector_store.add_documents(collection_name, documents)
+            # Hand the store parallel columns so it can use its native batch format
+            ids, contents, metadatas = [], [], []
+            for doc in documents:
+                ids.append(doc["id"])
+                contents.append(doc["content"])
+                metadatas.append(doc["metadata"])
+
+            # Store documents, creating the collection on first write if needed
+            await self.vector_store.add_document_columns(
+                collection_name, ids, contents, metadatas, embeddings, create_if_missing=True
+            )
 
             logger.info(f"Stored {len(documents)} documents in collection {collection_name}")
 
@@ -262,7 +284,7 @@ class TableDescriptionIndexingPipeline:
             List of relevant table descriptions
         """
         try:
-            collection_name = f"table_descriptions_{project_id}" if project_id else "table_descriptions"
+            collection_name = table_descriptions_collection(project_id)
 
             # Check if collection exists
             if not await self.vector_store.collection_exists(collection_name):
@@ -293,7 +315,7 @@ class TableDescriptionIndexingPipeline:
             Dict containing statistics
         """
         try:
-            collection_name = f"table_descriptions_{project_id}" if project_id else "table_descriptions"
+            collection_name = table_descriptions_collection(project_id)
 
             # Check if collection exists
             if not await self.vector_store.collection_exists(collection_name):
@@ -1,13 +1,86 @@
+import asyncio
+import hashlib
 import logging
-import json
-from typing import Any, Dict, List, Optional
+import re
+import string
+from collections import defaultdict
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass
 from enum import Enum
+import orjson
 from pydantic import BaseModel
+from src.cache.llm_response_cache import LLMResponseCache
+from src.cache.semantic_cache import SemanticCache
+from src.providers.embeddings_provider import EmbeddingsProvider
 from src.providers.llm_provider import LLMProvider
 
 logger = logging.getLogger("hugdata-ai")
 
+_RELATIONSHIP_FIELDS = ("name", "fromModel", "fromColumn", "type", "toModel", "toColumn", "reason")
+_REQUIRED_RELATIONSHIP_FIELDS = frozenset(_RELATIONSHIP_FIELDS)
+_relationship_fields = itemgetter(*_RELATIONSHIP_FIELDS)
+
+# camelCase/PascalCase key suffix: customerId, CustomerID (but not VALID or paid)
+_CAMEL_ID_SUFFIX = re.compile(r"[a-z0-9](?:Id|ID)$")
+
+# Outermost {...} span; markdown fences around it fall outside the match
+_JSON_BLOCK = re.compile(r"\{.*\}", re.DOTALL)
+
+# Only models_json and language vary; substitution never re-parses braces in model names
+_RECOMMENDATION_PROMPT = string.Template("""
+You are an expert in database schema design and relationship recommendation.
+
+Given the following data models, analyze them and suggest appropriate relationships between them, but only if there are clear and beneficial relationships to recommend.
+
+### MODELS ###
+$models_json
+
+### GUIDELINES ###
+1. Do not recommend relationships within the same model (fromModel and toModel must be different)
+2. Only suggest relationships if there is a clear and beneficial reason to do so
+3. If there are no good relationships to recommend, return an empty list
+4. Use "MANY_TO_ONE", "ONE_TO_MANY", or "ONE_TO_ONE" relationship types only
+5. Prefer "MANY_TO_ONE" and "ONE_TO_MANY" over "MANY_TO_MANY" relationships
+6. Look for common patterns like foreign keys (columns ending in _id, id suffixes)
+7. Consider columns with similar names that might reference each other
+8. Ensure both models and columns exist before recommending
+
+### RELATIONSHIP CRITERIA ###
+- Foreign key relationships (e.g., user_id in orders table → id in users table)
+- Common naming patterns (e.g., customer_id, product_id)
+- Logical business relationships between entities
+- Referential integrity opportunities
+
+### RESPONSE FORMAT ###
+Provide your response as a JSON object with this exact structure:
+
+{
+    "relationships": [
+        {
+            "name": "descriptive_relationship_name",
+            "fromModel": "source_model_name",
+            "fromColumn": "source_column_name",
+            "type": "MANY_TO_ONE|ONE_TO_MANY|ONE_TO_ONE",
+            "toModel": "target_model_name",
+            "toColumn": "target_column_name",
+            "reason": "clear_explanation_in_$language"
+        }
+    ]
+}
+
+If no relationships are recommended, return:
+{
+    "relationships": []
+}
+
+### LANGUAGE ###
+Use $language for the relationship name and reason fields.
+
+### INSTRUCTIONS ###
+Analyze the models carefully and suggest optimizations for their relationships. Consider best practices in database design, opportunities for normalization, indexing strategies, and relationships that could improve data integrity and enhance query performance.
+""")
+
 class RelationType(Enum):
     """Types of database relationships"""
     MANY_TO_ONE = "MANY_TO_ONE"
@@ -29,11 +102,30 @@ class ModelRelationship:
     to_column: str
     reason: str
 
+def _canonical_json(value: Any) -> str:
+    """Key-sorted JSON text, so equal structures always serialize identically"""
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS).decode()
+
+
 class RelationshipRecommendationPipeline:
     """Pipeline for recommending relationships between database models"""
 
-    def __init__(self, llm_provider: LLMProvider):
+    def __init__(
+        self,
+        llm_provider: LLMProvider,
+        response_cache: Optional[LLMResponseCache] = None,
+        embeddings_provider: Optional[EmbeddingsProvider] = None,
+        semantic_cache: Optional[SemanticCache] = None
+    ):
         self.llm = llm_provider
+        # Identical MDLs produce identical prompts; reuse the completion for repeats
+        self.response_cache = response_cache if response_cache is not None else LLMResponseCache()
+        # With an embeddings provider, near-duplicate MDLs (minor schema tweaks) reuse
+        # recommendations too; they are re-validated against the current models
+        self.embeddings_provider = embeddings_provider
+        self.semantic_cache = (
+            semantic_cache if semantic_cache is not None else SemanticCache(max_entries=256, ttl=3600)
+        )
 
     async def recommend_relationships(
         self,
@@ -53,30 +145,55 @@ class RelationshipRecommendationPipeline:
             Dict containing recommended relationships
         """
         try:
-            # 1. Clean and prepare models data
-            cleaned_models = self._clean_models(mdl)
+            # 1. Clean and prepare models data; index columns once for validation.
+            #    MDL traversal and prompt building run off the event loop
+            cleaned_models, model_columns, candidate_models = await asyncio.to_thread(self._prepare_models, mdl)
 
             # 2. Validate that we have enough models to recommend relationships
             if len(cleaned_models) < 2:
                 return {"relationships": []}
 
-            # 3. Build relationship recommendation prompt
-            prompt = self._build_recommendation_prompt(cleaned_models, language)
-
-            # 4. Generate relationship recommendations
-            response = await self.llm.generate(
-                prompt=prompt,
-                max_tokens=2000,
-                temperature=0.2
-            )
+            # Only models with key-like or shared-prefix columns can be related;
+            # without two of them the LLM round-trip is skipped entirely
+            prompt_models = [model for model in cleaned_models if model.get("name") in candidate_models]
+            if len(prompt_models) < 2:
+                return {
+                    "relationships": [],
+                    "total_recommendations": 0,
+                    "models_analyzed": len(cleaned_models),
+                    "language": language,
+                    "skipped_reason": "no_fk_candidates"
+                }
 
-            # 5. Parse and normalize the response
-            normalized_response = self._normalize_response(response)
+            # 3. Build relationship recommendation prompt
+            prompt = await asyncio.to_thread(self._build_recommendation_prompt, prompt_models, language)
+
+            # 4. Reuse recommendations for a near-identical MDL if one was seen
+            signature_embedding = await self._embed_signature(prompt_models)
+            normalized_response = None
+            # Models and columns are part of the namespace, so only cosmetic
+            # edits (display names, descriptions, column order) can hit
+            cache_namespace = f"{project_id}:{language}:{self._structure_digest(prompt_models, model_columns)}"
+            if signature_embedding is not None:
+                normalized_response = self.semantic_cache.get(cache_namespace, signature_embedding)
+
+            if normalized_response is None:
+                # 5. Generate, parse and normalize relationship recommendations
+                response = await self.response_cache.generate(
+                    self.llm,
+                    prompt=prompt,
+                    max_tokens=2000,
+                    temperature=0.2
+                )
+                normalized_response = self._normalize_response(response)
+                if signature_embedding is not None:
+                    self.semantic_cache.put(cache_namespace, signature_embedding, normalized_response)
 
             # 6. Validate relationships against the original models
-            validated_relationships = self._validate_relationships(
+            validated_relationships = await asyncio.to_thread(
+                self._validate_relationships,
                 normalized_response.get("relationships", []),
-                mdl
+                model_columns
             )
 
             return {
@@ -90,37 +207,70 @@ class RelationshipRecommendationPipeline:
             logger.error(f"Relationship recommendation failed: {str(e)}")
             raise Exception(f"Relationship recommendation failed: {str(e)}")
 
+    async def _embed_signature(self, cleaned_models: List[Dict[str, Any]]) -> Optional[List[float]]:
+        """Embed a canonical form of the models; None if semantic caching is unavailable"""
+        if self.embeddings_provider is None:
+            return None
+        try:
+            signature = await asyncio.to_thread(
+                _canonical_json, sorted(cleaned_models, key=lambda m: str(m.get("name")))
+            )
+            return await self.embeddings_provider.embed_query(signature)
+        except Exception as e:
+            logger.warning(f"Skipping semantic cache lookup: {e}")
+            return None
+
+    @staticmethod
+    def _structure_digest(prompt_models: List[Dict[str, Any]], model_columns: Dict[str, Set[str]]) -> str:
+        """Digest of the prompted model names and their column names"""
+        structure = sorted(
+            (str(model.get("name")), sorted(model_columns.get(model.get("name"), ()))) for model in prompt_models
+        )
+        return hashlib.blake2b(_canonical_json(structure).encode(), digest_size=8).hexdigest()
+
+    def _prepare_models(self, mdl: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Set[str]], Set[str]]:
+        return self._clean_models(mdl), self._model_columns(mdl), self._candidate_models(mdl)
+
+    def _candidate_models(self, mdl: Dict[str, Any]) -> Set[str]:
+        """Models with foreign-key-like columns or a column prefix shared with another model"""
+        analysis = self.analyze_model_complexity(mdl)
+        foreign_keys = analysis["potential_foreign_keys"]
+        shared_prefix_models = set()
+        for columns in analysis["naming_patterns"].values():
+            models = {column["model"] for column in columns}
+            if len(models) >= 2:
+                shared_prefix_models |= models
+
+        if len(foreign_keys) < 2 and not shared_prefix_models:
+            return set()
+        return {foreign_key["model"] for foreign_key in foreign_keys} | shared_prefix_models
+
     def _clean_models(self, mdl: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Clean and prepare models for relationship analysis
         Remove display names and filter out relationship columns
-        """
-        def remove_display_name(d: Dict[str, Any]) -> Dict[str, Any]:
-            if "properties" in d and isinstance(d["properties"], dict):
-                d["properties"] = d["properties"].copy()
-                d["properties"].pop("displayName", None)
-            return d
-
-        def filter_columns(columns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-            """Filter out columns that are already relationships"""
-            filtered_columns = []
-            for column in columns:
-                if "relationship" not in column:
-                    # Create a copy to avoid modifying the original
-                    filtered_column = column.copy()
-                    filtered_column = remove_display_name(filtered_column)
-                    filtered_columns.append(filtered_column)
-            return filtered_columns
-
-        models = mdl.get("models", [])
-        cleaned = []
 
-        for model in models:
-            cleaned_model = remove_display_name(model.copy())
-            cleaned_model["columns"] = filter_columns(model.get("columns", []))
-            cleaned.append(cleaned_model)
+        The result is only serialized, so unchanged columns and properties are
+        shared with the MDL rather than copied.
+        """
+        return [
+            self._without_display_name({
+                **model,
+                "columns": [
+                    self._without_display_name(column) if isinstance(column, dict) else column
+                    for column in model.get("columns", [])
+                    if not (isinstance(column, dict) and "relationship" in column)
+                ]
+            })
+            for model in mdl.get("models", [])
+        ]
 
-        return cleaned
+    @staticmethod
+    def _without_display_name(resource: Dict[str, Any]) -> Dict[str, Any]:
+        properties = resource.get("properties")
+        if not isinstance(properties, dict) or "displayName" not in properties:
+            return resource
+        return {**resource, "properties": {k: v for k, v in properties.items() if k != "displayName"}}
 
     def _build_recommendation_prompt(
         self,
@@ -128,115 +278,51 @@ class RelationshipRecommendationPipeline:
         language: str
     ) -> str:
         """Build the prompt for relationship recommendations"""
+        # Compact JSON: indentation only costs encode time and prompt tokens
+        models_json = orjson.dumps(models).decode()
 
-        models_json = json.dumps(models, indent=2)
-
-        prompt = f"""
-You are an expert in database schema design and relationship recommendation.
-
-Given the following data models, analyze them and suggest appropriate relationships between them, but only if there are clear and beneficial relationships to recommend.
-
-### MODELS ###
-{models_json}
-
-### GUIDELINES ###
-1. Do not recommend relationships within the same model (fromModel and toModel must be different)
-2. Only suggest relationships if there is a clear and beneficial reason to do so
-3. If there are no good relationships to recommend, return an empty list
-4. Use "MANY_TO_ONE", "ONE_TO_MANY", or "ONE_TO_ONE" relationship types only
-5. Prefer "MANY_TO_ONE" and "ONE_TO_MANY" over "MANY_TO_MANY" relationships
-6. Look for common patterns like foreign keys (columns ending in _id, id suffixes)
-7. Consider columns with similar names that might reference each other
-8. Ensure both models and columns exist before recommending
-
-### RELATIONSHIP CRITERIA ###
-- Foreign key relationships (e.g., user_id in orders table → id in users table)
-- Common naming patterns (e.g., customer_id, product_id)
-- Logical business relationships between entities
-- Referential integrity opportunities
-
-### RESPONSE FORMAT ###
-Provide your response as a JSON object with this exact structure:
-
-{{
-    "relationships": [
-        {{
-            "name": "descriptive_relationship_name",
-            "fromModel": "source_model_name",
-            "fromColumn": "source_column_name",
-            "type": "MANY_TO_ONE|ONE_TO_MANY|ONE_TO_ONE",
-            "toModel": "target_model_name",
-            "toColumn": "target_column_name",
-            "reason": "clear_explanation_in_{language}"
-        }}
-    ]
-}}
-
-If no relationships are recommended, return:
-{{
-    "relationships": []
-}}
-
-### LANGUAGE ###
-Use {language} for the relationship name and reason fields.
-
-### INSTRUCTIONS ###
-Analyze the models carefully and suggest optimizations for their relationships. Consider best practices in database design, opportunities for normalization, indexing strategies, and relationships that could improve data integrity and enhance query performance.
-"""
-
-        return prompt
+        return _RECOMMENDATION_PROMPT.substitute(models_json=models_json, language=language)
 
     def _normalize_response(self, response: str) -> Dict[str, Any]:
         """Normalize and parse the LLM response"""
         try:
-            # Clean up the response
-            response = response.strip()
-
-            # Remove any markdown code blocks
-            response = response.replace("```json", "").replace("```", "")
-
-            # Try to find JSON in the response
-            start_idx = response.find("{")
-            end_idx = response.rfind("}") + 1
-
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = response[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
+            match = _JSON_BLOCK.search(response)
+            if match is None:
                 # If no JSON found, return empty relationships
                 return {"relationships": []}
 
-        except json.JSONDecodeError as e:
+            return orjson.loads(match.group(0))
+
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {e}")
             return {"relationships": []}
         except Exception as e:
             logger.error(f"Error normalizing response: {e}")
             return {"relationships": []}
 
+    def _model_columns(self, mdl: Dict[str, Any]) -> Dict[str, Set[str]]:
+        """Map each model name to its non-relationship column names"""
+        model_columns = {}
+        for model in mdl.get("models", []):
+            model_name = model.get("name")
+            if model_name:
+                model_columns[model_name] = {
+                    column if isinstance(column, str) else column["name"]
+                    for column in model.get("columns", [])
+                    if isinstance(column, str)
+                    or (isinstance(column, dict) and "name" in column and "relationship" not in column)
+                }
+        return model_columns
+
     def _validate_relationships(
         self,
         relationships: List[Dict[str, Any]],
-        original_mdl: Dict[str, Any]
+        model_columns: Dict[str, Set[str]]
     ) -> List[Dict[str, Any]]:
         """
-        Validate relationships against the original model definition
+        Validate relationships against the model columns from _model_columns
         Ensure models and columns exist and relationships are valid
         """
-        # Build model-column mapping for validation
-        model_columns = {}
-        for model in original_mdl.get("models", []):
-            model_name = model.get("name")
-            if model_name:
-                columns = set()
-                for column in model.get("columns", []):
-                    if isinstance(column, dict) and "name" in column:
-                        # Only include non-relationship columns
-                        if "relationship" not in column:
-                            columns.add(column["name"])
-                    elif isinstance(column, str):
-                        columns.add(column)
-                model_columns[model_name] = columns
-
         validated_relationships = []
 
         for relationship in relationships:
@@ -244,20 +330,18 @@ Analyze the models carefully and suggest optimizations for their relationships.
                 continue
 
             # Check required fields
-            required_fields = ["name", "fromModel", "fromColumn", "type", "toModel", "toColumn", "reason"]
-            if not all(field in relationship for field in required_fields):
+            if not _REQUIRED_RELATIONSHIP_FIELDS.issubset(relationship):
                 logger.warning(f"Relationship missing required fields: {relationship}")
                 continue
 
+            name, from_model, from_column, rel_type, to_model, to_column, reason = _relationship_fields(relationship)
+
             # Validate relationship type
-            if not RelationType.is_valid(relationship.get("type")):
-                logger.warning(f"Invalid relationship type: {relationship.get('type')}")
+            if not RelationType.is_valid(rel_type):
+                logger.warning(f"Invalid relationship type: {rel_type}")
                 continue
 
             # Validate models exist
-            from_model = relationship.get("fromModel")
-            to_model = relationship.get("toModel")
-
             if from_model not in model_columns:
                 logger.warning(f"From model '{from_model}' not found in schema")
                 continue
@@ -267,9 +351,6 @@ Analyze the models carefully and suggest optimizations for their relationships.
                 continue
 
             # Validate columns exist
-            from_column = relationship.get("fromColumn")
-            to_column = relationship.get("toColumn")
-
             if from_column not in model_columns[from_model]:
                 logger.warning(f"From column '{from_column}' not found in model '{from_model}'")
                 continue
@@ -285,13 +366,13 @@ Analyze the models carefully and suggest optimizations for their relationships.
 
             # All validations passed
             validated_relationships.append({
-                "name": relationship["name"],
+                "name": name,
                 "fromModel": from_model,
                 "fromColumn": from_column,
-                "type": relationship["type"],
+                "type": rel_type,
                 "toModel": to_model,
                 "toColumn": to_column,
-                "reason": relationship["reason"]
+                "reason": reason
             })
 
         logger.info(f"Validated {len(validated_relationships)} out of {len(relationships)} recommended relationships")
@@ -302,45 +383,48 @@ Analyze the models carefully and suggest optimizations for their relationships.
         Analyze the complexity of the model structure to help with relationship recommendations
         """
         models = mdl.get("models", [])
+        total_columns = 0
+        potential_foreign_keys = []
+        naming_patterns = defaultdict(list)
+        model_sizes = {}
 
-        analysis = {
-            "total_models": len(models),
-            "total_columns": 0,
-            "potential_foreign_keys": [],
-            "naming_patterns": {},
-            "model_sizes": {}
-        }
-
-        # Analyze each model
+        # Analyze each model in a single pass over its columns
         for model in models:
             model_name = model.get("name", "unknown")
-            columns = model.get("columns", [])
-
-            model_column_count = len([col for col in columns if "relationship" not in col])
-            analysis["total_columns"] += model_column_count
-            analysis["model_sizes"][model_name] = model_column_count
-
-            # Look for potential foreign key patterns
-            for column in columns:
-                if isinstance(column, dict) and "name" in column:
-                    col_name = column["name"]
-
-                    # Look for ID patterns
-                    if col_name.endswith("_id") or col_name == "id":
-                        analysis["potential_foreign_keys"].append({
-                            "model": model_name,
-                            "column": col_name,
-                            "pattern": "id_suffix" if col_name.endswith("_id") else "primary_key"
-                        })
-
-                    # Track naming patterns
-                    if "_" in col_name:
-                        prefix = col_name.split("_")[0]
-                        if prefix not in analysis["naming_patterns"]:
-                            analysis["naming_patterns"][prefix] = []
-                        analysis["naming_patterns"][prefix].append({
-                            "model": model_name,
-                            "column": col_name
-                        })
-
-        return analysis
\ No newline at end of file
+            model_column_count = 0
+
+            for column in model.get("columns", []):
+                if "relationship" not in column:
+                    model_column_count += 1
+
+                if not (isinstance(column, dict) and "name" in column):
+                    continue
+                col_name = column["name"]
+
+                # Look for ID patterns (snake_case, camelCase and PascalCase)
+                is_id_suffix = col_name.lower().endswith("_id") or _CAMEL_ID_SUFFIX.search(col_name) is not None
+                if is_id_suffix or col_name.lower() == "id":
+                    potential_foreign_keys.append({
+                        "model": model_name,
+                        "column": col_name,
+                        "pattern": "id_suffix" if is_id_suffix else "primary_key"
+                    })
+
+                # Track naming patterns
+                prefix, separator, _ = col_name.partition("_")
+                if separator:
+                    naming_patterns[prefix].append({
+                        "model": model_name,
+                        "column": col_name
+                    })
+
+            total_columns += model_column_count
+            model_sizes[model_name] = model_column_count
+
+        return {
+            "total_models": len(models),
+            "total_columns": total_columns,
+            "potential_foreign_keys": potential_foreign_keys,
+            "naming_patterns": dict(naming_patterns),
+            "model_sizes": model_sizes
+        }
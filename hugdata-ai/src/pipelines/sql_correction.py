@@ -1,13 +1,126 @@
+import asyncio
+import hashlib
 import logging
 import re
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 from dataclasses import dataclass
+from cachetools import TTLCache
+import orjson
+import regex
 from src.providers.llm_provider import LLMProvider
-from src.providers.vector_store import VectorStore
+from src.providers.vector_store import VectorStore, schema_collection
 
 logger = logging.getLogger("hugdata-ai")
 
-@dataclass
+# Compiled once at import; these run on every correction
+_RE_CORRECTED_SQL = regex.compile(r'CORRECTED_SQL:\s*(.*?)(?:\n\s*EXPLANATION:|$)', regex.DOTALL | regex.IGNORECASE)
+_RE_SQL_BLOCK = regex.compile(r'```sql\s*(.*?)```', regex.DOTALL | regex.IGNORECASE)
+_RE_SELECT = regex.compile(r'(SELECT.*?);?', regex.DOTALL | regex.IGNORECASE)
+_RE_EXPLANATION = regex.compile(r'EXPLANATION:\s*(.*?)(?:\n\s*CHANGES_MADE:|$)', regex.DOTALL | regex.IGNORECASE)
+# The whole CORRECTED_SQL / EXPLANATION / CHANGES_MADE layout in one scan; the
+# per-section patterns above are only needed when a response deviates from it
+_RE_RESPONSE = regex.compile(
+    r'CORRECTED_SQL:\s*(?P<sql>.*?)\n\s*EXPLANATION:\s*(?P<explanation>.*?)\n\s*CHANGES_MADE:',
+    regex.DOTALL | regex.IGNORECASE
+)
+_RE_CODE_FENCE = re.compile(r'```(?:sql)?\s*\n?', re.IGNORECASE)
+_RE_DANGEROUS = re.compile(r'\b(INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|TRUNCATE)\b', re.IGNORECASE)
+# Clauses reported in _analyze_error's sql_structure, found in one sweep of the lowercased SQL
+_RE_SQL_STRUCTURE = re.compile(
+    r'\b(?:(?P<has_select>select)|(?P<has_from>from)|(?P<has_where>where)'
+    r'|(?P<has_group_by>group\s+by)|(?P<has_order_by>order\s+by))\b'
+)
+
+# Structural keywords scored by _validate_correction, matched on the lowercased SQL
+_RE_STRUCTURE_KEYWORDS = re.compile(r'\b(select|from|limit)\b')
+_STRUCTURE_WEIGHTS = {'select': 0.1, 'from': 0.1, 'limit': 0.1}
+_DANGEROUS_KEYWORDS = ('insert', 'update', 'delete', 'drop', 'create', 'alter', 'truncate')
+_ERROR_PATTERNS = {
+    "syntax_error": ["syntax error", "unexpected token", "invalid syntax"],
+    "column_not_found": ["column", "doesn't exist", "unknown column"],
+    "table_not_found": ["table", "doesn't exist", "unknown table", "relation does not exist"],
+    "missing_group_by": ["group by", "not in group by", "aggregate"],
+    "unbalanced_parentheses": ["parenthes", "bracket", "missing"],
+    "join_error": ["join", "on clause", "ambiguous"],
+    "data_type_error": ["type", "conversion", "cast", "invalid type"],
+    "missing_from": ["from", "missing from clause"]
+}
+_NEEDLE_ERROR_TYPES: Dict[str, List[str]] = {}
+for _error_type, _patterns in _ERROR_PATTERNS.items():
+    for _pattern in _patterns:
+        _NEEDLE_ERROR_TYPES.setdefault(_pattern, []).append(_error_type)
+
+# All error needles in one scan; the lookahead reports overlapping hits, and
+# shortest-first ordering keeps a needle that prefixes a longer one
+_RE_ERROR_NEEDLES = re.compile(
+    "(?=(" + "|".join(re.escape(needle) for needle in sorted(_NEEDLE_ERROR_TYPES, key=len)) + "))"
+)
+
+# One scan tags each complexity indicator by its group name
+_RE_COMPLEXITY = re.compile(
+    r'(?P<joins>\bjoin\b)'
+    r'|(?P<subqueries>\(\s*select\b)'
+    r'|(?P<aggregates>\b(?:count|sum|avg|max|min|group_concat)\b)'
+    r'|(?P<unions>\bunion\b)'
+    r'|(?P<window_functions>\bover\s*\()'
+)
+
+
+def _schema_json(schema: Dict[str, Any]) -> bytes:
+    """Serialize a schema into a hashable key; table order is preserved"""
+    return orjson.dumps(schema, option=orjson.OPT_NON_STR_KEYS)
+
+
+@lru_cache(maxsize=128)
+def _format_schema_cached(schema_json: bytes) -> str:
+    """Format a serialized schema once; corrections against the same schema reuse it"""
+    return _format_schema(orjson.loads(schema_json))
+
+
+def _format_schema(schema: Dict[str, Any]) -> str:
+    """Render schema tables and columns as prompt text"""
+    if not schema or "tables" not in schema:
+        return "No schema information available"
+
+    return "\n\n".join(
+        f"Table: {table_name}\nColumns: {_format_columns(table_info)}"
+        for table_name, table_info in schema["tables"].items()
+    )
+
+
+def _format_columns(table_info: Any) -> str:
+    """Columns of one table as prompt text"""
+    if isinstance(table_info, list):
+        return ", ".join(table_info)
+    if isinstance(table_info, dict) and "columns" in table_info:
+        return ", ".join(
+            f"{col['name']} ({col.get('type', 'unknown')}){'' if col.get('nullable', True) else ' NOT NULL'}"
+            if isinstance(col, dict) else str(col)
+            for col in table_info["columns"]
+        )
+    return str(table_info)
+
+
+async def _no_results() -> List[Dict[str, Any]]:
+    return []
+
+
+# SQL correction rules, shared by every prompt
+_SQL_RULES = """
+1. Use proper ANSI SQL syntax
+2. Ensure all table and column names are properly quoted if needed
+3. Use correct JOIN syntax (JOIN ... ON ...)
+4. Ensure parentheses are balanced
+5. Use proper data type casting
+6. Ensure all referenced tables and columns exist in the schema
+7. Use proper GROUP BY clause when using aggregate functions
+8. Ensure HAVING clause is used correctly with GROUP BY
+9. Use proper ORDER BY syntax
+10. Add LIMIT clauses for data safety (max 1000 rows)
+"""
+
+@dataclass(slots=True, frozen=True)
 class SQLError:
     """Represents an SQL error with correction context"""
     sql: str
@@ -18,23 +131,19 @@ class SQLError:
 class SQLCorrectionPipeline:
     """Pipeline for correcting syntactically incorrect SQL queries"""
 
-    def __init__(self, llm_provider: LLMProvider, vector_store: VectorStore):
+    def __init__(
+        self,
+        llm_provider: LLMProvider,
+        vector_store: VectorStore,
+        result_cache_size: int = 1024,
+        result_cache_ttl: float = 3600
+    ):
         self.llm = llm_provider
         self.vector_store = vector_store
+        # Repeated (sql, error, project, schema) inputs reuse the earlier correction
+        self._results: TTLCache = TTLCache(maxsize=result_cache_size, ttl=result_cache_ttl)
 
-        # SQL correction rules and patterns
-        self.sql_rules = """
-1. Use proper ANSI SQL syntax
-2. Ensure all table and column names are properly quoted if needed
-3. Use correct JOIN syntax (JOIN ... ON ...)
-4. Ensure parentheses are balanced
-5. Use proper data type casting
-6. Ensure all referenced tables and columns exist in the schema
-7. Use proper GROUP BY clause when using aggregate functions
-8. Ensure HAVING clause is used correctly with GROUP BY
-9. Use proper ORDER BY syntax
-10. Add LIMIT clauses for data safety (max 1000 rows)
-"""
+        self.sql_rules = _SQL_RULES
 
     async def correct_sql(
         self,
@@ -55,25 +164,38 @@ class SQLCorrectionPipeline:
         Returns:
             Dict containing the corrected SQL and metadata
         """
+        cache_key = self._result_key(sql_error, schema, project_id)
+        cached = self._results.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            return {**cached, "corrections_applied": list(cached["corrections_applied"])}
+
         try:
             # 1. Analyze the error to understand the root cause
-            error_analysis = self._analyze_error(sql_error)
+            sql_lower = sql_error.sql.lower()
+            error_analysis = self._analyze_error(sql_error, sql_lower)
 
-            # 2. Retrieve relevant schema context if available
-            relevant_context = []
+            # 2. Retrieve relevant schema context if available, formatting the
+            # schema in a worker thread while the search is in flight
             if project_id and self.vector_store:
-                relevant_context = await self.vector_store.similarity_search(
+                context_search = self.vector_store.similarity_search(
                     query=f"SQL error: {sql_error.error} {sql_error.sql}",
-                    collection_name=f"schema_{project_id}",
+                    collection_name=schema_collection(project_id),
                     limit=5
                 )
+            else:
+                context_search = _no_results()
+            schema_info, relevant_context = await asyncio.gather(
+                asyncio.to_thread(self._format_schema_for_prompt, schema),
+                context_search
+            )
 
             # 3. Build correction prompt
             prompt = self._build_correction_prompt(
                 sql_error,
                 schema,
                 relevant_context,
-                error_analysis
+                error_analysis,
+                schema_info=schema_info
             )
 
             # 4. Generate corrected SQL
@@ -84,80 +206,80 @@ class SQLCorrectionPipeline:
             )
 
             # 5. Extract and validate corrected SQL
-            corrected_sql = self._extract_corrected_sql(response)
+            sections = _RE_RESPONSE.search(response)
+            corrected_sql = self._extract_corrected_sql(response, sections and sections.group('sql'))
 
             # 6. Validate the correction
             validation_result = self._validate_correction(
                 original_sql=sql_error.sql,
                 corrected_sql=corrected_sql,
-                schema=schema
+                schema=schema,
+                original_lower=sql_lower
             )
 
-            return {
+            result = {
                 "corrected_sql": corrected_sql,
                 "original_sql": sql_error.sql,
                 "original_error": sql_error.error,
-                "correction_explanation": self._extract_explanation(response),
+                "correction_explanation": self._extract_explanation(response, sections and sections.group('explanation')),
                 "confidence": validation_result["confidence"],
                 "validation_passed": validation_result["passed"],
                 "corrections_applied": validation_result["corrections"]
             }
+            if cache_key is not None:
+                self._results[cache_key] = {**result, "corrections_applied": list(result["corrections_applied"])}
+            return result
 
         except Exception as e:
             logger.error(f"SQL correction failed: {str(e)}")
             raise Exception(f"SQL correction failed: {str(e)}")
 
-    def _analyze_error(self, sql_error: SQLError) -> Dict[str, Any]:
-        """Analyze the SQL error to understand the root cause"""
+    @staticmethod
+    def _result_key(sql_error: SQLError, schema: Optional[Dict[str, Any]], project_id: Optional[str]) -> Optional[bytes]:
+        """Memo key for a correction; None when the schema cannot be serialized"""
+        try:
+            schema_key = _schema_json(schema) if schema else b""
+        except TypeError:
+            return None
+        if isinstance(schema_key, str):
+            schema_key = schema_key.encode()
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (sql_error.sql, sql_error.error, project_id or ""):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        digest.update(schema_key)
+        return digest.digest()
+
+    def _analyze_error(self, sql_error: SQLError, sql_lower: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze the SQL error to understand the root cause; `sql_lower` reuses an already lowercased SQL"""
         error_lower = sql_error.error.lower()
-        sql_lower = sql_error.sql.lower()
-
-        error_patterns = {
-            "syntax_error": ["syntax error", "unexpected token", "invalid syntax"],
-            "column_not_found": ["column", "doesn't exist", "unknown column"],
-            "table_not_found": ["table", "doesn't exist", "unknown table", "relation does not exist"],
-            "missing_group_by": ["group by", "not in group by", "aggregate"],
-            "unbalanced_parentheses": ["parenthes", "bracket", "missing"],
-            "join_error": ["join", "on clause", "ambiguous"],
-            "data_type_error": ["type", "conversion", "cast", "invalid type"],
-            "missing_from": ["from", "missing from clause"]
-        }
+        if sql_lower is None:
+            sql_lower = sql_error.sql.lower()
 
-        detected_errors = []
-        for error_type, patterns in error_patterns.items():
-            if any(pattern in error_lower for pattern in patterns):
-                detected_errors.append(error_type)
+        hit_types = {
+            error_type
+            for needle in _RE_ERROR_NEEDLES.findall(error_lower)
+            for error_type in _NEEDLE_ERROR_TYPES[needle]
+        }
+        detected_errors = [error_type for error_type in _ERROR_PATTERNS if error_type in hit_types]
 
         # Analyze SQL structure
-        has_select = "select" in sql_lower
-        has_from = "from" in sql_lower
-        has_where = "where" in sql_lower
-        has_group_by = "group by" in sql_lower
-        has_order_by = "order by" in sql_lower
+        sql_structure = dict.fromkeys(_RE_SQL_STRUCTURE.groupindex, False)
+        for match in _RE_SQL_STRUCTURE.finditer(sql_lower):
+            sql_structure[match.lastgroup] = True
 
         return {
             "detected_error_types": detected_errors,
             "primary_error_type": detected_errors[0] if detected_errors else "unknown",
-            "sql_structure": {
-                "has_select": has_select,
-                "has_from": has_from,
-                "has_where": has_where,
-                "has_group_by": has_group_by,
-                "has_order_by": has_order_by
-            },
-            "complexity": self._assess_query_complexity(sql_error.sql)
+            "sql_structure": sql_structure,
+            "complexity": self._assess_query_complexity(sql_error.sql, sql_lower)
         }
 
-    def _assess_query_complexity(self, sql: str) -> str:
+    def _assess_query_complexity(self, sql: str, sql_lower: Optional[str] = None) -> str:
         """Assess the complexity of the SQL query"""
-        sql_lower = sql.lower()
-        complexity_indicators = {
-            "joins": len(re.findall(r'\bjoin\b', sql_lower)),
-            "subqueries": len(re.findall(r'\(.*select.*\)', sql_lower)),
-            "aggregates": len(re.findall(r'\b(count|sum|avg|max|min|group_concat)\b', sql_lower)),
-            "unions": len(re.findall(r'\bunion\b', sql_lower)),
-            "window_functions": len(re.findall(r'\bover\s*\(', sql_lower))
-        }
+        complexity_indicators = dict.fromkeys(_RE_COMPLEXITY.groupindex, 0)
+        for match in _RE_COMPLEXITY.finditer(sql.lower() if sql_lower is None else sql_lower):
+            complexity_indicators[match.lastgroup] += 1
 
         total_complexity = sum(complexity_indicators.values())
 
@@ -173,11 +295,13 @@ class SQLCorrectionPipeline:
         sql_error: SQLError,
         schema: Dict[str, Any],
         context: List[Dict],
-        error_analysis: Dict[str, Any]
+        error_analysis: Dict[str, Any],
+        schema_info: Optional[str] = None
     ) -> str:
-        """Build the prompt for SQL correction"""
+        """Build the prompt for SQL correction; `schema_info` is the already formatted schema, if any"""
 
-        schema_info = self._format_schema_for_prompt(schema) if schema else "No schema information available"
+        if schema_info is None:
+            schema_info = self._format_schema_for_prompt(schema)
         context_info = self._format_context_for_prompt(context)
 
         prompt = f"""
@@ -231,27 +355,11 @@ CHANGES_MADE:
         if not schema or "tables" not in schema:
             return "No schema information available"
 
-        formatted_tables = []
-        for table_name, table_info in schema["tables"].items():
-            if isinstance(table_info, list):
-                columns = ", ".join(table_info)
-            elif isinstance(table_info, dict) and "columns" in table_info:
-                columns = []
-                for col in table_info["columns"]:
-                    if isinstance(col, dict):
-                        col_str = f"{col['name']} ({col.get('type', 'unknown')})"
-                        if not col.get('nullable', True):
-                            col_str += " NOT NULL"
-                        columns.append(col_str)
-                    else:
-                        columns.append(str(col))
-                columns = ", ".join(columns)
-            else:
-                columns = str(table_info)
-
-            formatted_tables.append(f"Table: {table_name}\nColumns: {columns}")
-
-        return "\n\n".join(formatted_tables)
+        try:
+            schema_json = _schema_json(schema)
+        except TypeError:
+            return _format_schema(schema)
+        return _format_schema_cached(schema_json)
 
     def _format_context_for_prompt(self, context: List[Dict]) -> str:
         """Format context information for the correction prompt"""
@@ -267,20 +375,22 @@ CHANGES_MADE:
 
         return "\n".join(formatted_context) if formatted_context else "No relevant context available"
 
-    def _extract_corrected_sql(self, response: str) -> str:
-        """Extract the corrected SQL from the LLM response"""
+    def _extract_corrected_sql(self, response: str, sql_section: Optional[str] = None) -> str:
+        """Extract the corrected SQL from the LLM response; `sql_section` is the CORRECTED_SQL: section if already parsed"""
         # Look for CORRECTED_SQL: section
-        sql_match = re.search(r'CORRECTED_SQL:\s*(.*?)(?:\n\s*EXPLANATION:|$)', response, re.DOTALL | re.IGNORECASE)
-        if sql_match:
+        sql_match = None if sql_section is not None else _RE_CORRECTED_SQL.search(response)
+        if sql_section is not None:
+            sql = sql_section.strip()
+        elif sql_match:
             sql = sql_match.group(1).strip()
         else:
             # Fallback: look for SQL blocks
-            sql_block_match = re.search(r'```sql\s*(.*?)```', response, re.DOTALL | re.IGNORECASE)
+            sql_block_match = _RE_SQL_BLOCK.search(response)
             if sql_block_match:
                 sql = sql_block_match.group(1).strip()
             else:
                 # Last resort: look for SELECT statements
-                select_match = re.search(r'(SELECT.*?);?', response, re.DOTALL | re.IGNORECASE)
+                select_match = _RE_SELECT.search(response)
                 if select_match:
                     sql = select_match.group(1).strip()
                 else:
@@ -293,8 +403,7 @@ CHANGES_MADE:
     def _clean_sql(self, sql: str) -> str:
         """Clean and validate the corrected SQL"""
         # Remove markdown code blocks if present
-        sql = re.sub(r'```sql\s*\n?', '', sql, flags=re.IGNORECASE)
-        sql = re.sub(r'```\s*\n?', '', sql)
+        sql = _RE_CODE_FENCE.sub('', sql)
 
         # Remove extra whitespace
         sql = " ".join(sql.split())
@@ -304,18 +413,18 @@ CHANGES_MADE:
             sql += ';'
 
         # Basic security check
-        import re as _re
-        dangerous_keywords = ['INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE']
-        sql_upper = sql.upper()
-        for keyword in dangerous_keywords:
-            if _re.search(rf"\b{keyword}\b", sql_upper):
-                raise ValueError(f"Dangerous SQL keyword detected in correction: {keyword}")
+        dangerous_match = _RE_DANGEROUS.search(sql)
+        if dangerous_match:
+            raise ValueError(f"Dangerous SQL keyword detected in correction: {dangerous_match.group(1).upper()}")
 
         return sql
 
-    def _extract_explanation(self, response: str) -> str:
-        """Extract the explanation from the LLM response"""
-        explanation_match = re.search(r'EXPLANATION:\s*(.*?)(?:\n\s*CHANGES_MADE:|$)', response, re.DOTALL | re.IGNORECASE)
+    def _extract_explanation(self, response: str, explanation_section: Optional[str] = None) -> str:
+        """Extract the explanation from the LLM response; `explanation_section` is the EXPLANATION: section if already parsed"""
+        if explanation_section is not None:
+            return explanation_section.strip()
+
+        explanation_match = _RE_EXPLANATION.search(response)
         if explanation_match:
             return explanation_match.group(1).strip()
 
@@ -325,9 +434,10 @@ CHANGES_MADE:
         self,
         original_sql: str,
         corrected_sql: str,
-        schema: Dict[str, Any]
+        schema: Dict[str, Any],
+        original_lower: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Validate the corrected SQL"""
+        """Validate the corrected SQL; `original_lower` reuses an already lowercased original"""
         validation_result = {
             "passed": True,
             "confidence": 0.5,
@@ -337,32 +447,31 @@ CHANGES_MADE:
 
         try:
             # Check if the corrected SQL is different from original
-            if original_sql.strip().lower() == corrected_sql.strip().lower():
+            if original_lower is None:
+                original_lower = original_sql.lower()
+            sql_lower = corrected_sql.lower()
+            if original_lower.strip() == sql_lower.strip():
                 validation_result["issues"].append("No changes were made to the original SQL")
                 validation_result["confidence"] = 0.2
             else:
                 validation_result["corrections"].append("SQL syntax was modified")
                 validation_result["confidence"] += 0.2
 
-            # Check for basic SQL structure
-            sql_lower = corrected_sql.lower()
-            if 'select' in sql_lower:
-                validation_result["confidence"] += 0.1
-            if 'from' in sql_lower:
-                validation_result["confidence"] += 0.1
-
-            # Check for safety measures
-            if 'limit' in sql_lower:
+            # Check for basic SQL structure and safety measures
+            keywords = set(_RE_STRUCTURE_KEYWORDS.findall(sql_lower))
+            validation_result["confidence"] += sum(_STRUCTURE_WEIGHTS[keyword] for keyword in keywords)
+            if 'limit' in keywords:
                 validation_result["corrections"].append("Added LIMIT clause for safety")
-                validation_result["confidence"] += 0.1
 
             # Check for dangerous operations
-            dangerous_keywords = ['insert', 'update', 'delete', 'drop', 'create', 'alter', 'truncate']
-            for keyword in dangerous_keywords:
-                if keyword in sql_lower:
-                    validation_result["passed"] = False
-                    validation_result["issues"].append(f"Contains dangerous keyword: {keyword}")
-                    validation_result["confidence"] = 0.0
+            dangerous_found = {match.group(1).lower() for match in _RE_DANGEROUS.finditer(corrected_sql)}
+            if dangerous_found:
+                validation_result["passed"] = False
+                validation_result["issues"].extend(
+                    f"Contains dangerous keyword: {keyword}"
+                    for keyword in _DANGEROUS_KEYWORDS if keyword in dangerous_found
+                )
+                validation_result["confidence"] = 0.0
 
             # Ensure confidence doesn't exceed 1.0
             validation_result["confidence"] = min(validation_result["confidence"], 1.0)
@@ -1,8 +1,31 @@
-from typing import Dict, Any, List
+from typing import AsyncIterator, Dict, Any, List, Optional
+import asyncio
 import re
-import sqlparse
+import regex
 from src.providers.llm_provider import LLMProvider
-from src.providers.vector_store import VectorStore
+from src.providers.vector_store import VectorStore, schema_collection
+
+# Compiled once at import; these run on every generation
+_RE_SQL_SECTION = regex.compile(r'SQL:\s*(.*?)(?:\n\s*EXPLANATION:|$)', regex.DOTALL | regex.IGNORECASE)
+_RE_SELECT = regex.compile(r'(SELECT.*?);?', regex.DOTALL | regex.IGNORECASE)
+_RE_CODE_FENCE = re.compile(r'```(?:sql)?\s*\n?', re.IGNORECASE)
+_RE_DANGEROUS = re.compile(r'\b(INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|TRUNCATE)\b', re.IGNORECASE)
+_RE_REASONING = regex.compile(r'REASONING:\s*(.*)', regex.DOTALL | regex.IGNORECASE)
+# The whole SQL / EXPLANATION / REASONING layout in one scan; the per-section
+# patterns above are only needed when a response deviates from it
+_RE_RESPONSE = regex.compile(
+    r'SQL:\s*(?P<sql>.*?)\n\s*EXPLANATION:.*?\n\s*REASONING:\s*(?P<reasoning>.*)',
+    regex.DOTALL | regex.IGNORECASE
+)
+_RE_FROM_CLAUSE = re.compile(
+    r'\bFROM\b(.+?)(?=\b(?:WHERE|GROUP\s+BY|ORDER\s+BY|LIMIT|HAVING|UNION)\b|;|$)',
+    re.DOTALL | re.IGNORECASE
+)
+# Structural keywords scored by _calculate_confidence; "where" only counts when the question asks for it
+_RE_CONFIDENCE_KEYWORDS = re.compile(r'\b(select|from|where|limit)\b', re.IGNORECASE)
+_CONFIDENCE_WEIGHTS = {'select': 0.1, 'from': 0.1, 'limit': 0.1}
+# First name after the clause start, each comma and each JOIN; aliases and ON conditions are skipped
+_RE_FROM_TABLE = re.compile(r'(?:^|,|\bJOIN\b)\s*([\w.`"\[\]]+)', re.IGNORECASE)
 
 class SQLGenerationPipeline:
     def __init__(self, llm_provider: LLMProvider, vector_store: VectorStore):
@@ -22,18 +45,8 @@ class SQLGenerationPipeline:
         Generate SQL from natural language using RAG approach
         """
         try:
-            # Get project_id from context or parameter
-            project_id = project_id or context.get('project_id', 'default')
-            
-            # 1. Retrieve relevant schema context
-            relevant_context = await self.vector_store.similarity_search(
-                query=query,
-                collection_name=f"schema_{project_id}",
-                limit=10,
-            )
-            
-            # 2. Build prompt with context
-            prompt = self._build_sql_prompt(query, schema, relevant_context)
+            # 1-2. Retrieve relevant schema context and build prompt
+            prompt = await self._prepare_prompt(query, schema, context, project_id)
             
             # 3. Generate SQL using LLM
             response = await self.llm.generate(
@@ -42,27 +55,80 @@ class SQLGenerationPipeline:
                 temperature=0.1
             )
             
-            # 4. Extract and validate SQL
-            sql = self._extract_sql_from_response(response)
+            # 4-5. Extract, validate and score SQL
+            return self._build_result(response, schema, query)
+            
+        except Exception as e:
+            raise Exception(f"SQL generation failed: {str(e)}")
+
+    async def generate_sql_stream(
+        self,
+        query: str,
+        schema: Dict[str, Any] = None,
+        context: Dict[str, Any] = None,
+        project_id: str = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream SQL generation: yields token chunks as they arrive, then a final result
+        """
+        try:
+            prompt = await self._prepare_prompt(query, schema, context, project_id)
             
-            # 5. Calculate confidence based on various factors
-            confidence = self._calculate_confidence(sql, schema, query)
+            chunks: List[str] = []
+            async for token in self.llm.generate_stream(
+                prompt=prompt,
+                max_tokens=1000,
+                temperature=0.1
+            ):
+                chunks.append(token)
+                yield {"type": "token", "content": token}
             
-            return {
-                "sql": sql,
-                "confidence": confidence,
-                "explanation": self._generate_explanation(sql, query),
-                "reasoning_steps": self._extract_reasoning_steps(response)
-            }
+            yield {"type": "result", **self._build_result("".join(chunks), schema, query)}
             
         except Exception as e:
             raise Exception(f"SQL generation failed: {str(e)}")
+
+    async def _prepare_prompt(
+        self,
+        query: str,
+        schema: Dict[str, Any],
+        context: Dict[str, Any],
+        project_id: str
+    ) -> str:
+        """Retrieve relevant schema context and build the generation prompt"""
+        # Get project_id from context or parameter
+        project_id = project_id or (context or {}).get('project_id', 'default')
+        
+        # Format the schema in a worker thread while the search is in flight
+        schema_info, relevant_context = await asyncio.gather(
+            asyncio.to_thread(self._format_schema_for_prompt, schema),
+            self.vector_store.similarity_search(
+                query=query,
+                collection_name=schema_collection(project_id),
+                limit=10,
+            )
+        )
+        
+        return self._build_sql_prompt(query, schema, relevant_context, schema_info=schema_info)
+
+    def _build_result(self, response: str, schema: Dict[str, Any], query: str) -> Dict[str, Any]:
+        """Extract SQL from the LLM response and attach confidence and explanation"""
+        sections = _RE_RESPONSE.search(response)
+        sql = self._extract_sql_from_response(response, sections and sections.group('sql'))
+        
+        return {
+            "sql": sql,
+            "confidence": self._calculate_confidence(sql, schema, query),
+            "explanation": self._generate_explanation(sql, query),
+            "reasoning_steps": self._extract_reasoning_steps(response, sections and sections.group('reasoning'))
+        }
     
-    def _build_sql_prompt(self, query: str, schema: Dict, context: List) -> str:
-        """Build optimized prompt for SQL generation"""
+    def _build_sql_prompt(self, query: str, schema: Dict, context: List, schema_info: Optional[str] = None) -> str:
+        """Build optimized prompt for SQL generation; `schema_info` is the already formatted schema, if any"""
         
         # Format schema information
-        schema_info = self._format_schema_for_prompt(schema)
+        if schema_info is None:
+            schema_info = self._format_schema_for_prompt(schema)
         
         # Format context information
         context_info = self._format_context_for_prompt(context)
@@ -97,29 +163,25 @@ REASONING: [step by step reasoning for your approach]
         if not schema or "tables" not in schema:
             return "No schema information available"
         
-        formatted_tables = []
-        for table_name, table_info in schema["tables"].items():
-            if isinstance(table_info, list):
-                # Simple list of column names
-                columns = ", ".join(table_info)
-            elif isinstance(table_info, dict) and "columns" in table_info:
-                # Detailed column information
-                columns = []
-                for col in table_info["columns"]:
-                    if isinstance(col, dict):
-                        col_str = f"{col['name']} ({col.get('type', 'unknown')})"
-                        if not col.get('nullable', True):
-                            col_str += " NOT NULL"
-                        columns.append(col_str)
-                    else:
-                        columns.append(str(col))
-                columns = ", ".join(columns)
-            else:
-                columns = str(table_info)
-            
-            formatted_tables.append(f"Table: {table_name}\nColumns: {columns}")
-        
-        return "\n\n".join(formatted_tables)
+        return "\n\n".join(
+            f"Table: {table_name}\nColumns: {self._format_columns(table_info)}"
+            for table_name, table_info in schema["tables"].items()
+        )
+    
+    @staticmethod
+    def _format_columns(table_info: Any) -> str:
+        """Columns of one table as prompt text"""
+        if isinstance(table_info, list):
+            # Simple list of column names
+            return ", ".join(table_info)
+        if isinstance(table_info, dict) and "columns" in table_info:
+            # Detailed column information
+            return ", ".join(
+                f"{col['name']} ({col.get('type', 'unknown')}){'' if col.get('nullable', True) else ' NOT NULL'}"
+                if isinstance(col, dict) else str(col)
+                for col in table_info["columns"]
+            )
+        return str(table_info)
     
     def _format_context_for_prompt(self, context: List[Dict]) -> str:
         """Format context information for the prompt"""
@@ -137,15 +199,17 @@ REASONING: [step by step reasoning for your approach]
         
         return "\n".join(formatted_context) if formatted_context else "No relevant context available"
     
-    def _extract_sql_from_response(self, response: str) -> str:
-        """Extract SQL query from LLM response"""
+    def _extract_sql_from_response(self, response: str, sql_section: Optional[str] = None) -> str:
+        """Extract SQL query from LLM response; `sql_section` is the SQL: section if already parsed"""
         # Look for SQL: prefix
-        sql_match = re.search(r'SQL:\s*(.*?)(?:\n\s*EXPLANATION:|$)', response, re.DOTALL | re.IGNORECASE)
-        if sql_match:
+        sql_match = None if sql_section is not None else _RE_SQL_SECTION.search(response)
+        if sql_section is not None:
+            sql = sql_section.strip()
+        elif sql_match:
             sql = sql_match.group(1).strip()
         else:
             # Fallback: look for SELECT statements
-            select_match = re.search(r'(SELECT.*?);?', response, re.DOTALL | re.IGNORECASE)
+            select_match = _RE_SELECT.search(response)
             if select_match:
                 sql = select_match.group(1).strip()
             else:
@@ -159,8 +223,7 @@ REASONING: [step by step reasoning for your approach]
     def _clean_sql(self, sql: str) -> str:
         """Clean and validate SQL query"""
         # Remove markdown code blocks if present
-        sql = re.sub(r'```sql\s*\n?', '', sql, flags=re.IGNORECASE)
-        sql = re.sub(r'```\s*\n?', '', sql)
+        sql = _RE_CODE_FENCE.sub('', sql)
         
         # Remove extra whitespace
         sql = " ".join(sql.split())
@@ -170,12 +233,9 @@ REASONING: [step by step reasoning for your approach]
             sql += ';'
         
         # Basic security check - ensure it's a read-only query
-        import re as _re
-        dangerous_keywords = ['INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE']
-        sql_upper = sql.upper()
-        for keyword in dangerous_keywords:
-            if _re.search(rf"\b{keyword}\b", sql_upper):
-                raise ValueError(f"Dangerous SQL keyword detected: {keyword}")
+        dangerous_match = _RE_DANGEROUS.search(sql)
+        if dangerous_match:
+            raise ValueError(f"Dangerous SQL keyword detected: {dangerous_match.group(1).upper()}")
         
         return sql
     
@@ -184,22 +244,14 @@ REASONING: [step by step reasoning for your approach]
         confidence = 0.5  # Base confidence
         
         try:
-            # Check if SQL parses correctly
-            parsed = sqlparse.parse(sql)
-            if parsed:
+            # Cheap validity check: a query statement with balanced parentheses
+            if sql.lstrip()[:6].upper().startswith(('SELECT', 'WITH')) and sql.count('(') == sql.count(')'):
                 confidence += 0.2
             
             # Check if it contains expected keywords based on query
-            query_lower = query.lower()
-            sql_lower = sql.lower()
-            
-            if 'select' in sql_lower:
-                confidence += 0.1
-            if 'from' in sql_lower:
-                confidence += 0.1
-            if 'where' in query_lower and 'where' in sql_lower:
-                confidence += 0.1
-            if 'limit' in sql_lower:
+            keywords = {match.group(1).lower() for match in _RE_CONFIDENCE_KEYWORDS.finditer(sql)}
+            confidence += sum(_CONFIDENCE_WEIGHTS.get(keyword, 0) for keyword in keywords)
+            if 'where' in keywords and 'where' in query.lower():
                 confidence += 0.1
             
             # Ensure confidence doesn't exceed 1.0
@@ -213,36 +265,26 @@ REASONING: [step by step reasoning for your approach]
     def _generate_explanation(self, sql: str, original_query: str) -> str:
         """Generate a human-readable explanation of the SQL query"""
         try:
-            parsed = sqlparse.parse(sql)[0]
-            tokens = list(parsed.flatten())
-            
+            sql_upper = sql.upper()
             explanation = f"This query was generated to answer: '{original_query}'. "
             
             # Basic explanation based on SQL structure
-            if any(token.ttype is sqlparse.tokens.Keyword and token.value.upper() == 'SELECT' for token in tokens):
-                explanation += "It retrieves data "
+            if 'SELECT' in sql_upper:
+                explanation += "It retrieves data"
             
-            from_tables = []
-            in_from_clause = False
-            for token in tokens:
-                if token.ttype is sqlparse.tokens.Keyword and token.value.upper() == 'FROM':
-                    in_from_clause = True
-                    continue
-                elif token.ttype is sqlparse.tokens.Keyword and token.value.upper() in ['WHERE', 'GROUP', 'ORDER', 'LIMIT']:
-                    in_from_clause = False
-                elif in_from_clause and token.ttype is None and token.value.strip():
-                    from_tables.append(token.value.strip())
+            from_match = _RE_FROM_CLAUSE.search(sql)
+            from_tables = _RE_FROM_TABLE.findall(from_match.group(1).strip()) if from_match else []
             
             if from_tables:
-                explanation += f"from the {', '.join(from_tables)} table(s)"
+                explanation += f" from the {', '.join(from_tables)} table(s)"
             
-            if 'WHERE' in sql.upper():
+            if 'WHERE' in sql_upper:
                 explanation += " with specific filtering conditions"
             
-            if 'ORDER BY' in sql.upper():
+            if 'ORDER BY' in sql_upper:
                 explanation += " and sorts the results"
             
-            if 'LIMIT' in sql.upper():
+            if 'LIMIT' in sql_upper:
                 explanation += " with a limit on the number of rows returned"
             
             return explanation + "."
@@ -250,11 +292,13 @@ REASONING: [step by step reasoning for your approach]
         except Exception:
             return f"This query was generated to answer: '{original_query}'"
     
-    def _extract_reasoning_steps(self, response: str) -> List[str]:
-        """Extract reasoning steps from LLM response"""
-        reasoning_match = re.search(r'REASONING:\s*(.*)', response, re.DOTALL | re.IGNORECASE)
-        if reasoning_match:
-            reasoning_text = reasoning_match.group(1).strip()
+    def _extract_reasoning_steps(self, response: str, reasoning_section: Optional[str] = None) -> List[str]:
+        """Extract reasoning steps from LLM response; `reasoning_section` is the REASONING: section if already parsed"""
+        if reasoning_section is None:
+            reasoning_match = _RE_REASONING.search(response)
+            reasoning_section = reasoning_match.group(1) if reasoning_match else None
+        if reasoning_section is not None:
+            reasoning_text = reasoning_section.strip()
             # Split by lines and clean up
             steps = [step.strip('- ').strip() for step in reasoning_text.split('\n') if step.strip()]
             return steps[:5]  # Limit to 5 steps
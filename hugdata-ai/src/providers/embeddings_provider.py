@@ -1,6 +1,9 @@
+import asyncio
+import functools
 import logging
+import os
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, List, Optional, Set, Tuple
 import openai
 import numpy as np
 
@@ -46,6 +49,75 @@ class EmbeddingsProvider(ABC):
         pass
 
 
+def embedding_model_name(provider: EmbeddingsProvider) -> str:
+    """Name of the model behind a provider, for keying cached embeddings"""
+    name = getattr(provider, "model_name", None) or getattr(provider, "model", None)
+    return name if isinstance(name, str) else type(provider).__name__
+
+
+class EmbeddingBatcher(EmbeddingsProvider):
+    """
+    Coalesce concurrent embed_documents calls into shared provider calls
+
+    Texts are collected until `max_batch` are pending or `max_wait_ms` has passed
+    since the first one, then embedded in a single call to the wrapped provider.
+    Wrap one provider and share the batcher so that many small requests (e.g.
+    several projects indexing at once) use one rate-limited call between them.
+    """
+
+    def __init__(self, inner: EmbeddingsProvider, max_batch: int = 256, max_wait_ms: float = 50.0):
+        self.inner = inner
+        self.model_name = embedding_model_name(inner)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    def submit(self, text: str) -> asyncio.Future:
+        """Queue one text; the future resolves to its embedding"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.max_wait, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._embed_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            embeddings = await self.inner.embed_documents([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            # A caller may have been cancelled while the batch was in flight
+            if not future.done():
+                future.set_result(embedding)
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.submit(text) for text in texts)))
+
+    async def embed_query(self, text: str) -> List[float]:
+        return await self.inner.embed_query(text)
+
+    def get_embedding_dimension(self) -> int:
+        return self.inner.get_embedding_dimension()
+
+
 class NotConfiguredEmbeddingsProvider(EmbeddingsProvider):
     """Embeddings provider that raises clear configuration errors."""
 
@@ -72,28 +144,46 @@ class NotConfiguredEmbeddingsProvider(EmbeddingsProvider):
 class OpenAIEmbeddingsProvider(EmbeddingsProvider):
     """OpenAI embeddings provider using text-embedding-ada-002"""
 
-    def __init__(self, api_key: str, model: str = "text-embedding-ada-002"):
-        self.client = openai.AsyncOpenAI(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "text-embedding-ada-002",
+        chunk_size: int = 100,
+        max_concurrent_batches: int = 16,
+        max_retries: int = 2
+    ):
+        # The client retries each request on 429/5xx with jittered exponential
+        # backoff, so a rate-limited batch is retried alone, still holding its slot
+        self.client = openai.AsyncOpenAI(api_key=api_key, max_retries=max_retries)
         self.model = model
         self.dimension = 1536  # text-embedding-ada-002 dimension
+        self.chunk_size = chunk_size  # OpenAI API has a limit on batch size
+        self.max_concurrent_batches = max_concurrent_batches
 
     async def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for multiple documents"""
         try:
-            # OpenAI API has a limit on batch size
-            batch_size = 100
-            all_embeddings = []
-
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-
-                response = await self.client.embeddings.create(
-                    input=batch,
-                    model=self.model
-                )
-
-                batch_embeddings = [data.embedding for data in response.data]
-                all_embeddings.extend(batch_embeddings)
+            # Group texts of similar length into the same batch, then dispatch
+            # batches concurrently (bounded to respect rate limits)
+            order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+            batches = [order[i:i + self.chunk_size] for i in range(0, len(order), self.chunk_size)]
+            semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+
+            async def embed_batch(indices: List[int]) -> List[List[float]]:
+                async with semaphore:
+                    response = await self.client.embeddings.create(
+                        input=[texts[i] for i in indices],
+                        model=self.model
+                    )
+                return [data.embedding for data in response.data]
+
+            batch_results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+
+            # Restore input order
+            all_embeddings: List[List[float]] = [None] * len(texts)
+            for indices, batch_embeddings in zip(batches, batch_results):
+                for i, embedding in zip(indices, batch_embeddings):
+                    all_embeddings[i] = embedding
 
             logger.info(f"Generated embeddings for {len(texts)} documents")
             return all_embeddings
@@ -126,30 +216,22 @@ class MockEmbeddingsProvider(EmbeddingsProvider):
     def __init__(self, dimension: int = 1536):
         self.dimension = dimension
 
+    def _vectors(self, texts: List[str]) -> np.ndarray:
+        """Deterministic but varied embeddings, one private generator per text hash"""
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            out[i] = np.random.default_rng(hash(text) & 0xFFFFFFFF).standard_normal(self.dimension, dtype=np.float32)
+        return out
+
     async def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Generate mock embeddings for documents"""
         logger.info(f"Generating mock embeddings for {len(texts)} documents")
-
-        embeddings = []
-        for text in texts:
-            # Generate deterministic but varied embeddings based on text hash
-            hash_value = hash(text)
-            np.random.seed(hash_value % (2**32))  # Ensure positive seed
-            embedding = np.random.normal(0, 1, self.dimension).tolist()
-            embeddings.append(embedding)
-
-        return embeddings
+        return self._vectors(texts).tolist()
 
     async def embed_query(self, text: str) -> List[float]:
         """Generate mock embedding for a query"""
         logger.info(f"Generating mock embedding for query: {text[:50]}...")
-
-        # Generate deterministic embedding based on text hash
-        hash_value = hash(text)
-        np.random.seed(hash_value % (2**32))  # Ensure positive seed
-        embedding = np.random.normal(0, 1, self.dimension).tolist()
-
-        return embedding
+        return self._vectors([text])[0].tolist()
 
     def get_embedding_dimension(self) -> int:
         """Get the embedding dimension"""
@@ -158,18 +240,56 @@ class MockEmbeddingsProvider(EmbeddingsProvider):
 class HuggingFaceEmbeddingsProvider(EmbeddingsProvider):
     """HuggingFace embeddings provider for local models"""
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    _QUANTIZED_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_size: int = 64,
+        backend: str = "torch",
+        quantize: bool = False,
+        cache_dir: str = "~/.cache/hugdata/onnx"
+    ):
+        """
+        `backend="onnx"` (or "openvino") runs inference through sentence-transformers'
+        ONNX Runtime backend instead of eager PyTorch; with `quantize`, an int8
+        dynamically quantized ONNX export (AVX-512 VNNI kernels) is built once under
+        `cache_dir` and reused by later instances.
+        """
+        if backend not in ("torch", "onnx", "openvino"):
+            raise ValueError(f"Unsupported embeddings backend: {backend}")
+        if quantize and backend != "onnx":
+            raise ValueError("quantize requires the onnx backend")
+        self.batch_size = batch_size
         try:
             from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer(model_name)
+            self.model_name = model_name
+            if quantize:
+                self.model = self._load_quantized_onnx(SentenceTransformer, model_name, cache_dir)
+            elif backend != "torch":
+                self.model = SentenceTransformer(model_name, backend=backend)
+            else:
+                self.model = SentenceTransformer(model_name)
             self.dimension = self.model.get_sentence_embedding_dimension()
-            logger.info(f"Initialized HuggingFace embeddings with model: {model_name}")
+            logger.info(f"Initialized HuggingFace embeddings with model: {model_name} ({backend} backend)")
         except ImportError:
             raise ImportError(
                 "sentence-transformers is required for HuggingFaceEmbeddingsProvider. "
-                "Install it with: pip install sentence-transformers"
+                "Install it with: pip install sentence-transformers "
+                "(sentence-transformers[onnx] for the onnx backend)"
             )
 
+    @classmethod
+    def _load_quantized_onnx(cls, sentence_transformer: type, model_name: str, cache_dir: str) -> Any:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        save_dir = os.path.join(os.path.expanduser(cache_dir), model_name.replace("/", "__"))
+        if not os.path.exists(os.path.join(save_dir, cls._QUANTIZED_ONNX_FILE)):
+            model = sentence_transformer(model_name, backend="onnx")
+            model.save(save_dir)
+            export_dynamic_quantized_onnx_model(model, "avx512_vnni", save_dir)
+        return sentence_transformer(save_dir, backend="onnx", model_kwargs={"file_name": cls._QUANTIZED_ONNX_FILE})
+
     async def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for documents using HuggingFace model"""
         try:
@@ -177,10 +297,17 @@ class HuggingFaceEmbeddingsProvider(EmbeddingsProvider):
             import asyncio
             loop = asyncio.get_event_loop()
 
+            # encode() already orders texts by length so each sub-batch pads to
+            # similar lengths, and returns them in input order
             embeddings = await loop.run_in_executor(
                 None,
-                self.model.encode,
-                texts
+                functools.partial(
+                    self.model.encode,
+                    texts,
+                    batch_size=self.batch_size,
+                    show_progress_bar=False,
+                    convert_to_numpy=True
+                )
             )
 
             logger.info(f"Generated HuggingFace embeddings for {len(texts)} documents")
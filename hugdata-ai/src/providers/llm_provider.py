@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import AsyncIterator, Optional
 import openai
 import asyncio
 
@@ -10,6 +10,10 @@ class LLMProvider(ABC):
     async def generate(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.1) -> str:
         pass
 
+    async def generate_stream(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.1) -> AsyncIterator[str]:
+        """Yield the completion in chunks; providers without streaming yield it whole"""
+        yield await self.generate(prompt=prompt, max_tokens=max_tokens, temperature=temperature)
+
 
 class NotConfiguredLLMProvider(LLMProvider):
     """LLM provider that raises clear configuration errors."""
@@ -46,6 +50,25 @@ class OpenAIProvider(LLMProvider):
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
 
+    async def generate_stream(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.1) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "You are a helpful SQL generation assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+
 class MockLLMProvider(LLMProvider):
     """Mock LLM Provider for testing"""
     
@@ -1,9 +1,42 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import Awaitable, Callable, List, Dict, Any, NamedTuple, Optional, Sequence, Set, Tuple, TypeVar
+import asyncio
+import functools
+import hashlib
+import json
 import logging
 
+import numpy as np
+from cachetools import TTLCache
+
 logger = logging.getLogger("hugdata-ai")
 
+T = TypeVar("T")
+
+
+class SearchQuery(NamedTuple):
+    """One similarity search within a batch against a single collection"""
+    query: str
+    limit: int = 10
+    filters: Optional[Dict[str, Any]] = None
+
+
+class CollectionNotFoundError(Exception):
+    """Raised by read operations on a collection that does not exist."""
+
+
+def _matches(metadata: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """Filter semantics shared by stores: all keys must match; a list value matches any of its items"""
+    return all(
+        metadata.get(k) in v if isinstance(v, (list, tuple, set)) else metadata.get(k) == v
+        for k, v in (filters or {}).items()
+    )
+
+
+def _is_not_found(error: Exception) -> bool:
+    # REST errors carry the HTTP status; gRPC errors only describe it
+    return getattr(error, "status_code", None) == 404 or "not found" in str(error).lower()
+
 
 class VectorStore(ABC):
     """Abstract base class for vector stores"""
@@ -19,13 +52,28 @@ class VectorStore(ABC):
         """Semantic search by query text; may require embeddings provider."""
         raise NotImplementedError
 
+    async def similarity_search_batch(
+        self, collection_name: str, queries: Sequence[SearchQuery]
+    ) -> List[List[Dict[str, Any]]]:
+        """Run several searches against one collection; results follow `queries` order."""
+        return list(await asyncio.gather(
+            *(self.similarity_search(q.query, collection_name, limit=q.limit, filters=q.filters) for q in queries)
+        ))
+
     @abstractmethod
-    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]]) -> bool:
-        """Bulk add documents (expects precomputed embeddings in `embedding`)."""
+    async def add_documents(
+        self, collection_name: str, documents: List[Dict[str, Any]], create_if_missing: bool = False
+    ) -> bool:
+        """Bulk add documents (expects precomputed embeddings in `embedding`).
+
+        With `create_if_missing`, a missing collection is created (sized to the
+        embeddings) on the first failed write instead of checked for up front.
+        """
         raise NotImplementedError
 
     @abstractmethod
     async def delete_collection(self, collection_name: str) -> bool:
+        """Delete a collection; returns False if it did not exist."""
         raise NotImplementedError
 
     @abstractmethod
@@ -43,12 +91,191 @@ class VectorStore(ABC):
 
     @abstractmethod
     async def delete_documents(self, collection_name: str, filters: Dict[str, Any]) -> int:
+        """Delete documents matching all filters (a list value matches any item); returns the count."""
         raise NotImplementedError
 
     @abstractmethod
     async def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         raise NotImplementedError
 
+    async def count_by_type(self, collection_name: str, types: Sequence[str], field: str = "type") -> Dict[str, int]:
+        """Document counts per value of `field`, issued concurrently."""
+        counts = await asyncio.gather(
+            *(self.count_documents(collection_name, {field: value}) for value in types)
+        )
+        return dict(zip(types, counts))
+
+    # Incremental re-indexing support; stores that return None from get_hashes
+    # are rewritten in full by sync_documents
+    async def get_hashes(self, collection_name: str) -> Optional[Dict[str, str]]:
+        """Document id -> stored `content_hash` ("" if absent); {} for a missing collection."""
+        return None
+
+    async def update_metadata(self, collection_name: str, documents: List[Dict[str, Any]]) -> None:
+        """Replace stored metadata/content of existing documents by id, keeping their vectors."""
+        raise NotImplementedError
+
+    async def delete_by_ids(self, collection_name: str, ids: List[str]) -> int:
+        raise NotImplementedError
+
+    async def add_document_columns(
+        self,
+        collection_name: str,
+        ids: Sequence[str],
+        contents: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        embeddings: Sequence[Sequence[float]],
+        create_if_missing: bool = False,
+    ) -> bool:
+        """
+        Bulk add documents given as parallel columns; `embeddings` may be an (N, D)
+        numpy array. Stores with a native batch format override this.
+        """
+        documents = [
+            {"id": doc_id, "content": content, "metadata": metadata, "embedding": embedding}
+            for doc_id, content, metadata, embedding in zip(ids, contents, metadatas, _vector_lists(embeddings))
+        ]
+        return await self.add_documents(collection_name, documents, create_if_missing=create_if_missing)
+
+
+def _vector_lists(embeddings: Sequence[Sequence[float]]) -> List[List[float]]:
+    # ndarray.tolist converts a whole batch in C rather than element by element
+    if hasattr(embeddings, "tolist"):
+        return embeddings.tolist()
+    return [list(embedding) for embedding in embeddings]
+
+
+def _unit_rows(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class _FlatIndex:
+    """All points of a small collection held in memory for exact brute-force search"""
+
+    __slots__ = ("payloads", "matrix")
+
+    def __init__(self, payloads: List[Dict[str, Any]], vectors: Sequence[Sequence[float]]):
+        self.payloads = payloads
+        self.matrix = _unit_rows(vectors)
+
+    def search(self, query_vectors: Sequence[Sequence[float]], queries: Sequence[SearchQuery]) -> List[List[Dict[str, Any]]]:
+        """Cosine top-k for each query; one matrix product scores every query against every point"""
+        scores = _unit_rows(query_vectors) @ self.matrix.T
+        results = []
+        for row, query in zip(scores, queries):
+            if query.filters:
+                row = np.where([_matches(p, query.filters) for p in self.payloads], row, -np.inf)
+            k = min(query.limit, len(row))
+            top = np.argpartition(-row, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.intp)
+            top = top[np.argsort(-row[top], kind="stable")]
+            results.append([{**self.payloads[i], "score": float(row[i])} for i in top if row[i] != -np.inf])
+        return results
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=1024)
+def schema_collection(project_id: str) -> str:
+    return f"schema_{project_id}"
+
+
+@functools.lru_cache(maxsize=1024)
+def sql_pairs_collection(project_id: Optional[str]) -> str:
+    return f"sql_pairs_{project_id}" if project_id else "sql_pairs"
+
+
+@functools.lru_cache(maxsize=1024)
+def table_descriptions_collection(project_id: Optional[str]) -> str:
+    return f"table_descriptions_{project_id}" if project_id else "table_descriptions"
+
+
+async def sync_documents(
+    vector_store: VectorStore,
+    collection_name: str,
+    documents: List[Dict[str, Any]],
+    write: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+) -> Dict[str, int]:
+    """
+    Make a collection hold exactly `documents` (each with a stable `id`), passing
+    only new or changed content to `write` so unchanged documents are not re-embedded.
+    """
+    for doc in documents:
+        doc.setdefault("metadata", {})["content_hash"] = content_hash(doc["content"])
+
+    existing = await vector_store.get_hashes(collection_name)
+    if existing is None:
+        await vector_store.delete_collection(collection_name)
+        await write(documents)
+        return {"written": len(documents), "unchanged": 0, "deleted": 0}
+
+    changed, unchanged = [], []
+    for doc in documents:
+        (unchanged if existing.get(doc["id"]) == doc["metadata"]["content_hash"] else changed).append(doc)
+    stale = list(existing.keys() - {doc["id"] for doc in documents})
+
+    if stale:
+        await vector_store.delete_by_ids(collection_name, stale)
+    if unchanged:
+        await vector_store.update_metadata(collection_name, unchanged)
+    if changed:
+        await write(changed)
+    return {"written": len(changed), "unchanged": len(unchanged), "deleted": len(stale)}
+
+
+async def add_documents_in_batches(
+    vector_store: VectorStore,
+    collection_name: str,
+    documents: List[Dict[str, Any]],
+    batch_size: int = 64,
+    concurrency: int = 2,
+    create_if_missing: bool = False,
+) -> bool:
+    """Upload documents as fixed-size batches with a bounded number of requests in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(batch: List[Dict[str, Any]]) -> bool:
+        async with semaphore:
+            return await vector_store.add_documents(collection_name, batch, create_if_missing=create_if_missing)
+
+    results = await asyncio.gather(
+        *(upload(documents[i:i + batch_size]) for i in range(0, len(documents), batch_size))
+    )
+    return all(results)
+
+
+async def add_document_columns_in_batches(
+    vector_store: VectorStore,
+    collection_name: str,
+    ids: Sequence[str],
+    contents: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    embeddings: Sequence[Sequence[float]],
+    batch_size: int = 64,
+    concurrency: int = 2,
+    create_if_missing: bool = False,
+) -> bool:
+    """Columnar counterpart of add_documents_in_batches"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(start: int) -> bool:
+        end = start + batch_size
+        async with semaphore:
+            return await vector_store.add_document_columns(
+                collection_name,
+                ids[start:end],
+                contents[start:end],
+                metadatas[start:end],
+                embeddings[start:end],
+                create_if_missing=create_if_missing,
+            )
+
+    results = await asyncio.gather(*(upload(i) for i in range(0, len(ids), batch_size)))
+    return all(results)
+
 
 class NotConfiguredVectorStore(VectorStore):
     """Vector store that raises clear configuration errors when used."""
@@ -65,7 +292,7 @@ class NotConfiguredVectorStore(VectorStore):
     async def similarity_search(self, query: str, collection_name: str, limit: int = 10, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         self._err()
 
-    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]]) -> bool:
+    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]], create_if_missing: bool = False) -> bool:
         self._err()
 
     async def delete_collection(self, collection_name: str) -> bool:
@@ -86,11 +313,34 @@ class NotConfiguredVectorStore(VectorStore):
     async def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
         self._err()
 
+    async def get_hashes(self, collection_name: str) -> Optional[Dict[str, str]]:
+        self._err()
+
 
 class QdrantProvider(VectorStore):
     """Qdrant-backed Vector Store Provider"""
 
-    def __init__(self, url: str, api_key: Optional[str] = None, embeddings_provider: Optional[Any] = None, collection_vector_size: int = 1536):
+    def __init__(
+        self,
+        url: str,
+        api_key: Optional[str] = None,
+        embeddings_provider: Optional[Any] = None,
+        collection_vector_size: int = 1536,
+        flat_index_max_points: int = 0,
+        flat_index_ttl: float = 300,
+        quantization: Optional[str] = None,
+    ):
+        """
+        With `flat_index_max_points` > 0, collections up to that many points are
+        loaded into memory on first search and searched exactly with one numpy
+        matrix product instead of a network round-trip per query. Writes through
+        this provider drop the loaded copy; other writers are picked up after
+        `flat_index_ttl` seconds.
+
+        With `quantization="int8"`, collections created by this provider keep an
+        int8 scalar-quantized copy of their vectors in RAM (4x smaller than fp32)
+        that searches scan first, rescoring the top hits with the original vectors.
+        """
         try:
             from qdrant_client import QdrantClient
             from qdrant_client.http.models import Distance, VectorParams
@@ -104,6 +354,12 @@ class QdrantProvider(VectorStore):
         self.client = QdrantClient(url=url, api_key=api_key)  # supports http(s) and grpc
         self.embeddings_provider = embeddings_provider
         self.default_vector_size = collection_vector_size
+        if quantization not in (None, "int8"):
+            raise ValueError(f"Unsupported vector quantization: {quantization}")
+        self.quantization = quantization
+        self.flat_index_max_points = flat_index_max_points
+        # collection -> _FlatIndex, or None when the collection is too large
+        self._flat_indexes: TTLCache = TTLCache(maxsize=1024, ttl=flat_index_ttl)
 
     async def collection_exists(self, collection_name: str) -> bool:
         try:
@@ -113,6 +369,7 @@ class QdrantProvider(VectorStore):
             return False
 
     async def create_collection(self, collection_name: str, vector_size: int = 1536, distance: str = "Cosine") -> bool:
+        self._flat_indexes.pop(collection_name, None)
         try:
             if await self.collection_exists(collection_name):
                 return True
@@ -120,39 +377,159 @@ class QdrantProvider(VectorStore):
             self.client.recreate_collection(
                 collection_name=collection_name,
                 vectors_config=self._VectorParams(size=vector_size or self.default_vector_size, distance=dist),
+                quantization_config=self._quantization_config(),
             )
             return True
         except Exception as e:
             logger.error(f"Failed to create collection {collection_name}: {e}")
             raise
 
-    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]]) -> bool:
+    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]], create_if_missing: bool = False) -> bool:
+        self._flat_indexes.pop(collection_name, None)
         try:
             # Each document should have: id (optional), embedding (list[float]), metadata (dict), content (str)
+            # Compute missing embeddings from content in one batched call
+            missing = [i for i, doc in enumerate(documents) if doc.get("embedding") is None]
+            computed: Dict[int, List[float]] = {}
+            if missing:
+                if not self.embeddings_provider or not all(documents[i].get("content") for i in missing):
+                    raise ValueError("Document missing 'embedding' and no embeddings provider configured")
+                embeddings = await self.embeddings_provider.embed_documents([documents[i]["content"] for i in missing])
+                computed = dict(zip(missing, embeddings))
+
             points = []
-            for doc in documents:
+            for i, doc in enumerate(documents):
                 embedding = doc.get("embedding")
                 if embedding is None:
-                    # Try to compute from content if embeddings provider is available
-                    if self.embeddings_provider and doc.get("content"):
-                        emb = await self.embeddings_provider.embed_documents([doc["content"]])
-                        embedding = emb[0]
-                    else:
-                        raise ValueError("Document missing 'embedding' and no embeddings provider configured")
-
-                payload = {
-                    **{k: v for k, v in doc.items() if k not in ["embedding"]},
-                    **doc.get("metadata", {}),
-                }
+                    embedding = computed[i]
+
                 point_id = doc.get("id")
-                points.append({"id": point_id, "vector": embedding, "payload": payload})
+                points.append({"id": point_id, "vector": embedding, "payload": self._payload(doc)})
+
+            try:
+                self.client.upsert(collection_name=collection_name, points=points)
+            except Exception as e:
+                if not (create_if_missing and points and _is_not_found(e)):
+                    raise
+                self._create_if_absent(collection_name, len(points[0]["vector"]))
+                self.client.upsert(collection_name=collection_name, points=points)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to add documents to {collection_name}: {e}")
+            raise
 
-            self.client.upsert(collection_name=collection_name, points=points)
+    async def add_document_columns(
+        self,
+        collection_name: str,
+        ids: Sequence[str],
+        contents: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        embeddings: Sequence[Sequence[float]],
+        create_if_missing: bool = False,
+    ) -> bool:
+        from qdrant_client.http.models import Batch
+
+        self._flat_indexes.pop(collection_name, None)
+        try:
+            # Qdrant's column-oriented batch skips building one point object per document
+            batch = Batch(
+                ids=list(ids),
+                vectors=_vector_lists(embeddings),
+                payloads=[
+                    {"id": doc_id, "content": content, "metadata": metadata, **metadata}
+                    for doc_id, content, metadata in zip(ids, contents, metadatas)
+                ],
+            )
+            try:
+                self.client.upsert(collection_name=collection_name, points=batch)
+            except Exception as e:
+                if not (create_if_missing and batch.ids and _is_not_found(e)):
+                    raise
+                self._create_if_absent(collection_name, len(batch.vectors[0]))
+                self.client.upsert(collection_name=collection_name, points=batch)
             return True
         except Exception as e:
             logger.error(f"Failed to add documents to {collection_name}: {e}")
             raise
 
+    @staticmethod
+    def _payload(doc: Dict[str, Any]) -> Dict[str, Any]:
+        # Metadata is stored both nested and flattened so filters can match top-level keys
+        return {
+            **{k: v for k, v in doc.items() if k != "embedding"},
+            **doc.get("metadata", {}),
+        }
+
+    async def get_hashes(self, collection_name: str) -> Optional[Dict[str, str]]:
+        hashes: Dict[str, str] = {}
+        offset = None
+        try:
+            while True:
+                records, offset = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=1024,
+                    offset=offset,
+                    with_payload=["content_hash"],
+                    with_vectors=False,
+                )
+                for record in records:
+                    hashes[str(record.id)] = (record.payload or {}).get("content_hash", "")
+                if offset is None:
+                    return hashes
+        except Exception as e:
+            if _is_not_found(e):
+                return {}
+            logger.error(f"Failed to read content hashes from {collection_name}: {e}")
+            raise
+
+    async def update_metadata(self, collection_name: str, documents: List[Dict[str, Any]]) -> None:
+        from qdrant_client.http.models import OverwritePayloadOperation, SetPayload
+        self._flat_indexes.pop(collection_name, None)
+        try:
+            self.client.batch_update_points(
+                collection_name=collection_name,
+                update_operations=[
+                    OverwritePayloadOperation(overwrite_payload=SetPayload(payload=self._payload(doc), points=[doc["id"]]))
+                    for doc in documents
+                ],
+            )
+        except Exception as e:
+            logger.error(f"Failed to update metadata in {collection_name}: {e}")
+            raise
+
+    async def delete_by_ids(self, collection_name: str, ids: List[str]) -> int:
+        self._flat_indexes.pop(collection_name, None)
+        try:
+            self.client.delete(collection_name=collection_name, points_selector=list(ids))
+            return len(ids)
+        except Exception as e:
+            logger.error(f"Failed to delete documents by id in {collection_name}: {e}")
+            raise
+
+    def _quantization_config(self):
+        if self.quantization != "int8":
+            return None
+        from qdrant_client.http.models import ScalarQuantization, ScalarQuantizationConfig, ScalarType
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+
+    def _search_params(self):
+        if self.quantization is None:
+            return None
+        from qdrant_client.http.models import QuantizationSearchParams, SearchParams
+        return SearchParams(quantization=QuantizationSearchParams(rescore=True))
+
+    def _create_if_absent(self, collection_name: str, vector_size: int) -> None:
+        # Unlike recreate_collection this never drops data a concurrent writer just created
+        try:
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=self._VectorParams(size=vector_size, distance=self._Distance.COSINE),
+                quantization_config=self._quantization_config(),
+            )
+        except Exception as e:
+            if "already exists" not in str(e).lower() and getattr(e, "status_code", None) != 409:
+                raise
+
     async def similarity_search(
         self,
         query: str,
@@ -166,64 +543,145 @@ class QdrantProvider(VectorStore):
 
             query_vector = await self.embeddings_provider.embed_query(query)
 
-            # Build Qdrant filter
-            qdrant_filter = None
-            if filters:
-                from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-                conditions = []
-                for k, v in filters.items():
-                    conditions.append(FieldCondition(key=k, match=MatchValue(value=v)))
-                qdrant_filter = Filter(must=conditions)
+            flat_index = self._flat_index(collection_name)
+            if flat_index is not None:
+                return flat_index.search([query_vector], [SearchQuery(query, limit, filters)])[0]
 
             results = self.client.search(
                 collection_name=collection_name,
                 query_vector=query_vector,
                 limit=limit,
-                query_filter=qdrant_filter,
+                query_filter=self._filter(filters),
+                search_params=self._search_params(),
                 with_payload=True,
             )
-
-            normalized = []
-            for r in results:
-                payload = r.payload or {}
-                # unify metadata shape
-                normalized.append({
-                    **payload,
-                    "score": r.score,
-                })
-            return normalized
+            return self._normalize_results(results)
         except Exception as e:
+            if _is_not_found(e):
+                raise CollectionNotFoundError(collection_name) from e
             logger.error(f"Similarity search failed on {collection_name}: {e}")
             raise
 
+    async def similarity_search_batch(
+        self, collection_name: str, queries: Sequence[SearchQuery]
+    ) -> List[List[Dict[str, Any]]]:
+        # One embeddings call and one search_batch round-trip for all queries
+        from qdrant_client.http.models import SearchRequest
+        try:
+            if not self.embeddings_provider:
+                raise RuntimeError("Embeddings provider is required for similarity_search but not configured")
+
+            query_vectors = await self.embeddings_provider.embed_documents([q.query for q in queries])
+            flat_index = self._flat_index(collection_name)
+            if flat_index is not None:
+                return flat_index.search(query_vectors, queries)
+
+            batch_results = self.client.search_batch(
+                collection_name=collection_name,
+                requests=[
+                    SearchRequest(
+                        vector=list(vector),
+                        limit=q.limit,
+                        filter=self._filter(q.filters),
+                        params=self._search_params(),
+                        with_payload=True,
+                    )
+                    for q, vector in zip(queries, query_vectors)
+                ],
+            )
+            return [self._normalize_results(results) for results in batch_results]
+        except Exception as e:
+            if _is_not_found(e):
+                raise CollectionNotFoundError(collection_name) from e
+            logger.error(f"Batched similarity search failed on {collection_name}: {e}")
+            raise
+
+    def _flat_index(self, collection_name: str) -> Optional[_FlatIndex]:
+        """In-memory copy of a small collection, loaded on first use; None if disabled or too large"""
+        if self.flat_index_max_points <= 0:
+            return None
+        if collection_name in self._flat_indexes:
+            return self._flat_indexes[collection_name]
+
+        flat_index = None
+        if self._count(collection_name, None) <= self.flat_index_max_points:
+            payloads: List[Dict[str, Any]] = []
+            vectors: List[Sequence[float]] = []
+            offset = None
+            while True:
+                records, offset = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=1024,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True,
+                )
+                for record in records:
+                    payloads.append(record.payload or {})
+                    vectors.append(record.vector)
+                if offset is None:
+                    break
+            if payloads:
+                flat_index = _FlatIndex(payloads, vectors)
+        self._flat_indexes[collection_name] = flat_index
+        return flat_index
+
+    @staticmethod
+    def _normalize_results(results: Sequence[Any]) -> List[Dict[str, Any]]:
+        # unify metadata shape
+        return [{**(r.payload or {}), "score": r.score} for r in results]
+
+    @staticmethod
+    def _filter(filters: Optional[Dict[str, Any]]):
+        """Qdrant filter for `filters`; list values become match-any conditions"""
+        if not filters:
+            return None
+        from qdrant_client.http.models import Filter, FieldCondition, MatchAny, MatchValue
+        return Filter(must=[
+            FieldCondition(key=k, match=MatchAny(any=list(v)) if isinstance(v, (list, tuple, set)) else MatchValue(value=v))
+            for k, v in filters.items()
+        ])
+
+    def _count(self, collection_name: str, filters: Optional[Dict[str, Any]]) -> int:
+        res = self.client.count(collection_name=collection_name, count_filter=self._filter(filters), exact=True)
+        return int(res.count or 0)
+
     async def delete_collection(self, collection_name: str) -> bool:
+        self._flat_indexes.pop(collection_name, None)
         try:
-            self.client.delete_collection(collection_name)
-            return True
+            return bool(self.client.delete_collection(collection_name))
         except Exception as e:
+            if _is_not_found(e):
+                return False
             logger.error(f"Failed to delete collection {collection_name}: {e}")
             raise
 
     async def count_documents(self, collection_name: str, filters: Optional[Dict[str, Any]] = None) -> int:
         try:
-            from qdrant_client.http.models import CountRequest, Filter, FieldCondition, MatchValue
-            qdrant_filter = None
-            if filters:
-                conditions = [FieldCondition(key=k, match=MatchValue(value=v)) for k, v in filters.items()]
-                qdrant_filter = Filter(must=conditions)
-            res = self.client.count(collection_name=collection_name, count_request=CountRequest(exact=True, filter=qdrant_filter))
-            return int(res.count or 0)
+            return self._count(collection_name, filters)
         except Exception as e:
             logger.error(f"Failed to count documents in {collection_name}: {e}")
             return 0
 
+    async def count_by_type(self, collection_name: str, types: Sequence[str], field: str = "type") -> Dict[str, int]:
+        # The client is synchronous; run the counts in worker threads so they overlap
+        try:
+            counts = await asyncio.gather(
+                *(asyncio.to_thread(self._count, collection_name, {field: value}) for value in types)
+            )
+            return dict(zip(types, counts))
+        except Exception as e:
+            logger.error(f"Failed to count documents by {field} in {collection_name}: {e}")
+            return {value: 0 for value in types}
+
     async def delete_documents(self, collection_name: str, filters: Dict[str, Any]) -> int:
+        self._flat_indexes.pop(collection_name, None)
         try:
-            from qdrant_client.http.models import Filter, FieldCondition, MatchValue
-            qdrant_filter = Filter(must=[FieldCondition(key=k, match=MatchValue(value=v)) for k, v in filters.items()])
-            res = self.client.delete(collection_name=collection_name, points_selector=qdrant_filter)
-            # Qdrant delete returns an operation result; we cannot easily get count. Return -1 to indicate unknown.
-            return -1
+            qdrant_filter = self._filter(filters)
+            # Qdrant's delete result carries no count, so count the matches first
+            count = self._count(collection_name, filters)
+            self.client.delete(collection_name=collection_name, points_selector=qdrant_filter)
+            return count
         except Exception as e:
             logger.error(f"Failed to delete documents in {collection_name}: {e}")
             return 0
@@ -240,10 +698,180 @@ class QdrantProvider(VectorStore):
                 "last_updated": None,
             }
         except Exception as e:
+            if _is_not_found(e):
+                raise CollectionNotFoundError(collection_name) from e
             logger.error(f"Failed to get stats for {collection_name}: {e}")
             return {"document_count": 0}
 
 
+class TieredVectorStore(VectorStore):
+    """
+    Two-tier vector store: repeated similarity searches are served from a local
+    in-process cache, misses fall through to the remote store and are promoted.
+    Writes made through this store invalidate the collection's cached searches;
+    writes from other processes (other workers, Dagster runs) do not, so cached
+    results can be up to `ttl` seconds stale. `ttl` or `max_entries` <= 0
+    disables the local tier.
+
+    With `coalesce_wait_ms` > 0, misses from concurrent requests are held for up
+    to that long (or until `coalesce_max_batch` are pending) and sent to the
+    remote store as one `similarity_search_batch` call per collection.
+    """
+
+    def __init__(
+        self,
+        remote: VectorStore,
+        max_entries: int = 50000,
+        ttl: float = 300,
+        coalesce_wait_ms: float = 0,
+        coalesce_max_batch: int = 64,
+    ):
+        self.remote = remote
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.coalesce_wait = coalesce_wait_ms / 1000
+        self.coalesce_max_batch = coalesce_max_batch
+        self._local: Dict[str, TTLCache] = {}
+        # Bumped by every write, so searches overlapping a write do not cache their results
+        self._generations: Dict[str, int] = {}
+        self._pending: List[Tuple[str, SearchQuery, asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose remote-specific attributes (client, embeddings_provider, ...)
+        if name == "remote":
+            raise AttributeError(name)
+        return getattr(self.remote, name)
+
+    def _invalidate(self, collection_name: str) -> None:
+        self._local.pop(collection_name, None)
+        self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+
+    async def _write(self, collection_name: str, write: Awaitable[T]) -> T:
+        """Run a remote write, invalidating the collection both before and after it"""
+        self._invalidate(collection_name)
+        try:
+            return await write
+        finally:
+            self._invalidate(collection_name)
+
+    async def similarity_search(
+        self,
+        query: str,
+        collection_name: str,
+        limit: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        cache_enabled = self.ttl > 0 and self.max_entries > 0
+        key = (query, limit, json.dumps(filters, sort_keys=True, default=str) if filters else None)
+        local = self._local.get(collection_name)
+        cached = local.get(key) if local is not None else None
+        if cached is not None:
+            return [dict(doc) for doc in cached]
+
+        generation = self._generations.get(collection_name, 0)
+        if self.coalesce_wait > 0:
+            results = await self._submit(collection_name, SearchQuery(query, limit, filters))
+        else:
+            results = await self.remote.similarity_search(
+                query=query, collection_name=collection_name, limit=limit, filters=filters
+            )
+        # A write that overlapped the search may have landed after the remote read
+        if not cache_enabled or self._generations.get(collection_name, 0) != generation:
+            return results
+        local = self._local.get(collection_name)
+        if local is None:
+            local = self._local[collection_name] = TTLCache(maxsize=self.max_entries, ttl=self.ttl)
+        local[key] = [dict(doc) for doc in results]
+        return results
+
+    def _submit(self, collection_name: str, query: SearchQuery) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((collection_name, query, future))
+        if len(self._pending) >= self.coalesce_max_batch:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.coalesce_wait, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending, []
+        by_collection: Dict[str, List[Tuple[SearchQuery, asyncio.Future]]] = {}
+        for collection_name, query, future in batch:
+            by_collection.setdefault(collection_name, []).append((query, future))
+        loop = asyncio.get_running_loop()
+        for collection_name, entries in by_collection.items():
+            task = loop.create_task(self._search_batch(collection_name, entries))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _search_batch(self, collection_name: str, entries: List[Tuple[SearchQuery, asyncio.Future]]) -> None:
+        try:
+            batch_results = await self.remote.similarity_search_batch(collection_name, [q for q, _ in entries])
+        except Exception as e:
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), results in zip(entries, batch_results):
+            # A caller may have been cancelled while the batch was in flight
+            if not future.done():
+                future.set_result(results)
+
+    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]], create_if_missing: bool = False) -> bool:
+        return await self._write(
+            collection_name, self.remote.add_documents(collection_name, documents, create_if_missing=create_if_missing)
+        )
+
+    async def add_document_columns(
+        self,
+        collection_name: str,
+        ids: Sequence[str],
+        contents: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        embeddings: Sequence[Sequence[float]],
+        create_if_missing: bool = False,
+    ) -> bool:
+        return await self._write(collection_name, self.remote.add_document_columns(
+            collection_name, ids, contents, metadatas, embeddings, create_if_missing=create_if_missing
+        ))
+
+    async def delete_collection(self, collection_name: str) -> bool:
+        return await self._write(collection_name, self.remote.delete_collection(collection_name))
+
+    async def count_documents(self, collection_name: str, filters: Optional[Dict[str, Any]] = None) -> int:
+        return await self.remote.count_documents(collection_name, filters)
+
+    async def count_by_type(self, collection_name: str, types: Sequence[str], field: str = "type") -> Dict[str, int]:
+        return await self.remote.count_by_type(collection_name, types, field)
+
+    async def collection_exists(self, collection_name: str) -> bool:
+        return await self.remote.collection_exists(collection_name)
+
+    async def create_collection(self, collection_name: str, vector_size: int = 1536, distance: str = "Cosine") -> bool:
+        return await self._write(collection_name, self.remote.create_collection(collection_name, vector_size, distance))
+
+    async def delete_documents(self, collection_name: str, filters: Dict[str, Any]) -> int:
+        return await self._write(collection_name, self.remote.delete_documents(collection_name, filters))
+
+    async def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
+        return await self.remote.get_collection_stats(collection_name)
+
+    async def get_hashes(self, collection_name: str) -> Optional[Dict[str, str]]:
+        return await self.remote.get_hashes(collection_name)
+
+    async def update_metadata(self, collection_name: str, documents: List[Dict[str, Any]]) -> None:
+        return await self._write(collection_name, self.remote.update_metadata(collection_name, documents))
+
+    async def delete_by_ids(self, collection_name: str, ids: List[str]) -> int:
+        return await self._write(collection_name, self.remote.delete_by_ids(collection_name, ids))
+
+
 class MockVectorStore(VectorStore):
     """Mock Vector Store for testing only"""
 
@@ -271,9 +899,13 @@ class MockVectorStore(VectorStore):
             },
         ][:limit]
 
-    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]]) -> bool:
+    async def add_documents(self, collection_name: str, documents: List[Dict[str, Any]], create_if_missing: bool = False) -> bool:
         if collection_name not in self.storage:
             self.storage[collection_name] = []
+        # Documents with an id replace any stored document with the same id
+        ids = {doc.get("id") for doc in documents if doc.get("id") is not None}
+        if ids:
+            self.storage[collection_name] = [d for d in self.storage[collection_name] if d.get("id") not in ids]
         for doc in documents:
             if "metadata" not in doc:
                 doc["metadata"] = {}
@@ -281,9 +913,7 @@ class MockVectorStore(VectorStore):
         return True
 
     async def delete_collection(self, collection_name: str) -> bool:
-        if collection_name in self.storage:
-            del self.storage[collection_name]
-        return True
+        return self.storage.pop(collection_name, None) is not None
 
     async def count_documents(self, collection_name: str, filters: Optional[Dict[str, Any]] = None) -> int:
         docs = self.storage.get(collection_name, [])
@@ -292,7 +922,7 @@ class MockVectorStore(VectorStore):
         count = 0
         for doc in docs:
             metadata = doc.get("metadata", {})
-            if all(metadata.get(k) == v for k, v in (filters or {}).items()):
+            if _matches(metadata, filters):
                 count += 1
         return count
 
@@ -310,14 +940,36 @@ class MockVectorStore(VectorStore):
         remaining = []
         for doc in docs:
             metadata = doc.get("metadata", {})
-            if all(metadata.get(k) == v for k, v in filters.items()):
+            if _matches(metadata, filters):
                 continue
             remaining.append(doc)
         self.storage[collection_name] = remaining
         return before - len(remaining)
 
     async def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
+        if collection_name not in self.storage:
+            raise CollectionNotFoundError(collection_name)
         return {
-            "document_count": len(self.storage.get(collection_name, [])),
+            "document_count": len(self.storage[collection_name]),
             "status": "mock",
         }
+
+    async def get_hashes(self, collection_name: str) -> Optional[Dict[str, str]]:
+        return {
+            doc["id"]: doc.get("metadata", {}).get("content_hash", "")
+            for doc in self.storage.get(collection_name, [])
+            if doc.get("id") is not None
+        }
+
+    async def update_metadata(self, collection_name: str, documents: List[Dict[str, Any]]) -> None:
+        updates = {doc["id"]: doc for doc in documents}
+        for stored in self.storage.get(collection_name, []):
+            update = updates.get(stored.get("id"))
+            if update is not None:
+                stored.update({k: v for k, v in update.items() if k != "embedding"})
+
+    async def delete_by_ids(self, collection_name: str, ids: List[str]) -> int:
+        docs = self.storage.get(collection_name, [])
+        doomed = set(ids)
+        self.storage[collection_name] = [d for d in docs if d.get("id") not in doomed]
+        return len(docs) - len(self.storage[collection_name])
@@ -37,7 +37,7 @@ class ChartService:
         )
 
         # Generate Vega-Lite schema
-        vega_schema = await self._generate_vega_lite_schema(
+        vega_schema = self._generate_vega_lite_schema(
             chart_suggestion["chart_type"],
             data_analysis,
             chart_request.data[:100]  # Sample data for schema generation
@@ -206,7 +206,7 @@ class ChartService:
             else:
                 return {"chart_type": "bar", "reasoning": "Default fallback", "confidence": 0.4}
 
-    async def _generate_vega_lite_schema(
+    def _generate_vega_lite_schema(
         self,
         chart_type: str,
         data_analysis: Dict[str, Any],
@@ -1,8 +1,8 @@
 import logging
 import asyncio
-import json
 from typing import Dict, Any, Optional, List
 from datetime import datetime
+import orjson
 from .base import BaseService
 from src.pipelines.relationship_recommendation import RelationshipRecommendationPipeline
 
@@ -13,7 +13,9 @@ class RelationshipRecommendationService(BaseService):
 
     def __init__(self, llm_provider, vector_store, embeddings_provider):
         super().__init__(llm_provider, vector_store, embeddings_provider)
-        self.pipeline = RelationshipRecommendationPipeline(llm_provider)
+        self.pipeline = RelationshipRecommendationPipeline(
+            llm_provider, embeddings_provider=embeddings_provider
+        )
         self.recommendations: Dict[str, Dict[str, Any]] = {}
 
     def initialize_recommendation(self, recommendation_id: str) -> None:
@@ -54,8 +56,8 @@ class RelationshipRecommendationService(BaseService):
 
             # Parse MDL
             try:
-                mdl_dict = json.loads(mdl)
-            except json.JSONDecodeError as e:
+                mdl_dict = orjson.loads(mdl)
+            except orjson.JSONDecodeError as e:
                 raise ValueError(f"Invalid MDL JSON: {str(e)}")
 
             # Perform relationship recommendation
@@ -113,7 +115,7 @@ class RelationshipRecommendationService(BaseService):
         """
         try:
             # Parse MDL
-            mdl_dict = json.loads(mdl)
+            mdl_dict = orjson.loads(mdl)
 
             # Perform complexity analysis
             analysis = self.pipeline.analyze_model_complexity(mdl_dict)
@@ -147,12 +149,12 @@ class RelationshipRecommendationService(BaseService):
         """
         try:
             # Parse MDL
-            mdl_dict = json.loads(mdl)
+            mdl_dict = orjson.loads(mdl)
 
             # Validate relationships using the pipeline's validation logic
             validated_relationships = self.pipeline._validate_relationships(
                 relationships,
-                mdl_dict
+                self.pipeline._model_columns(mdl_dict)
             )
 
             # Calculate validation statistics
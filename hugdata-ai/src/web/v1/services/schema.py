@@ -1,7 +1,7 @@
 import logging
 from typing import Dict, Any, List, Optional
 from src.pipelines.indexing.schema_indexing import SchemaIndexingPipeline
-from src.providers.vector_store import VectorStore
+from src.providers.vector_store import VectorStore, schema_collection
 
 logger = logging.getLogger("hugdata-ai")
 
@@ -9,9 +9,13 @@ logger = logging.getLogger("hugdata-ai")
 class SchemaService:
     """Service for managing database schema indexing and retrieval"""
 
-    def __init__(self, vector_store: VectorStore):
+    def __init__(self, vector_store: VectorStore, upload_batch_size: int = 64, upload_concurrency: int = 2):
         self.vector_store = vector_store
-        self.indexing_pipeline = SchemaIndexingPipeline(vector_store)
+        self.indexing_pipeline = SchemaIndexingPipeline(
+            vector_store,
+            upload_batch_size=upload_batch_size,
+            upload_concurrency=upload_concurrency
+        )
 
     async def index_schema(
         self,
@@ -63,7 +67,7 @@ class SchemaService:
     async def delete_schema_index(self, project_id: str) -> Dict[str, Any]:
         """Delete schema index for a project"""
         try:
-            collection_name = f"schema_{project_id}"
+            collection_name = schema_collection(project_id)
             await self.vector_store.delete_collection(collection_name)
             return {"status": "success"}
         except Exception as e:
@@ -79,7 +83,7 @@ class SchemaService:
     ) -> List[Dict[str, Any]]:
         """Search schema information for a project"""
         try:
-            collection_name = f"schema_{project_id}"
+            collection_name = schema_collection(project_id)
 
             # Build search filters
             search_filters = {"project_id": project_id}
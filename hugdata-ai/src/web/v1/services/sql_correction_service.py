@@ -4,6 +4,7 @@ from typing import Dict, Any, Optional, List
 from datetime import datetime
 from .base import BaseService
 from src.pipelines.sql_correction import SQLCorrectionPipeline, SQLError
+from src.providers.vector_store import schema_collection
 
 logger = logging.getLogger("hugdata-ai")
 
@@ -140,7 +141,7 @@ class SqlCorrectionService(BaseService):
             # Search for schema information in vector store
             results = await self.vector_store.similarity_search(
                 query="database schema table structure",
-                collection_name=f"schema_{project_id}",
+                collection_name=schema_collection(project_id),
                 limit=10,
             )
 
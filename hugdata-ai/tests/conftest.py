@@ -0,0 +1,36 @@
+from typing import Awaitable, Callable, List
+
+import numpy as np
+import pytest
+
+
+class LengthEmbeddings:
+    """Fake provider embedding each text as its length and recording batches."""
+
+    def __init__(self):
+        self.batches: List[List[str]] = []
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+
+@pytest.fixture
+def length_embeddings() -> LengthEmbeddings:
+    return LengthEmbeddings()
+
+
+@pytest.fixture
+def check_chunked_embedding(length_embeddings):
+    """
+    Run an embed function over five texts with a pipeline chunk size of 2 and
+    check that results come back float16, in input order, in batches of 2, 2, 1.
+    """
+    async def check(embed: Callable[[List[str]], Awaitable[np.ndarray]]) -> None:
+        embedded = await embed(["a" * n for n in (3, 1, 5, 2, 4)])
+
+        assert embedded.dtype == np.float16
+        assert embedded.tolist() == [[3.0], [1.0], [5.0], [2.0], [4.0]]
+        assert [len(batch) for batch in length_embeddings.batches] == [2, 2, 1]
+
+    return check
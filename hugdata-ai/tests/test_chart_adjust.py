@@ -3,9 +3,9 @@ from main import app
 
 
 def test_chart_adjust_placeholder_contract():
-    client = TestClient(app)
     payload = {"foo": "bar"}
-    resp = client.post("/v1/charts/adjust", json=payload)
+    with TestClient(app) as client:
+        resp = client.post("/v1/charts/adjust", json=payload)
     assert resp.status_code == 200
     data = resp.json()
     assert "message" in data
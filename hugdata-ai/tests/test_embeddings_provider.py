@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.providers.embeddings_provider import EmbeddingBatcher, MockEmbeddingsProvider, OpenAIEmbeddingsProvider
+
+
+class _FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+
+    async def create(self, input, model):
+        self.batches.append(list(input))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(t))]) for t in input])
+
+
+@pytest.mark.asyncio
+async def test_openai_embed_documents_batches_concurrently_and_keeps_order():
+    provider = OpenAIEmbeddingsProvider("test-key", chunk_size=2, max_concurrent_batches=2)
+    fake = _FakeEmbeddings()
+    provider.client = SimpleNamespace(embeddings=fake)
+    texts = ["a" * n for n in (3, 1, 5, 2, 4)]
+
+    embeddings = await provider.embed_documents(texts)
+
+    assert embeddings == [[3.0], [1.0], [5.0], [2.0], [4.0]]
+    assert len(fake.batches) == 3
+    assert fake.max_active == 2
+
+
+@pytest.mark.asyncio
+async def test_embedding_batcher_coalesces_concurrent_calls(length_embeddings):
+    batcher = EmbeddingBatcher(length_embeddings, max_batch=4, max_wait_ms=5)
+
+    first, second = await asyncio.gather(
+        batcher.embed_documents(["a", "bbb"]),
+        batcher.embed_documents(["cc"]),
+    )
+    third = await batcher.embed_documents(["d" * n for n in range(1, 6)])
+
+    assert first == [[1.0], [3.0]]
+    assert second == [[2.0]]
+    assert third == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    # Concurrent calls share one batch; a full batch flushes without waiting
+    assert length_embeddings.batches == [["a", "bbb", "cc"], ["d", "dd", "ddd", "dddd"], ["ddddd"]]
+
+
+@pytest.mark.asyncio
+async def test_mock_embeddings_are_deterministic_and_leave_global_rng_alone():
+    import numpy as np
+
+    provider = MockEmbeddingsProvider(dimension=8)
+    np.random.seed(123)
+    expected_next = np.random.random()
+    np.random.seed(123)
+
+    documents = await provider.embed_documents(["users", "orders", "users"])
+    query = await provider.embed_query("users")
+
+    assert np.random.random() == expected_next
+    assert len(documents) == 3 and len(documents[0]) == 8
+    assert documents[0] == documents[2] == query
+    assert documents[0] != documents[1]
@@ -1,6 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 import os
 import sys
 
@@ -9,12 +9,16 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
 
-client = TestClient(app)
+@pytest.fixture(scope="module")
+def client():
+    # Entering the client runs the app lifespan, which initializes services
+    with TestClient(app) as test_client:
+        yield test_client
 
 class TestHealthEndpoint:
     """Test health check endpoints"""
     
-    def test_health_check(self):
+    def test_health_check(self, client):
         """Test basic health check endpoint"""
         response = client.get("/health")
         assert response.status_code == 200
@@ -23,15 +27,28 @@ class TestHealthEndpoint:
         assert "timestamp" in data
         assert "version" in data
 
+    def test_metrics_endpoint(self, client):
+        """Test Prometheus metrics exposition"""
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "hugdata_semantic_cache_lookups_total" in response.text
+
+    def test_large_responses_are_gzipped(self, client):
+        """Test responses over the 1 KB threshold are gzip-encoded"""
+        response = client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+
 class TestGenerateSqlEndpoint:
     """Test SQL generation endpoint"""
     
-    def test_generate_sql_validation(self):
+    def test_generate_sql_validation(self, client):
         """Test validation error when body is missing"""
         response = client.post("/generate-sql", json={})
         assert response.status_code == 422
 
-    def test_generate_sql_success(self):
+    def test_generate_sql_success(self, client):
         """Test successful SQL generation with mock providers"""
         payload = {
             "query": "List users created this year",
@@ -49,19 +66,72 @@ class TestGenerateSqlEndpoint:
             assert "sql" in data
             assert "confidence" in data
 
+    def test_generate_sql_stream_emits_sse_frames(self, client):
+        """Test streaming endpoint returns server-sent event frames"""
+        payload = {
+            "query": "List users",
+            "context": {},
+            "database_schema": {"tables": {}},
+            "project_id": "test"
+        }
+        response = client.post("/generate-sql/stream", json=payload)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["content-encoding"] == "identity"
+        assert response.text.startswith("data: ")
+
+    def test_generate_sql_exact_replay_is_cached(self, client):
+        """Test identical requests reuse the response unless no_cache is set"""
+        pipeline = Mock()
+        pipeline.generate_sql = AsyncMock(return_value={
+            "sql": "SELECT 1", "confidence": 0.9, "explanation": "", "reasoning_steps": []
+        })
+        payload = {
+            "query": "Count orders",
+            "context": {},
+            "database_schema": {"tables": {"orders": {"columns": []}}},
+            "project_id": "exact-cache"
+        }
+        with patch("main.get_sql_pipeline", return_value=pipeline):
+            assert client.post("/generate-sql", json=payload).json()["sql"] == "SELECT 1"
+            assert client.post("/generate-sql", json=payload).status_code == 200
+            assert pipeline.generate_sql.await_count == 1
+            client.post("/generate-sql", json={**payload, "no_cache": True})
+            assert pipeline.generate_sql.await_count == 2
+
+    def test_generate_sql_fingerprint_without_schema(self, client):
+        """Test a fingerprint alone is rejected; the schema must always be sent"""
+        payload = {
+            "query": "List users",
+            "context": {},
+            "schema_fingerprint": "not-indexed",
+            "project_id": "test"
+        }
+        response = client.post("/generate-sql", json=payload)
+        assert response.status_code == 400
+
+        pipeline = Mock()
+        pipeline.generate_sql = AsyncMock(return_value={
+            "sql": "SELECT 1", "confidence": 0.9, "explanation": "", "reasoning_steps": []
+        })
+        payload["database_schema"] = {"tables": {"users": {"columns": []}}}
+        with patch("main.get_sql_pipeline", return_value=pipeline), \
+                patch("main._schema_fingerprint", side_effect=AssertionError("schema rehashed")):
+            assert client.post("/generate-sql", json=payload).status_code == 200
+
 class TestV1Services:
     """Test v1 service endpoints (ask, chart, schema)"""
     
-    def test_chart_suggest_validation(self):
+    def test_chart_suggest_validation(self, client):
         response = client.post("/v1/charts/suggest", json={})
         assert response.status_code == 422
 
-    def test_schema_index_validation(self):
+    def test_schema_index_validation(self, client):
         response = client.post("/v1/schema/index", json={})
         assert response.status_code == 422
 
 class TestExplainQuery:
-    def test_explain_query_basic(self):
+    def test_explain_query_basic(self, client):
         payload = {
             "sql": "SELECT id FROM users LIMIT 10;",
             "schema": {"tables": {}}
@@ -72,8 +142,16 @@ class TestExplainQuery:
         assert "explanation" in data
         assert "breakdown" in data
 
+    def test_explain_query_breakdown_and_tables(self, client):
+        payload = {"sql": "SELECT u.id FROM users u, orders o WHERE u.id = o.user_id ORDER BY u.id"}
+        response = client.post("/explain-query", params=payload)
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["breakdown"]) == {"SELECT", "FROM", "WHERE", "ORDER BY"}
+        assert "users, orders" in data["explanation"]
+
 class TestIndexSchema:
-    def test_index_schema_basic(self):
+    def test_index_schema_basic(self, client):
         payload = {
             "schema": {"tables": {"users": {"columns": []}}},
             "project_id": "test"
@@ -82,7 +160,7 @@ class TestIndexSchema:
         assert response.status_code in [200, 500]
 
 class TestSuggestChartsSimple:
-    def test_suggest_charts_simple(self):
+    def test_suggest_charts_simple(self, client):
         payload = {
             "data_sample": {"category": "A", "value": 10},
             "query_intent": "compare by category"
@@ -90,8 +168,19 @@ class TestSuggestChartsSimple:
         response = client.post("/suggest-charts", json=payload)
         assert response.status_code in [200, 500]
 
+    def test_suggest_charts_intent_keywords(self, client):
+        payload = {
+            "data_sample": {"created_at": "2024-01-01T00:00:00", "revenue": 10},
+            "query_intent": "Revenue trends over time"
+        }
+        response = client.post("/suggest-charts", json=payload)
+        assert response.status_code == 200
+        data = response.json()
+        assert data[0]["chart_type"] == "line"
+        assert data[0]["confidence"] == 0.9
+
 class TestAskFlow:
-    def test_create_ask_validation(self):
+    def test_create_ask_validation(self, client):
         response = client.post("/v1/asks", json={})
         assert response.status_code == 422
 
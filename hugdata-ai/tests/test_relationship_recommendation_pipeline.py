@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from src.pipelines.relationship_recommendation import RelationshipRecommendationPipeline
+
+
+MDL = {
+    "models": [
+        {"name": "orders", "columns": [{"name": "id"}, {"name": "user_id"}, {"name": "user", "relationship": "r"}]},
+        {"name": "users", "columns": [{"name": "id"}, {"name": "email"}]},
+    ]
+}
+
+
+def _relationship(**overrides):
+    relationship = {
+        "name": "orders_users",
+        "fromModel": "orders",
+        "fromColumn": "user_id",
+        "type": "MANY_TO_ONE",
+        "toModel": "users",
+        "toColumn": "id",
+        "reason": "user_id references users.id",
+    }
+    relationship.update(overrides)
+    return relationship
+
+
+def test_validate_relationships_against_model_columns():
+    pipeline = RelationshipRecommendationPipeline(llm_provider=None)
+    model_columns = pipeline._model_columns(MDL)
+
+    validated = pipeline._validate_relationships(
+        [
+            _relationship(),
+            _relationship(fromColumn="user"),  # relationship columns are not joinable
+            _relationship(type="MANY_TO_MANY"),
+            _relationship(toModel="orders", toColumn="id"),
+            {"name": "incomplete", "fromModel": "orders"},
+            "not a dict",
+        ],
+        model_columns,
+    )
+
+    assert model_columns == {"orders": {"id", "user_id"}, "users": {"id", "email"}}
+    assert validated == [_relationship()]
+
+
+def test_normalize_response_extracts_fenced_json():
+    pipeline = RelationshipRecommendationPipeline(llm_provider=None)
+
+    fenced = pipeline._normalize_response('Here you go:\n```json\n{"relationships": [{"name": "a"}]}\n```')
+
+    assert fenced == {"relationships": [{"name": "a"}]}
+    assert pipeline._normalize_response("no json here") == {"relationships": []}
+    assert pipeline._normalize_response("{not json}") == {"relationships": []}
+
+
+class _CountingLLM:
+    model = "test-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, prompt, max_tokens=1000, temperature=0.1):
+        self.calls += 1
+        return '{"relationships": [' + json.dumps(_relationship()) + "]}"
+
+
+@pytest.mark.asyncio
+async def test_recommend_relationships_reuses_cached_completion():
+    llm = _CountingLLM()
+    pipeline = RelationshipRecommendationPipeline(llm)
+
+    first = await pipeline.recommend_relationships(MDL)
+    second = await pipeline.recommend_relationships(MDL)
+    await pipeline.recommend_relationships(MDL, language="Spanish")
+
+    assert first == second
+    assert first["relationships"] == [_relationship()]
+    assert llm.calls == 2
+
+
+class _ConstantEmbeddings:
+    async def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+@pytest.mark.asyncio
+async def test_recommend_relationships_reuses_near_duplicate_mdl():
+    llm = _CountingLLM()
+    pipeline = RelationshipRecommendationPipeline(llm, embeddings_provider=_ConstantEmbeddings())
+    tweaked = {"models": MDL["models"] + [{"name": "audit_log", "columns": []}]}
+
+    await pipeline.recommend_relationships(MDL)
+    result = await pipeline.recommend_relationships(tweaked)
+
+    assert llm.calls == 1
+    assert result["relationships"] == [_relationship()]
+
+
+@pytest.mark.asyncio
+async def test_recommend_relationships_misses_semantic_cache_when_a_model_is_added():
+    llm = _CountingLLM()
+    pipeline = RelationshipRecommendationPipeline(llm, embeddings_provider=_ConstantEmbeddings())
+    extended = {"models": MDL["models"] + [{"name": "payments", "columns": [{"name": "id"}, {"name": "order_id"}]}]}
+
+    await pipeline.recommend_relationships(MDL)
+    await pipeline.recommend_relationships(extended)
+
+    assert llm.calls == 2
+
+
+def test_clean_models_strips_display_names_without_mutating_mdl():
+    pipeline = RelationshipRecommendationPipeline(llm_provider=None)
+    mdl = {
+        "models": [
+            {
+                "name": "orders",
+                "properties": {"displayName": "Orders", "description": "All orders"},
+                "columns": [
+                    {"name": "id", "properties": {"displayName": "ID"}},
+                    {"name": "user", "relationship": "orders_users"},
+                    "total",
+                ],
+            }
+        ]
+    }
+
+    cleaned = pipeline._clean_models(mdl)
+
+    assert cleaned == [
+        {
+            "name": "orders",
+            "properties": {"description": "All orders"},
+            "columns": [{"name": "id", "properties": {}}, "total"],
+        }
+    ]
+    assert mdl["models"][0]["properties"]["displayName"] == "Orders"
+    assert len(mdl["models"][0]["columns"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_recommend_relationships_skips_llm_without_key_candidates():
+    llm = _CountingLLM()
+    pipeline = RelationshipRecommendationPipeline(llm)
+    mdl = {"models": [{"name": "a", "columns": [{"name": "title"}]}, {"name": "b", "columns": [{"name": "body"}]}]}
+
+    result = await pipeline.recommend_relationships(mdl)
+
+    assert llm.calls == 0
+    assert result["skipped_reason"] == "no_fk_candidates"
+    assert result["models_analyzed"] == 2
+
+    camel_case = {"models": [
+        {"name": "Orders", "columns": [{"name": "Id"}, {"name": "customerId"}]},
+        {"name": "Customers", "columns": [{"name": "CustomerID"}, {"name": "VALID"}]},
+    ]}
+    result = await pipeline.recommend_relationships(camel_case)
+
+    assert llm.calls == 1
+    assert "skipped_reason" not in result
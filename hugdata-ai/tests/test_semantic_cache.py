@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.cache.semantic_cache import SemanticCache, dequantize_int8, quantize_int8
+
+
+def test_quantize_int8_round_trip():
+    rng = np.random.default_rng(0)
+    v = rng.normal(size=1536).astype(np.float32)
+
+    codes, scale = quantize_int8(v)
+
+    assert codes.dtype == np.int8
+    assert np.max(np.abs(dequantize_int8(codes, scale) - v)) <= scale / 2 + 1e-6
+
+
+def test_semantic_cache_hit_on_near_duplicate_and_namespace_isolation():
+    rng = np.random.default_rng(1)
+    v = rng.normal(size=256)
+    near = v + rng.normal(scale=0.01, size=256)
+
+    cache = SemanticCache(threshold=0.95)
+    cache.put("p1", v, "cached")
+
+    assert cache.get("p1", near) == "cached"
+    assert cache.get("p2", near) is None
+    assert cache.get("p1", rng.normal(size=256)) is None
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    eye = np.eye(4)
+    cache = SemanticCache(max_entries=2, threshold=0.99)
+    cache.put("p", eye[0], "a")
+    cache.put("p", eye[1], "b")
+    assert cache.get("p", eye[0]) == "a"
+
+    cache.put("p", eye[2], "c")
+
+    assert len(cache) == 2
+    assert cache.get("p", eye[1]) is None
+    assert cache.get("p", eye[0]) == "a"
+    assert cache.get("p", eye[2]) == "c"
+
+
+def test_semantic_cache_entries_expire_after_ttl():
+    cache = SemanticCache(threshold=0.99)
+    cache.put("p", [1.0, 0.0], "fresh", ttl=60)
+    cache.put("p", [0.0, 1.0], "stale", ttl=-1)
+
+    assert cache.get("p", [1.0, 0.0]) == "fresh"
+    assert cache.get("p", [0.0, 1.0]) is None
@@ -9,7 +9,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import asyncio
 import pytest
 from src.providers.llm_provider import MockLLMProvider
-from src.providers.vector_store import MockVectorStore
+from src.providers.vector_store import MockVectorStore, TieredVectorStore
 from src.pipelines.sql_generation import SQLGenerationPipeline
 from src.web.v1.services.chart import ChartService, ChartRequest
 from src.web.v1.services.schema import SchemaService
@@ -35,6 +35,22 @@ class TestPipelinesAndServices:
         assert "sql" in result
         assert result["confidence"] <= 1.0
 
+    @pytest.mark.asyncio
+    async def test_sql_generation_pipeline_stream(self):
+        pipeline = SQLGenerationPipeline(MockLLMProvider(), MockVectorStore())
+
+        chunks = [
+            chunk async for chunk in pipeline.generate_sql_stream(
+                query="Get users",
+                schema={"tables": {"users": {"columns": []}}},
+                project_id="test"
+            )
+        ]
+
+        assert all(c["type"] == "token" for c in chunks[:-1])
+        assert chunks[-1]["type"] == "result"
+        assert chunks[-1]["sql"].upper().startswith("SELECT")
+
     @pytest.mark.asyncio
     async def test_chart_service(self):
         llm = MockLLMProvider()
@@ -58,6 +74,127 @@ class TestPipelinesAndServices:
         )
         assert result["status"] in ["success", "error"]
 
+    @pytest.mark.asyncio
+    async def test_schema_indexing_builds_all_document_types(self):
+        store = MockVectorStore()
+        service = SchemaService(store)
+        result = await service.index_schema(
+            project_id="p1",
+            data_source_config={},
+            schema_data={
+                "tables": {"users": {"columns": [{"name": "id", "type": "integer"}]}, "orders": {}},
+                "relationships": [{"from_table": "orders", "to_table": "users"}]
+            }
+        )
+        assert result["status"] == "success"
+        assert (result["indexed_tables"], result["indexed_columns"], result["indexed_relationships"]) == (2, 1, 1)
+        assert await store.count_documents("schema_p1", {"type": "table_columns"}) == 1
+        summary = await service.get_schema_summary("p1")
+        assert (summary["tables_indexed"], summary["columns_indexed"], summary["relationships_indexed"]) == (2, 1, 1)
+
+    def test_sql_generation_explanation_lists_from_and_join_tables(self):
+        pipeline = SQLGenerationPipeline(MockLLMProvider(), MockVectorStore())
+
+        explanation = pipeline._generate_explanation(
+            "SELECT u.id FROM users u JOIN orders o ON u.id = o.user_id WHERE o.total > 5 LIMIT 10",
+            "Big orders"
+        )
+
+        assert explanation == (
+            "This query was generated to answer: 'Big orders'. It retrieves data from the users, orders table(s)"
+            " with specific filtering conditions with a limit on the number of rows returned."
+        )
+
+    def test_sql_generation_confidence_scores_whole_keywords_once(self):
+        pipeline = SQLGenerationPipeline(MockLLMProvider(), MockVectorStore())
+
+        assert pipeline._calculate_confidence("SELECT id FROM rate_limits", {}, "q") == 0.9
+        assert pipeline._calculate_confidence(
+            "select id from a where x = 1 and y in (select id from b where z) limit 5", {}, "users where active"
+        ) == 1.0
+        assert pipeline._calculate_confidence("", {}, "q") == 0.5
+        assert pipeline._calculate_confidence("SELECT count(id FROM users", {}, "q") == 0.7
+
+    @pytest.mark.asyncio
+    async def test_tiered_vector_store_caches_until_write(self):
+        remote = MockVectorStore()
+        remote.similarity_search = AsyncMock(wraps=remote.similarity_search)
+        store = TieredVectorStore(remote)
+
+        first = await store.similarity_search("users", collection_name="schema_p1", limit=2)
+        second = await store.similarity_search("users", collection_name="schema_p1", limit=2)
+        assert first == second
+        assert remote.similarity_search.await_count == 1
+
+        await store.add_documents("schema_p1", [{"content": "x"}])
+        await store.similarity_search("users", collection_name="schema_p1", limit=2)
+        assert remote.similarity_search.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_tiered_vector_store_does_not_cache_search_overlapping_write(self):
+        remote = MockVectorStore()
+        search_started, finish_search = asyncio.Event(), asyncio.Event()
+        original_search = remote.similarity_search
+
+        async def slow_search(*args, **kwargs):
+            results = await original_search(*args, **kwargs)  # pre-write results
+            search_started.set()
+            await finish_search.wait()
+            return results
+
+        remote.similarity_search = slow_search
+        store = TieredVectorStore(remote)
+
+        search = asyncio.create_task(store.similarity_search("users", collection_name="schema_p1", limit=2))
+        await search_started.wait()
+        await store.add_documents("schema_p1", [{"content": "x"}])
+        finish_search.set()
+        await search
+
+        assert not store._local
+
+    @pytest.mark.asyncio
+    async def test_tiered_vector_store_without_ttl_passes_through(self):
+        remote = MockVectorStore()
+        remote.similarity_search = AsyncMock(wraps=remote.similarity_search)
+        store = TieredVectorStore(remote, ttl=0)
+
+        await store.similarity_search("users", collection_name="schema_p1", limit=2)
+        await store.similarity_search("users", collection_name="schema_p1", limit=2)
+        assert remote.similarity_search.await_count == 2
+        assert not store._local
+
+    @pytest.mark.asyncio
+    async def test_tiered_vector_store_coalesces_concurrent_misses(self):
+        remote = MockVectorStore()
+        remote.similarity_search_batch = AsyncMock(wraps=remote.similarity_search_batch)
+        store = TieredVectorStore(remote, coalesce_wait_ms=5)
+
+        results = await asyncio.gather(
+            store.similarity_search("users", collection_name="schema_p1", limit=1),
+            store.similarity_search("orders", collection_name="schema_p1", limit=2),
+            store.similarity_search("users", collection_name="schema_p2", limit=2),
+        )
+
+        assert [len(r) for r in results] == [1, 2, 2]
+        assert remote.similarity_search_batch.await_count == 2
+
+    def test_flat_index_ranks_by_cosine_and_applies_filters(self):
+        from src.providers.vector_store import SearchQuery, _FlatIndex
+
+        index = _FlatIndex(
+            [{"id": 1, "t": "a"}, {"id": 2, "t": "b"}, {"id": 3, "t": "a"}],
+            [[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]],
+        )
+        by_x, filtered = index.search(
+            [[3.0, 0.0], [0.0, 1.0]],
+            [SearchQuery("x", limit=2), SearchQuery("y", limit=5, filters={"t": "a"})],
+        )
+
+        assert [r["id"] for r in by_x] == [1, 3]
+        assert by_x[0]["score"] == pytest.approx(1.0)
+        assert [r["id"] for r in filtered] == [3, 1]
+
     # Vector store behavior is covered implicitly via MockVectorStore in other tests
 
 if __name__ == "__main__":
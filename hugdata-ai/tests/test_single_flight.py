@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from src.cache.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"sql": "SELECT 1;"}
+
+    results = await asyncio.gather(*[flight.do("k", work) for _ in range(5)])
+
+    assert calls == 1
+    assert all(r == {"sql": "SELECT 1;"} for r in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_and_releases_key():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    async def ok():
+        return 1
+
+    assert await flight.do("k", ok) == 1
@@ -44,3 +44,97 @@ async def test_sql_correction_calls_collection_name_param():
     for bad in ["INSERT", "UPDATE", "DELETE", "DROP", "CREATE", "ALTER", "TRUNCATE"]:
         assert bad not in corrected.upper()
 
+
+
+def test_assess_query_complexity_counts_indicators_in_one_pass():
+    pipeline = SQLCorrectionPipeline(_FakeLLM(), _FakeVectorStore())
+
+    assert pipeline._assess_query_complexity("SELECT id FROM users") == "simple"
+    assert pipeline._assess_query_complexity("SELECT COUNT(*) FROM a JOIN b ON a.id = b.a_id") == "moderate"
+    assert pipeline._assess_query_complexity(
+        "SELECT SUM(x) OVER (PARTITION BY y) FROM a JOIN b ON 1=1 "
+        "WHERE a.id IN (SELECT id FROM c) UNION SELECT 1"
+    ) == "complex"
+
+
+def test_analyze_error_matches_substring_checks_per_category():
+    from src.pipelines.sql_correction import _ERROR_PATTERNS
+
+    pipeline = SQLCorrectionPipeline(_FakeLLM(), _FakeVectorStore())
+    messages = [needle for patterns in _ERROR_PATTERNS.values() for needle in patterns] + [
+        "ERROR: missing FROM-clause entry for table \"u\"",
+        "column \"x\" must appear in the GROUP BY clause or be used in an aggregate function",
+        "Unknown column 'foo' in 'on clause'; invalid type cast",
+        "nothing recognisable",
+    ]
+
+    for message in messages:
+        expected = [
+            error_type for error_type, patterns in _ERROR_PATTERNS.items()
+            if any(pattern in message.lower() for pattern in patterns)
+        ]
+        analysis = pipeline._analyze_error(SQLError(sql="SELECT 1", error=message))
+        assert analysis["detected_error_types"] == expected, message
+
+
+def test_validate_correction_flags_dangerous_keywords_as_whole_words():
+    pipeline = SQLCorrectionPipeline(_FakeLLM(), _FakeVectorStore())
+
+    safe = pipeline._validate_correction("SELECT 1", "SELECT updated_at FROM users LIMIT 10", {})
+    assert safe["passed"] is True
+
+    unsafe = pipeline._validate_correction("SELECT 1", "drop table t; Delete FROM u; DROP table v", {})
+    assert unsafe["passed"] is False
+    assert unsafe["issues"] == [
+        "Contains dangerous keyword: delete",
+        "Contains dangerous keyword: drop",
+    ]
+
+    with pytest.raises(ValueError, match="TRUNCATE"):
+        pipeline._clean_sql("truncate users")
+
+
+def test_format_schema_for_prompt_reuses_formatted_text():
+    from src.pipelines.sql_correction import _format_schema_cached
+
+    pipeline = SQLCorrectionPipeline(_FakeLLM(), _FakeVectorStore())
+    schema = {"tables": {
+        "users": {"columns": [{"name": "id", "type": "int", "nullable": False}, "email"]},
+        "orders": ["id", "user_id"],
+    }}
+
+    _format_schema_cached.cache_clear()
+    first = pipeline._format_schema_for_prompt(schema)
+    second = pipeline._format_schema_for_prompt({"tables": dict(schema["tables"])})
+
+    assert first == second == (
+        "Table: users\nColumns: id (int) NOT NULL, email\n\n"
+        "Table: orders\nColumns: id, user_id"
+    )
+    assert _format_schema_cached.cache_info().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_correct_sql_reuses_result_for_repeated_inputs():
+    class _CountingLLM(_FakeLLM):
+        calls = 0
+
+        async def generate(self, *args, **kwargs) -> str:
+            type(self).calls += 1
+            return await super().generate(*args, **kwargs)
+
+    llm = _CountingLLM()
+    pipeline = SQLCorrectionPipeline(llm, _FakeVectorStore())
+    sql_error = SQLError(sql="SELEC id FROM users", error="syntax error")
+    schema = {"tables": {"users": ["id"]}}
+
+    first = await pipeline.correct_sql(sql_error, schema=schema, project_id="p1")
+    first["corrections_applied"].append("mutated by caller")
+    second = await pipeline.correct_sql(sql_error, schema=schema, project_id="p1")
+    assert llm.calls == 1
+    assert "mutated by caller" not in second["corrections_applied"]
+    assert second["corrected_sql"] == first["corrected_sql"]
+
+    await pipeline.correct_sql(sql_error, schema={"tables": {"users": ["id", "email"]}}, project_id="p1")
+    await pipeline.correct_sql(sql_error, schema=schema, project_id="p2")
+    assert llm.calls == 3
@@ -0,0 +1,188 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.pipelines.indexing.sql_pairs import SqlPair, SqlPairsIndexingPipeline
+from src.providers.vector_store import MockVectorStore
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_chunks_and_keeps_order(length_embeddings, check_chunked_embedding):
+    pipeline = SqlPairsIndexingPipeline(
+        length_embeddings, MockVectorStore(), sql_pairs_path="missing.json", embed_chunk_size=2
+    )
+
+    await check_chunked_embedding(pipeline._generate_embeddings)
+
+    # Longest texts are batched first
+    assert length_embeddings.batches[0] == ["aaaaa", "aaaa"]
+
+
+def test_int8_embeddings_keep_cosine_direction(length_embeddings):
+    pipeline = SqlPairsIndexingPipeline(
+        length_embeddings, MockVectorStore(), sql_pairs_path="missing.json", embedding_dtype="int8"
+    )
+    embeddings = np.array([[0.5, -0.25, 0.1], [0.0, 0.0, 0.0]], dtype=np.float32)
+
+    codes = pipeline._quantize(embeddings)
+
+    assert codes.dtype == np.int8
+    assert codes[0].tolist() == [127, -64, 25]
+    assert not codes[1].any()
+    cosine = codes[0] @ embeddings[0] / (np.linalg.norm(codes[0]) * np.linalg.norm(embeddings[0]))
+    assert cosine > 0.9999
+
+
+@pytest.mark.asyncio
+async def test_store_documents_uploads_in_batches(length_embeddings):
+    store = MockVectorStore()
+    calls = []
+    original = store.add_documents
+
+    async def add_documents(collection_name, documents, create_if_missing=False):
+        calls.append(len(documents))
+        return await original(collection_name, documents, create_if_missing)
+
+    store.add_documents = add_documents
+    pipeline = SqlPairsIndexingPipeline(
+        length_embeddings, store, sql_pairs_path="missing.json", upload_batch_size=2
+    )
+
+    ids = [str(i) for i in range(5)]
+    await pipeline._store_documents("sql_pairs_p1", ids, ids, [{}] * 5, np.ones((5, 1), dtype=np.float32))
+
+    assert sorted(calls) == [1, 2, 2]
+    assert await store.count_documents("sql_pairs_p1") == 5
+
+
+def test_external_pairs_file_is_parsed_once_per_mtime(tmp_path, length_embeddings):
+    path = tmp_path / "sql_pairs.json"
+    path.write_text('{"sales": [{"id": "1", "question": "q", "sql": "SELECT 1"}]}')
+
+    first = SqlPairsIndexingPipeline(length_embeddings, MockVectorStore(), sql_pairs_path=str(path))
+    first.add_external_pairs({"extra": []})
+    second = SqlPairsIndexingPipeline(length_embeddings, MockVectorStore(), sql_pairs_path=str(path))
+
+    assert set(first.external_pairs) == {"sales", "extra"}
+    assert set(second.external_pairs) == {"sales"}
+    assert SqlPairsIndexingPipeline._pairs_file_cache[str(path)][1] is not second.external_pairs
+
+
+def test_extract_boilerplates_lowercases_and_rejects_invalid_json(length_embeddings):
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, MockVectorStore(), sql_pairs_path="missing.json")
+    mdl = '{"models": [{"properties": {"boilerplate": "Sales"}}, {"properties": {}}, {}]}'
+
+    assert pipeline._extract_boilerplates(mdl) == {"sales"}
+    assert pipeline._extract_boilerplates(mdl.encode()) == {"sales"}
+    with pytest.raises(ValueError):
+        pipeline._extract_boilerplates("{not json")
+
+
+@pytest.mark.asyncio
+async def test_index_sql_pairs_uses_prepared_and_per_call_pairs(length_embeddings):
+    store = MockVectorStore()
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, store, sql_pairs_path="missing.json")
+    pipeline.add_external_pairs({"sales": [{"question": "Total sales?", "sql": "SELECT SUM(amount) FROM sales"}]})
+    mdl = '{"models": [{"properties": {"boilerplate": "sales"}}, {"properties": {"boilerplate": "hr"}}]}'
+
+    first = await pipeline.index_sql_pairs(mdl, project_id="p1")
+    second = await pipeline.index_sql_pairs(
+        mdl,
+        project_id="p1",
+        external_pairs={"hr": [{"id": "hr-1", "question": "Headcount?", "sql": "SELECT 1"}]},
+        include_pairs=True
+    )
+
+    assert first["indexed_count"] == 1
+    assert "pairs" not in first and "boilerplates" not in first
+    assert second["indexed_count"] == 2
+    # Pairs without an id get one at preparation time, so it is stable across requests
+    second_ids = {pair["id"] for pair in json.loads(second["pairs"])}
+    assert "hr-1" in second_ids
+    assert pipeline._prepared["sales"][0].id in second_ids
+    assert await store.count_documents("sql_pairs_p1") == 2
+
+
+def test_documents_from_pairs_have_deterministic_ids(length_embeddings):
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, MockVectorStore(), sql_pairs_path="missing.json")
+    pair = SqlPair(id="1", sql="SELECT 1", question="One?", metadata={"boilerplate": "sales"})
+
+    first = pipeline._create_documents_from_pairs([pair], "p1")
+    again = pipeline._create_documents_from_pairs([pair], "p1")
+    other_project = pipeline._create_documents_from_pairs([pair], "p2")
+
+    assert first[0]["id"] == again[0]["id"] != other_project[0]["id"]
+    assert first[0]["metadata"] == {
+        "sql_pair_id": "1", "sql": "SELECT 1", "question": "One?", "type": "SQL_PAIR",
+        "project_id": "p1", "boilerplate": "sales"
+    }
+
+
+@pytest.mark.asyncio
+async def test_missing_collection_paths_skip_existence_checks(length_embeddings):
+    store = MockVectorStore()
+    store.collection_exists = None  # any pre-flight existence check would fail loudly
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, store, sql_pairs_path="missing.json")
+
+    stats = await pipeline.get_sql_pairs_stats("p1")
+    cleaned = await pipeline.clean_sql_pairs("p1", delete_all=True)
+    await pipeline._store_documents("sql_pairs_p1", ["1"], ["q"], [{}], np.ones((1, 1), dtype=np.float32))
+
+    assert stats["collection_exists"] is False
+    assert cleaned["message"] == "Collection does not exist"
+    assert (await pipeline.get_sql_pairs_stats("p1"))["total_pairs"] == 1
+
+
+@pytest.mark.asyncio
+async def test_clean_sql_pairs_deletes_ids_in_one_call(length_embeddings):
+    store = MockVectorStore()
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, store, sql_pairs_path="missing.json")
+    pairs = [SqlPair(id=str(i), sql="SELECT 1", question=f"q{i}") for i in range(4)]
+    await store.add_documents("sql_pairs_p1", pipeline._create_documents_from_pairs(pairs, "p1"))
+    calls = []
+    original = store.delete_documents
+
+    async def delete_documents(collection_name, filters):
+        calls.append(filters)
+        return await original(collection_name, filters)
+
+    store.delete_documents = delete_documents
+
+    result = await pipeline.clean_sql_pairs("p1", sql_pair_ids=["0", "2", "missing"])
+
+    assert result["deleted_count"] == 2
+    assert calls == [{"sql_pair_id": ["0", "2", "missing"], "project_id": "p1"}]
+    assert await store.count_documents("sql_pairs_p1") == 2
+
+
+@pytest.mark.asyncio
+async def test_reindex_embeds_only_changed_pairs_and_drops_removed_ones(length_embeddings):
+    store = MockVectorStore()
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, store, sql_pairs_path="missing.json")
+    mdl = '{"models": [{"properties": {"boilerplate": "sales"}}]}'
+    pairs = [{"id": str(i), "question": f"Question {i}?", "sql": f"SELECT {i}"} for i in range(3)]
+
+    await pipeline.index_sql_pairs(mdl, "p1", external_pairs={"sales": pairs})
+    length_embeddings.batches.clear()
+    pairs = [dict(pairs[0], sql="SELECT 0 -- fixed"), dict(pairs[1], question="Reworded?")]
+    result = await pipeline.index_sql_pairs(mdl, "p1", external_pairs={"sales": pairs})
+
+    assert (result["embedded_count"], result["unchanged_count"]) == (1, 1)
+    assert length_embeddings.batches == [["Reworded?"]]
+    stored = {doc["metadata"]["sql_pair_id"]: doc["metadata"] for doc in store.storage["sql_pairs_p1"]}
+    assert set(stored) == {"0", "1"}
+    assert stored["0"]["sql"] == "SELECT 0 -- fixed"
+
+
+@pytest.mark.asyncio
+async def test_reindexing_id_less_pairs_embeds_nothing_the_second_time(length_embeddings):
+    pipeline = SqlPairsIndexingPipeline(length_embeddings, MockVectorStore(), sql_pairs_path="missing.json")
+    mdl = '{"models": [{"properties": {"boilerplate": "sales"}}]}'
+    pairs = {"sales": [{"question": "Total sales?", "sql": "SELECT SUM(amount) FROM sales"}]}
+
+    first = await pipeline.index_sql_pairs(mdl, "p1", external_pairs=pairs)
+    second = await pipeline.index_sql_pairs(mdl, "p1", external_pairs=pairs)
+
+    assert first["embedded_count"] == 1
+    assert (second["embedded_count"], second["unchanged_count"]) == (0, 1)
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from typing import List
+
+from src.pipelines.indexing.table_description import TableDescriptionIndexingPipeline
+from src.providers.vector_store import MockVectorStore
+
+
+class _NoCache:
+    """Embedding cache that never hits, so provider calls reflect re-index work."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, vector):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_chunks_and_keeps_order(length_embeddings, check_chunked_embedding):
+    pipeline = TableDescriptionIndexingPipeline(length_embeddings, MockVectorStore(), embed_chunk_size=2)
+
+    await check_chunked_embedding(
+        lambda texts: pipeline._generate_embeddings([{"content": text, "metadata": {}} for text in texts])
+    )
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_bounds_concurrent_requests():
+    in_flight = peak = 0
+
+    class _SlowEmbeddings:
+        async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return [[1.0] for _ in texts]
+
+    pipeline = TableDescriptionIndexingPipeline(
+        _SlowEmbeddings(), MockVectorStore(), embed_chunk_size=1, embedding_cache=_NoCache(), max_concurrency=2
+    )
+
+    embedded = await pipeline._generate_embeddings([{"content": str(i)} for i in range(6)])
+
+    assert embedded.shape == (6, 1)
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_reuses_cached_content(length_embeddings):
+    pipeline = TableDescriptionIndexingPipeline(length_embeddings, MockVectorStore())
+
+    await pipeline._generate_embeddings([{"content": "orders"}, {"content": "users"}])
+    embedded = await pipeline._generate_embeddings([{"content": "users"}, {"content": "items!"}])
+
+    assert embedded.tolist() == [[5.0], [6.0]]
+    assert length_embeddings.batches == [["orders", "users"], ["items!"]]
+    assert pipeline.embedding_cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_reindex_embeds_only_changed_tables_and_drops_removed(length_embeddings):
+    store = MockVectorStore()
+    pipeline = TableDescriptionIndexingPipeline(length_embeddings, store, embedding_cache=_NoCache())
+    mdl = '{"models": [{"name": "orders"}, {"name": "users"}]}'
+
+    await pipeline.index_table_descriptions(mdl, project_id="p1")
+    result = await pipeline.index_table_descriptions(
+        '{"models": [{"name": "orders", "properties": {"description": "Sales orders"}}]}', project_id="p1"
+    )
+
+    assert result["embedded_count"] == 1
+    assert result["unchanged_count"] == 0
+    assert length_embeddings.batches[-1] == ["Table: orders\nType: MODEL\nDescription: Sales orders"]
+    assert await store.count_documents("table_descriptions_p1") == 1
+
+
+def test_extract_table_descriptions_covers_all_resource_kinds(length_embeddings):
+    pipeline = TableDescriptionIndexingPipeline(length_embeddings, MockVectorStore())
+    mdl = {
+        "models": [{"name": "orders", "columns": [{"name": "id"}, "total", {"type": "int"}, 3]}, {"columns": []}],
+        "metrics": [{"name": "revenue", "properties": {"description": "Sum of totals"}}],
+        "views": [{"name": "recent_orders"}],
+    }
+
+    descriptions = pipeline._extract_table_descriptions(mdl)
+
+    assert [(d.name, d.mdl_type, d.columns) for d in descriptions] == [
+        ("orders", "MODEL", "id, total"),
+        ("revenue", "METRIC", ""),
+        ("recent_orders", "VIEW", ""),
+    ]
+    assert descriptions[1].description == "Sum of totals"